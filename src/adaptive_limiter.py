@@ -0,0 +1,114 @@
+import asyncio
+import statistics
+import time
+from collections import deque
+
+# Адаптивный ограничитель числа одновременных запросов к LLM (AIMD).
+# Пока задержка близка к базовой и ошибок нет, лимит растёт примерно на 1
+# за каждые "limit" успешных ответов. При росте задержки (сервер начал копить очередь)
+# лимит плавно уменьшается, при ошибке — делится пополам.
+#
+# Базовая задержка — медиана последних BASELINE_WINDOW ответов, отправленных без нагрузки
+# (в работе было не больше initial_limit запросов), отдельно для каждого вида запроса:
+# пакет из нескольких ответов сравнивается с пакетами, а не с одиночными запросами.
+# Медиана не даёт одному случайно быстрому ответу задать планку для всех следующих.
+# Ответы под нагрузкой в базовую задержку не попадают, иначе она росла бы вместе с очередью
+# сервера; когда из-за очереди лимит снижается, новые ответы без нагрузки обновляют её.
+
+BASELINE_WINDOW = 20
+
+
+class AdaptiveLimiter:
+
+    def __init__(self, initial_limit=2, min_limit=1, max_limit=10,
+                 latency_tolerance=2.0, backoff_factor=0.9, error_backoff_factor=0.5,
+                 baseline_window=BASELINE_WINDOW):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.backoff_factor = backoff_factor
+        self.error_backoff_factor = error_backoff_factor
+        self.baseline_window = baseline_window
+        # Не больше стольких запросов в работе — ответ считается полученным без нагрузки
+        self.unloaded = max(int(self.limit), min_limit)
+
+        self.in_flight = 0
+        self.peak_limit = self.limit
+        self.min_latency = None
+        # Вид запроса -> задержки последних ответов без нагрузки
+        self._unloaded_latencies = {}
+        self.completed = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self._last_decrease = 0.0
+        self._condition = None
+
+    def _get_condition(self):
+        # Condition создаётся лениво, чтобы привязаться к текущему циклу событий
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        """Ждёт свободного места. Возвращает (время начала, число запросов в работе вместе с этим)."""
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            return time.monotonic(), self.in_flight
+
+    async def release(self, started_at, ok=True, kind=None, load=None):
+        latency = time.monotonic() - started_at
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            self._update(latency, ok, kind, load)
+            condition.notify_all()
+        return latency
+
+    def baseline(self, kind=None):
+        recent = self._unloaded_latencies.get(kind)
+        return statistics.median(recent) if recent else None
+
+    def _update(self, latency, ok, kind=None, load=None):
+        now = time.monotonic()
+        if not ok:
+            self.errors += 1
+            self._decrease(self.error_backoff_factor, now, self.baseline(kind))
+            return
+
+        self.completed += 1
+        self.total_latency += latency
+        if self.min_latency is None or latency < self.min_latency:
+            self.min_latency = latency
+        if load is None or load <= self.unloaded:
+            self._unloaded_latencies.setdefault(kind, deque(maxlen=self.baseline_window)).append(latency)
+        baseline = self.baseline(kind)
+        if baseline is None:
+            # Этот вид запросов ещё ни разу не выполнялся без нагрузки: сравнивать не с чем
+            return
+
+        if latency <= baseline * self.latency_tolerance:
+            self.limit = min(self.limit + 1.0 / self.limit, self.max_limit)
+            self.peak_limit = max(self.peak_limit, self.limit)
+        else:
+            self._decrease(self.backoff_factor, now, baseline)
+
+    def _decrease(self, factor, now, window):
+        # Не уменьшаем лимит чаще одного раза за характерное время ответа,
+        # иначе одна "медленная волна" обрушит его до минимума
+        if now - self._last_decrease < (window or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.limit * factor, self.min_limit)
+
+    def stats(self):
+        return {
+            "final_limit": int(self.limit),
+            "peak_limit": int(self.peak_limit),
+            "completed": self.completed,
+            "errors": self.errors,
+            "avg_latency": self.total_latency / self.completed if self.completed else 0.0,
+            "min_latency": self.min_latency or 0.0,
+        }
@@ -0,0 +1,119 @@
+import zlib
+import numpy as np
+from grading_cache import normalize_answer
+
+# Кластеризация почти одинаковых ответов (MinHash + LSH по символьным шинглам).
+# Из каждого кластера в LLM уходит один представитель, его оценка переносится на остальных.
+# Ответ попадает в кластер, только если похож на самого представителя (без цепочек через
+# других участников) и совпадает с ним по отрицаниям и числам: «выступает» и «не выступает»
+# почти одинаковы по шинглам, но оценку одного переносить на другой нельзя.
+
+SHINGLE_SIZE = 3
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+_rng = np.random.RandomState(20250526)
+_PERM_A = _rng.randint(1, MAX_HASH, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.randint(0, MAX_HASH, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+NEGATION_WORDS = {"не", "ни", "нет", "без", "нельзя", "никогда", "нигде", "ничто", "ничего", "никто", "никак"}
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    text = normalize_answer(text)
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash_signatures(shingle_sets):
+    signatures = np.full((len(shingle_sets), NUM_PERMUTATIONS), MAX_HASH, dtype=np.uint64)
+    for row, shingle_set in enumerate(shingle_sets):
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64, count=len(shingle_set)
+        )
+        # Все перестановки сразу: матрица (число шинглов × NUM_PERMUTATIONS)
+        permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % MERSENNE_PRIME & MAX_HASH
+        signatures[row] = permuted.min(axis=0)
+    return signatures
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def meaning_tokens(text):
+    """Отрицания и числа ответа: ответы в одном кластере должны совпадать по ним полностью."""
+    tokens = normalize_answer(text).split()
+    return (
+        tuple(sorted(token for token in tokens if token in NEGATION_WORDS)),
+        tuple(sorted(token for token in tokens if any(ch.isdigit() for ch in token))),
+    )
+
+
+def cluster_answers(answers, threshold=0.9):
+    """Возвращает список кластеров — списков индексов в answers; первый индекс — представитель."""
+    # Сначала схлопываем полностью одинаковые после нормализации ответы
+    unique = {}
+    for i, answer in enumerate(answers):
+        unique.setdefault(normalize_answer(answer), []).append(i)
+    keys = list(unique)
+    shingle_sets = [shingles(key) for key in keys]
+    meanings = [meaning_tokens(key) for key in keys]
+
+    # Кандидаты в похожие — ответы, совпавшие с данным хотя бы в одной полосе LSH
+    neighbours = [set() for _ in keys]
+    if len(keys) > 1:
+        signatures = minhash_signatures(shingle_sets)
+        rows_per_band = NUM_PERMUTATIONS // LSH_BANDS
+        for band in range(LSH_BANDS):
+            buckets = {}
+            band_slice = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+            for i, band_signature in enumerate(map(bytes, band_slice)):
+                buckets.setdefault(band_signature, []).append(i)
+            for candidates in buckets.values():
+                if len(candidates) > 1:
+                    for i in candidates:
+                        neighbours[i].update(candidates)
+
+    # Ответы просматриваются по порядку: каждый присоединяется к самому похожему из уже
+    # выбранных представителей или сам становится представителем нового кластера
+    clusters = {}
+    for i in range(len(keys)):
+        best_similarity, best_representative = threshold, None
+        for representative in sorted(neighbours[i]):
+            if representative not in clusters or meanings[representative] != meanings[i]:
+                continue
+            similarity = jaccard(shingle_sets[representative], shingle_sets[i])
+            if similarity > best_similarity or (best_representative is None and similarity == threshold):
+                best_similarity, best_representative = similarity, representative
+        if best_representative is None:
+            clusters[i] = list(unique[keys[i]])
+        else:
+            clusters[best_representative].extend(unique[keys[i]])
+    return [sorted(members) for members in clusters.values()]
+
+
+def cluster_tasks(tasks, threshold=0.9):
+    """Группирует задачи одного прогона по вопросам и кластерам ответов.
+
+    Возвращает представителей; у каждого в task["cluster_members"] лежат остальные задачи кластера.
+    """
+    by_question = {}
+    for task in tasks:
+        by_question.setdefault(task["question_id"], []).append(task)
+
+    representatives = []
+    for question_id, question_tasks in by_question.items():
+        clusters = cluster_answers([task["answer"] for task in question_tasks], threshold)
+        for number, members in enumerate(clusters, 1):
+            representative = question_tasks[members[0]]
+            representative["cluster_members"] = [question_tasks[i] for i in members[1:]]
+            if representative["cluster_members"]:
+                cluster_id = f"{question_id}-{number}"
+                for task in [representative] + representative["cluster_members"]:
+                    task["cluster"] = cluster_id
+            representatives.append(representative)
+    return representatives
@@ -0,0 +1,156 @@
+import codecs
+import csv
+import io
+import os
+import numpy as np
+import pandas as pd
+
+# Чтение CSV-выгрузок wj.qq. Схема (кодировка, разделитель, колонка ID, первая колонка
+# с вопросами) определяется один раз по началу файла; затем читаются только нужные
+# колонки парсером pyarrow (без него — C-парсером pandas) и сразу сворачиваются в длинную
+# таблицу (student_pos, student_id, question_num, answer). Большие файлы читаются
+# частями, чтобы в памяти не держать всю широкую таблицу.
+
+ID_IDENTIFIER = "Укажите Ваш ID"
+FIRST_QUESTION_PATTERN = r"^\s*1\s*[.．、]|Как называется"
+# Выгрузки wj.qq бывают в UTF-8 (с BOM и без), UTF-16 и ANSI-кодировке Windows
+ENCODINGS = ("utf-8-sig", "utf-16", "cp1251", "gb18030")
+DELIMITERS = (",", ";", "\t")
+HEAD_BYTES = 64 * 1024
+CHUNK_ROWS = 5000
+CHUNKED_FROM_BYTES = 32 * 1024 * 1024
+LONG_COLUMNS = ["student_pos", "student_id", "question_num", "answer"]
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+
+def _open(source):
+    return io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else open(source, "rb")
+
+
+def _source_size(source):
+    return len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source)
+
+
+def _decode_head(head, encoding):
+    if encoding == "utf-16" and not head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return None
+    try:
+        # Неполный символ в конце прочитанного куска не считается ошибкой
+        return codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+    except UnicodeDecodeError:
+        return None
+
+
+def detect_schema(source):
+    """Определяет схему выгрузки по первым HEAD_BYTES байтам. source — bytes или путь к файлу."""
+    with _open(source) as f:
+        head = f.read(HEAD_BYTES)
+
+    text, encoding = None, None
+    for candidate in ENCODINGS:
+        decoded = _decode_head(head, candidate)
+        if decoded is not None and ID_IDENTIFIER in decoded:
+            text, encoding = decoded, candidate
+            break
+    if text is None:
+        raise ValueError("Не найдена колонка с ID студентов!")
+
+    first_line = text.split("\n", 1)[0]
+    delimiter = max(DELIMITERS, key=first_line.count)
+    columns = next(csv.reader(io.StringIO(text), delimiter=delimiter))
+
+    header = pd.Index([str(col) for col in columns])
+    id_positions = np.flatnonzero(header.str.contains(ID_IDENTIFIER, regex=False))
+    if not len(id_positions):
+        raise ValueError("Не найдена колонка с ID студентов!")
+    question_positions = np.flatnonzero(header.str.contains(FIRST_QUESTION_PATTERN, regex=True))
+    if not len(question_positions):
+        raise ValueError("Не удалось найти начало вопросов в CSV!")
+
+    return {
+        "encoding": encoding,
+        "delimiter": delimiter,
+        "columns": columns,
+        "id_index": int(id_positions[0]),
+        "question_start": int(question_positions[0]),
+    }
+
+
+def _to_long(wide_df, first_pos):
+    """Широкий кусок (ID + колонки вопросов) -> длинная таблица, без обхода строк в Python."""
+    students, width = len(wide_df), wide_df.shape[1] - 1
+    values = wide_df.apply(lambda column: column.str.strip()).to_numpy(dtype=object)
+    return pd.DataFrame({
+        "student_pos": np.repeat(np.arange(first_pos, first_pos + students, dtype=np.int32), width),
+        "student_id": np.repeat(values[:, 0], width),
+        "question_num": np.tile(np.arange(1, width + 1, dtype=np.int16), students),
+        "answer": values[:, 1:].ravel(),
+    })
+
+
+def _question_positions(schema, num_questions):
+    start = schema["question_start"]
+    stop = len(schema["columns"]) if num_questions is None else min(start + num_questions, len(schema["columns"]))
+    return list(range(start, stop))
+
+
+def iter_answers(source, schema, num_questions=None, chunksize=CHUNK_ROWS):
+    """Длинная таблица ответов частями по chunksize студентов (C-парсер, ограниченная память)."""
+    positions = [schema["id_index"]] + _question_positions(schema, num_questions)
+    first_pos = 0
+    with _open(source) as f:
+        reader = pd.read_csv(
+            f, sep=schema["delimiter"], encoding=schema["encoding"], usecols=positions, dtype=str,
+            keep_default_na=False, chunksize=chunksize, engine="c"
+        )
+        for chunk in reader:
+            # usecols не меняет порядок колонок файла, возвращаем ID на первое место
+            chunk = chunk.iloc[:, [sorted(positions).index(p) for p in positions]]
+            yield _to_long(chunk, first_pos)
+            first_pos += len(chunk)
+
+
+def read_answers(source, num_questions=None, schema=None, chunksize=None):
+    """Все ответы выгрузки в длинном формате. num_questions ограничивает число колонок вопросов.
+
+    Файлы больше CHUNKED_FROM_BYTES (или при заданном chunksize) читаются частями.
+    """
+    schema = schema or detect_schema(source)
+    if chunksize or _source_size(source) > CHUNKED_FROM_BYTES:
+        parts = list(iter_answers(source, schema, num_questions, chunksize or CHUNK_ROWS))
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=LONG_COLUMNS)
+
+    positions = [schema["id_index"]] + _question_positions(schema, num_questions)
+    names = [schema["columns"][p] for p in positions]
+    if pa is not None and len(set(schema["columns"])) == len(schema["columns"]):
+        wide_df = _read_wide_pyarrow(source, schema, names)
+    else:
+        # Без pyarrow или при повторяющихся заголовках — C-парсер pandas по позициям колонок
+        with _open(source) as f:
+            wide_df = pd.read_csv(
+                f, sep=schema["delimiter"], encoding=schema["encoding"], usecols=positions, dtype=str,
+                keep_default_na=False, engine="c"
+            )
+        wide_df = wide_df.iloc[:, [sorted(positions).index(p) for p in positions]]
+    return _to_long(wide_df, 0)
+
+
+def _read_wide_pyarrow(source, schema, names):
+    # pyarrow.csv напрямую: через pandas нельзя включить newlines_in_values,
+    # а ответы студентов бывают многострочными
+    with _open(source) as f:
+        table = pa_csv.read_csv(
+            f,
+            read_options=pa_csv.ReadOptions(encoding=schema["encoding"]),
+            parse_options=pa_csv.ParseOptions(delimiter=schema["delimiter"], newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=names, column_types={name: pa.string() for name in names},
+                strings_can_be_null=False
+            ),
+        )
+    return table.to_pandas()
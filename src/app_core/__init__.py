@@ -0,0 +1,3 @@
+# Общее ядро страниц Streamlit (app_pages): ресурсы процесса, кэшируемые данные разделов
+# и замер времени запусков скрипта. Модули пакета не импортируют тяжёлые зависимости
+# на верхнем уровне — их загружает только страница, которой они нужны.
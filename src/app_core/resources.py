@@ -0,0 +1,65 @@
+import os
+import threading
+import uuid
+from datetime import datetime
+import streamlit as st
+
+# Ресурсы, общие для всех сессий процесса Streamlit, и данные разделов, которые не нужно
+# пересчитывать при каждом действии пользователя. Модули проверки (ollama, numpy, пул
+# заданий) импортируются внутри функций, чтобы их не загружали страницы, где они не нужны.
+
+
+@st.cache_resource
+def warm_up_model():
+    # Один раз на процесс: модель начинает загружаться, пока пользователь готовит файл.
+    # Клиент Ollama импортируется в том же фоновом потоке и не задерживает первую страницу
+    def warm_up():
+        from grading_pipeline import LLM_MODEL
+        from model_manager import get_model_manager
+        get_model_manager().warm_up(LLM_MODEL)
+
+    thread = threading.Thread(target=warm_up, name="model-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+@st.cache_resource
+def get_job_runner():
+    # Один обработчик заданий и один планировщик запросов к LLM на весь процесс Streamlit,
+    # общие для всех сессий
+    from grading_cache import GradingCache
+    from grading_jobs import JobRunner
+    return JobRunner(cache=GradingCache())
+
+
+def session_owner():
+    # Задания одной вкладки браузера — один владелец: между владельцами LLM делится поровну
+    if "session_owner" not in st.session_state:
+        st.session_state.session_owner = uuid.uuid4().hex[:8]
+    return st.session_state.session_owner
+
+
+@st.cache_data(show_spinner=False)
+def _journal_files(journal_dir, modified_at):
+    return [f for f in os.listdir(journal_dir) if f.endswith(".xlsx")]
+
+
+def list_journal_files(journal_dir):
+    """Шаблоны журналов в папке; список перечитывается, только когда в папке что-то изменилось."""
+    return _journal_files(journal_dir, os.stat(journal_dir).st_mtime_ns)
+
+
+@st.cache_data(show_spinner=False)
+def _run_labels(path, version):
+    from results_store import get_results_store
+    return {
+        run.run_id: f"{run.discipline} — {run.lecture_id} — "
+                    f"{datetime.fromtimestamp(run.created_at).strftime('%d.%m.%Y %H:%M')} "
+                    f"({run.students} студ.)"
+        for run in get_results_store(path).list_runs().itertuples(index=False)
+    }
+
+
+def run_labels(results_store):
+    """Подписи прогонов (новые первыми) для выбора в интерфейсе; кэш сбрасывается при сохранении прогона."""
+    return _run_labels(results_store.path, results_store.version())
@@ -0,0 +1,62 @@
+import statistics
+import threading
+from collections import deque
+import streamlit as st
+
+# Время выполнения скрипта Streamlit по страницам. Первый запуск страницы в процессе
+# включает импорт её модулей, первый запуск скрипта после старта сервера — холодный старт;
+# остальные запуски — повторы при каждом действии пользователя. Отчёт показывается
+# в боковой панели, чтобы было видно, во что обходится каждая страница.
+
+HISTORY_SIZE = 200
+
+
+class ScriptTimings:
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self.cold_start = None
+        self.first_runs = {}
+        self.reruns = {}
+
+    def record(self, page, seconds):
+        with self._lock:
+            if self.cold_start is None:
+                self.cold_start = (page, seconds)
+            if page not in self.first_runs:
+                self.first_runs[page] = seconds
+            else:
+                self.reruns.setdefault(page, deque(maxlen=self.history_size)).append(seconds)
+
+    def rows(self):
+        with self._lock:
+            rows = []
+            for page, first_run in self.first_runs.items():
+                reruns = sorted(self.reruns.get(page, []))
+                rows.append({
+                    "Страница": page,
+                    "Первый запуск, с": first_run,
+                    "Повторных запусков": len(reruns),
+                    "Медиана повтора, с": statistics.median(reruns) if reruns else None,
+                    "95% повторов быстрее, с": reruns[int(0.95 * (len(reruns) - 1))] if reruns else None,
+                    "Последний повтор, с": self.reruns[page][-1] if reruns else None,
+                })
+            return rows
+
+
+@st.cache_resource
+def get_script_timings():
+    return ScriptTimings()
+
+
+def show_timings():
+    """Отчёт о времени запусков в боковой панели (по данным до текущего запуска)."""
+    timings = get_script_timings()
+    with st.sidebar.expander("Время работы интерфейса"):
+        if timings.cold_start is None:
+            st.caption("Замеров пока нет.")
+            return
+        page, seconds = timings.cold_start
+        st.caption(f"Холодный старт: {seconds:.2f} с (страница «{page}»).")
+        st.dataframe(timings.rows(), hide_index=True, use_container_width=True)
@@ -0,0 +1,53 @@
+import time
+from datetime import datetime
+import pandas as pd
+import streamlit as st
+from document_generation import generate_documents, STATUS_CREATED
+
+# Раздел 4: генерация пустых ведомостей и журналов по базе дисциплин.
+
+st.title("Формирование ведомостей и журналов")
+st.caption("Шаблоны берутся из data/ethalons_statements (V_EXAMPLE_*) и data/ethalons_journals (J_EXAMPLE_*).")
+
+database_file = st.file_uploader(
+    "Загрузите базу дисциплин (.xlsx) с колонками Направление, Название дисциплины, Преподаватель, Курс, Часы",
+    type=["xlsx"]
+)
+
+if database_file:
+    try:
+        database_df = pd.read_excel(database_file)
+    except Exception as e:
+        st.error(f"Ошибка при чтении файла базы данных: {e}")
+        st.stop()
+
+    st.caption(f"Строк в базе: {len(database_df)}")
+    st.dataframe(database_df, use_container_width=True)
+
+    if st.button("Сформировать документы"):
+        progress_bar = st.progress(0.0)
+        started = time.monotonic()
+
+        def on_generation_progress(done, total):
+            progress_bar.progress(done / total, text=f"Обработано строк: {done} из {total}")
+
+        output, generation_log = generate_documents(database_df, on_progress=on_generation_progress)
+        st.session_state.generated_documents = (
+            output.getvalue(), generation_log, time.monotonic() - started
+        )
+
+    if "generated_documents" in st.session_state:
+        documents_zip, generation_log, elapsed = st.session_state.generated_documents
+        created = int((generation_log["Статус"] == STATUS_CREATED).sum())
+        st.success(f"Создано комплектов документов: {created} из {len(generation_log)} за {elapsed:.1f} с.")
+        problems = generation_log[generation_log["Статус"] != STATUS_CREATED]
+        if not problems.empty:
+            st.warning(f"⚠️ Строк с замечаниями: {len(problems)}")
+            st.dataframe(problems, use_container_width=True)
+        st.download_button(
+            label="Скачать ведомости и журналы (ZIP)",
+            data=documents_zip,
+            file_name=f"ведомости_и_журналы_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+            mime="application/zip",
+            on_click="ignore"
+        )
@@ -0,0 +1,347 @@
+import json
+import time
+from datetime import datetime
+import pandas as pd
+import streamlit as st
+from app_core.resources import get_job_runner, session_owner
+from question_store import get_question_store
+from run_journal import RunJournal, make_run_id
+from grading_settings import get_settings, save_discipline_settings
+from grading_pipeline import LLM_MODEL, MAX_WORKERS, BATCH_SIZE, CASCADE_SIGNALS, SIGNAL_LOGPROBS
+from answers_csv import detect_schema
+from grading_service import journal_totals
+from results_store import get_results_store
+from grading_jobs import ACTIVE_STATUSES, STATUS_DONE, STATUS_FAILED
+from grading_telemetry import get_telemetry_registry, OUTCOME_PARSE_ERROR, OUTCOME_ERROR
+from prescoring import TIER_UNPARSED, TIER_FAILED
+
+# Раздел 2: постановка CSV с ответами в очередь проверки и список заданий всех сессий.
+
+# Как часто обновляется список заданий, пока какое-нибудь из них в очереди или выполняется, с
+JOBS_REFRESH_SECONDS = 2
+
+st.title("Проверка ответов студентов")
+
+uploaded_file = st.file_uploader(
+    "Перетащите CSV-файл с ответами студентов из сервиса wj.qq",
+    type=["csv"]
+)
+
+if uploaded_file:
+    try:
+        question_store = get_question_store()
+        disciplines = question_store.disciplines()
+        selected_discipline = st.selectbox("Выберите дисциплину", disciplines)
+
+        if selected_discipline:
+            lecture_ids = question_store.lectures(selected_discipline)
+            selected_lecture = st.selectbox("Выберите лекцию", lecture_ids)
+            max_workers = st.number_input(
+                "Максимум одновременных запросов к LLM", min_value=1, max_value=64, value=MAX_WORKERS
+            )
+            batch_size = st.number_input(
+                "Ответов в одном запросе к LLM (1 — пакетный режим выключен)",
+                min_value=1, max_value=50, value=BATCH_SIZE
+            )
+
+            with st.expander("Настройки проверки для дисциплины"):
+                discipline_settings = get_settings(selected_discipline)
+                discipline_settings["fast_scoring"] = st.checkbox(
+                    "Быстрая оценка LLM: модель возвращает только балл (JSON), генерация обрывается на оценке",
+                    value=discipline_settings["fast_scoring"]
+                )
+                discipline_settings["cascade_enabled"] = st.checkbox(
+                    f"Каскад моделей: сначала оценивает малая модель, {LLM_MODEL} — только неуверенные ответы",
+                    value=discipline_settings["cascade_enabled"]
+                )
+                discipline_settings["cascade_model"] = st.text_input(
+                    "Малая модель Ollama для каскада", value=discipline_settings["cascade_model"]
+                )
+                discipline_settings["cascade_signal"] = st.selectbox(
+                    "Уверенность малой модели", CASCADE_SIGNALS,
+                    index=CASCADE_SIGNALS.index(discipline_settings["cascade_signal"]),
+                    format_func=lambda signal: (
+                        "вероятность токена оценки (logprobs)" if signal == SIGNAL_LOGPROBS
+                        else "совпадение двух сэмплов"
+                    )
+                )
+                discipline_settings["cascade_threshold"] = st.slider(
+                    "Порог вероятности оценки (для logprobs): ниже — ответ передаётся основной модели",
+                    min_value=0.34, max_value=1.0, step=0.01,
+                    value=float(discipline_settings["cascade_threshold"])
+                )
+                discipline_settings["exact_match"] = st.checkbox(
+                    "Засчитывать совпадение с эталоном без LLM", value=discipline_settings["exact_match"]
+                )
+                discipline_settings["embedding_enabled"] = st.checkbox(
+                    "Оценивать очевидные ответы по близости эмбеддингов",
+                    value=discipline_settings["embedding_enabled"],
+                    help="Границы полосы неуверенности нужно подобрать для дисциплины по ответам, "
+                         "уже оценённым LLM или преподавателем."
+                )
+                discipline_settings["embedding_model"] = st.text_input(
+                    "Модель эмбеддингов Ollama", value=discipline_settings["embedding_model"]
+                )
+                reject_similarity, accept_similarity = st.slider(
+                    "Полоса неуверенности: ниже — 0 баллов, выше — 2 балла, внутри — проверка LLM",
+                    min_value=0.0, max_value=1.0, step=0.01,
+                    value=(float(discipline_settings["reject_similarity"]),
+                           float(discipline_settings["accept_similarity"]))
+                )
+                discipline_settings["reject_similarity"] = reject_similarity
+                discipline_settings["accept_similarity"] = accept_similarity
+                discipline_settings["clustering_enabled"] = st.checkbox(
+                    "Объединять почти одинаковые ответы и оценивать один раз",
+                    value=discipline_settings["clustering_enabled"]
+                )
+                discipline_settings["cluster_similarity"] = st.slider(
+                    "Минимальное сходство ответов в кластере (коэффициент Жаккара)",
+                    min_value=0.5, max_value=1.0, step=0.01,
+                    value=float(discipline_settings["cluster_similarity"])
+                )
+                if st.button("Сохранить настройки для дисциплины"):
+                    save_discipline_settings(selected_discipline, discipline_settings)
+                    st.success("Настройки сохранены.")
+
+            default_run_id = make_run_id(selected_discipline, selected_lecture, uploaded_file.getvalue())
+            run_id = st.text_input(
+                "ID прогона (прерванная проверка с тем же ID продолжится с места остановки)",
+                value=default_run_id
+            )
+            saved_journal = RunJournal(run_id)
+            if saved_journal.records:
+                run_state = "завершён" if saved_journal.finished else "не завершён"
+                st.info(
+                    f"Прогон {run_id} ({run_state}): сохранено {len(saved_journal.records)} оценок, "
+                    f"они не будут отправляться в LLM повторно."
+                )
+            restart_run = st.checkbox("Начать проверку заново, не используя сохранённые оценки")
+
+            if selected_lecture and st.button("Поставить проверку в очередь"):
+                try:
+                    detect_schema(uploaded_file.getvalue())
+                except ValueError as e:
+                    st.error(str(e))
+                    st.stop()
+
+                try:
+                    job_id = get_job_runner().submit(
+                        uploaded_file.getvalue(), selected_discipline, selected_lecture, run_id,
+                        restart=restart_run, owner=session_owner(), model=LLM_MODEL, max_workers=int(max_workers),
+                        batch_size=int(batch_size), settings=discipline_settings
+                    )
+                except ValueError as e:
+                    st.error(str(e))
+                    st.stop()
+                st.success(
+                    f"Задание {job_id} поставлено в очередь. Страницу можно закрыть или перейти "
+                    f"в другой раздел — результаты появятся в списке заданий."
+                )
+
+    except Exception as e:
+        st.error(f"Ошибка при загрузке файла: {e}")
+
+def show_grade_stats(grade_stats):
+    if grade_stats.get("restored"):
+        st.info(f"Из журнала прогона восстановлено {grade_stats['restored']} оценок.")
+    tiers_summary = ", ".join(f"{tier} — {count}" for tier, count in grade_stats["tiers"].items())
+    st.info(f"Ответов оценено: {tiers_summary}. Запросов к LLM: {grade_stats['llm_calls']}.")
+    unparsed = grade_stats["tiers"].get(TIER_UNPARSED, 0)
+    if unparsed:
+        st.warning(
+            f"Ответов, из которых не удалось извлечь оценку модели: {unparsed}. Они оценены в 0 баллов "
+            f"и отмечены в журнале способом оценки «{TIER_UNPARSED}» — их стоит проверить вручную."
+        )
+    failed = grade_stats["tiers"].get(TIER_FAILED, 0)
+    if failed:
+        st.warning(
+            f"Ответов без оценки из-за ошибок запросов к LLM: {failed}. Они не вошли в сумму баллов "
+            f"и отмечены в журнале колонкой «Требует перепроверки» — их можно проверить повторно отдельно."
+        )
+    retries = grade_stats.get("retries")
+    if retries and retries["retries"]:
+        retries_text = f"Повторных запросов после временных ошибок: {retries['retries']} из {retries['budget']}."
+        if retries["budget_exhausted"]:
+            retries_text += f" Бюджет повторов исчерпан, не повторено: {retries['budget_exhausted']}."
+        st.caption(retries_text)
+    cascade = grade_stats.get("cascade")
+    if cascade and cascade["checked"]:
+        cascade_text = (
+            f"Каскад: модель {cascade['model']} уверенно оценила {cascade['accepted']} из {cascade['checked']} "
+            f"ответов ({cascade['accepted'] / cascade['checked']:.0%}), основной модели передано "
+            f"{cascade['escalated']}."
+        )
+        if cascade["compared"]:
+            cascade_text += (
+                f" На переданных ответах оценки малой и основной модели совпали в "
+                f"{cascade['agreed'] / cascade['compared']:.0%} случаев ({cascade['agreed']} из {cascade['compared']})."
+            )
+        st.caption(cascade_text)
+        if cascade["errors"]:
+            st.warning(
+                f"Малая модель не ответила на {cascade['errors']} запросов, эти ответы оценила основная модель: "
+                f"{cascade.get('error', '')}"
+            )
+        elif cascade["no_confidence"]:
+            st.warning(
+                f"Сервер не вернул logprobs для {cascade['no_confidence']} ответов (нужна Ollama с поддержкой "
+                f"logprobs) — они переданы основной модели. Можно выбрать совпадение двух сэмплов."
+            )
+    scheduler_stats = grade_stats.get("scheduler")
+    if scheduler_stats and scheduler_stats["avg_wait"] >= 0.01:
+        st.caption(
+            f"Ожидание общей очереди запросов к LLM: в среднем {scheduler_stats['avg_wait']:.2f} с на запрос "
+            f"(предел процесса — {scheduler_stats['max_in_flight']} одновременных запросов)."
+        )
+    if "embedding_error" in grade_stats:
+        st.warning(f"Оценка по эмбеддингам пропущена: {grade_stats['embedding_error']}")
+    if grade_stats["batch_fallbacks"]:
+        st.warning(
+            f"Пакетов с некорректным JSON, переоценённых по одному ответу: {grade_stats['batch_fallbacks']}."
+        )
+    if grade_stats["llm_calls"]:
+        concurrency = grade_stats["concurrency"]
+        st.info(
+            f"Подобранный лимит одновременных запросов: {concurrency['final_limit']} "
+            f"(максимум за прогон: {concurrency['peak_limit']}, "
+            f"средняя задержка {concurrency['avg_latency']:.1f} с, ошибок: {concurrency['errors']})."
+        )
+    telemetry = grade_stats.get("telemetry")
+    if telemetry and telemetry["calls"]:
+        st.caption(f"Диагностика запросов к LLM. Узкое место — {telemetry['bottleneck']}")
+        outcomes = telemetry["outcomes"]
+        st.dataframe(pd.DataFrame([
+            {"Показатель": "Ожидание лимита, с", "Среднее": telemetry["queue_wait"]["mean"],
+             "Медиана": telemetry["queue_wait"]["p50"], "95%": telemetry["queue_wait"]["p95"]},
+            {"Показатель": "Задержка ответа, с", "Среднее": telemetry["latency"]["mean"],
+             "Медиана": telemetry["latency"]["p50"], "95%": telemetry["latency"]["p95"]},
+        ]), use_container_width=True, hide_index=True)
+        details = [
+            f"запросов {telemetry['calls']}",
+            f"ответов без оценки {outcomes[OUTCOME_PARSE_ERROR]}",
+            f"исключений {outcomes[OUTCOME_ERROR]}",
+        ]
+        if telemetry["eval_tokens_per_s"]:
+            details.append(f"генерация {telemetry['eval_tokens_per_s']:.1f} ток./с")
+        if telemetry["server_share"] is not None:
+            details.append(f"доля времени на сервере {telemetry['server_share']:.0%}")
+        details.append(f"простой без запросов {telemetry['idle_share']:.0%} прогона")
+        st.caption(", ".join(details) + ".")
+        if telemetry["errors"]:
+            st.caption("Исключения: " + ", ".join(f"{name} — {count}" for name, count in telemetry["errors"].items()))
+    if len(grade_stats.get("endpoints", [])) > 1:
+        st.caption("Нагрузка по серверам Ollama")
+        st.dataframe(pd.DataFrame(grade_stats["endpoints"]).rename(columns={
+            "host": "Сервер", "available": "Доступен", "outstanding": "В работе", "completed": "Ответов",
+            "errors": "Ошибок", "avg_latency": "Средняя задержка, с", "throughput": "Запросов в секунду",
+        }), use_container_width=True)
+
+def show_jobs(polling):
+    job_runner = get_job_runner()
+    jobs = job_runner.list_jobs()
+    if polling and not any(job["status"] in ACTIVE_STATUSES for job in jobs):
+        # Последнее задание закончилось: полный перезапуск страницы выключит автообновление
+        st.rerun()
+    if not jobs:
+        st.caption("Заданий пока нет.")
+    scheduler_state = job_runner.scheduler.snapshot()
+    if scheduler_state["runs"]:
+        st.caption(
+            f"Запросов к LLM в работе: {scheduler_state['in_flight']} из {scheduler_state['max_in_flight']}, "
+            f"ждут общей очереди: {scheduler_state['waiting']}. Выполняется проверок: "
+            f"{len(scheduler_state['runs'])}, сессий: {scheduler_state['owners']}."
+        )
+    # Фоновые задания подписывают свой прогон в планировщике job_id
+    scheduler_runs = {row["label"]: row for row in scheduler_state["runs"]}
+
+    for job in jobs:
+        with st.expander(
+                f"{job['discipline']} — {job['lecture']} · {job['status']} · задание {job['job_id']}",
+                expanded=job["status"] in ACTIVE_STATUSES):
+            created = datetime.fromtimestamp(job["created_at"]).strftime("%d.%m.%Y %H:%M:%S")
+            own_job = " (задание этой сессии)" if job["owner"] == session_owner() else ""
+            st.caption(f"Создано {created}, прогон {job['run_id']}{own_job}")
+
+            if job["status"] in ACTIVE_STATUSES:
+                queue_position = job_runner.queue_position(job["job_id"])
+                if queue_position:
+                    st.info(f"Место в очереди заданий: {queue_position[0]} из {queue_position[1]}.")
+                scheduler_run = scheduler_runs.get(job["job_id"])
+                if scheduler_run:
+                    st.caption(
+                        f"Запросов этого задания к LLM: в работе {scheduler_run['in_flight']}, "
+                        f"ждут своей очереди {scheduler_run['waiting']}; среднее ожидание слота "
+                        f"{scheduler_run['avg_wait']:.2f} с."
+                    )
+                if job["total"]:
+                    progress_text = f"Проверено {job['done']} из {job['total']}"
+                    if job["started_at"] and job["done"]:
+                        elapsed = time.time() - job["started_at"]
+                        eta = elapsed / job["done"] * (job["total"] - job["done"])
+                        progress_text += f", осталось примерно {eta:.0f} с"
+                    st.progress(job["done"] / job["total"], text=progress_text)
+                if st.button("Отменить", key=f"cancel_{job['job_id']}"):
+                    job_runner.cancel(job["job_id"])
+                    st.rerun()
+                partial_df = journal_totals(job["run_id"])
+                if not partial_df.empty:
+                    st.dataframe(partial_df, use_container_width=True)
+
+            elif job["status"] == STATUS_DONE:
+                job_stats = json.loads(job["stats"])
+                show_grade_stats(job_stats)
+                if job_stats["tiers"].get(TIER_FAILED) and st.button(
+                        "Перепроверить ответы с ошибками", key=f"regrade_{job['job_id']}"):
+                    try:
+                        job_runner.resubmit(job["job_id"])
+                    except ValueError as e:
+                        st.error(str(e))
+                    else:
+                        st.rerun()
+                results_store = get_results_store()
+                finished_run = results_store.get_run(job["run_id"])
+                if finished_run is None:
+                    st.warning("Результаты этого задания не найдены в хранилище результатов.")
+                    continue
+                st.dataframe(results_store.run_results(job["run_id"]), use_container_width=True)
+                st.download_button(
+                    label="Скачать все результаты (ZIP)",
+                    data=lambda run_id=job["run_id"]: results_store.run_zip(run_id),
+                    on_click="ignore",
+                    file_name=f"results_{results_store.run_basename(finished_run)}.zip",
+                    mime="application/zip",
+                    key=f"download_{job['job_id']}"
+                )
+
+            elif job["status"] == STATUS_FAILED:
+                st.error(f"Ошибка при проверке: {job['error']}")
+
+
+st.subheader("Задания проверки")
+st.button("Обновить статус заданий")
+# Пока есть задания в очереди или в работе, список обновляется сам: прогресс и промежуточные
+# баллы заполняются по ходу проверки без нажатия кнопки
+jobs_active = any(job["status"] in ACTIVE_STATUSES for job in get_job_runner().list_jobs())
+st.fragment(show_jobs, run_every=JOBS_REFRESH_SECONDS if jobs_active else None)(jobs_active)
+
+with st.expander("Диагностика LLM с момента запуска сервера"):
+    telemetry_registry = get_telemetry_registry()
+    model_rows = telemetry_registry.model_summary()
+    if not model_rows:
+        st.caption("Запросов к LLM пока не было.")
+    else:
+        st.dataframe(pd.DataFrame(model_rows).rename(columns={
+            "model": "Модель", "calls": "Запросов", "parse_errors": "Без оценки", "errors": "Исключений",
+            "avg_queue_wait": "Среднее ожидание лимита, с", "avg_latency": "Средняя задержка, с",
+            "prompt_tokens": "Токенов промпта", "eval_tokens": "Сгенерировано токенов",
+            "eval_tokens_per_s": "Генерация, ток./с", "load_seconds": "Загрузка модели, с",
+        }), use_container_width=True, hide_index=True)
+    st.download_button(
+        label="Скачать метрики (формат Prometheus)",
+        data=telemetry_registry.render,
+        on_click="ignore",
+        file_name="metrics.prom",
+        mime="text/plain",
+        key="download_metrics"
+    )
+    st.caption(f"Тот же текст периодически записывается в {telemetry_registry.path}.")
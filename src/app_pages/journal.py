@@ -0,0 +1,143 @@
+import os
+from datetime import datetime
+from io import BytesIO
+import pandas as pd
+import streamlit as st
+from openpyxl import load_workbook
+from app_core.resources import list_journal_files, run_labels
+from results_store import get_results_store
+from journal_filling import (
+    JOURNALS_DIR, JournalSheet, lecture_column, lecture_number_from_id, pending_results, match_journal,
+    fill_journals
+)
+
+# Раздел 3: запись баллов одной лекции в выбранный журнал и массовое заполнение журналов.
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def fill_lecture_journal(journal_path, modified_at, run_id, results_version, lecture_number):
+    """Журнал с баллами одной лекции: (xlsx, предпросмотр листа, обновлено записей, ненайденные ID).
+
+    modified_at и results_version входят в ключ кэша: пока не изменились шаблон и результаты,
+    повторные действия на странице не открывают и не сохраняют журнал заново.
+    """
+    df_results = get_results_store().run_results(run_id)
+    student_ids = list(map(str, df_results.iloc[:, 0]))
+    workbook = load_workbook(journal_path)
+    sheet = workbook.active
+    id_to_score = dict(zip(student_ids, df_results.iloc[:, 1]))
+    updated_count, found_ids = JournalSheet(sheet).fill_scores(lecture_column(lecture_number), id_to_score)
+    missing_ids = [student_id for student_id in dict.fromkeys(student_ids) if student_id not in found_ids]
+    preview_df = pd.DataFrame(list(sheet.iter_rows(values_only=True)))
+    output = BytesIO()
+    workbook.save(output)
+    return output.getvalue(), preview_df, updated_count, missing_ids
+
+
+st.title("Загрузка результатов в журнал")
+
+journal_dir = JOURNALS_DIR
+journal_files = list_journal_files(journal_dir)
+selected_journal_file = st.selectbox("Выберите файл журнала (.xlsx)", journal_files)
+
+if selected_journal_file:
+    journal_path = os.path.join(journal_dir, selected_journal_file)
+    st.success(f"Выбран файл журнала: {selected_journal_file}")
+
+    results_store = get_results_store()
+    labels = run_labels(results_store)
+    selected_run_id = st.selectbox(
+        "Выберите результаты проверки", list(labels), format_func=labels.get
+    )
+
+    if selected_run_id:
+        selected_run = results_store.get_run(selected_run_id)
+        st.success(f"Выбраны результаты: {labels[selected_run_id]}")
+
+        lecture_number = lecture_number_from_id(selected_run["lecture_id"])
+        if lecture_number:
+            discipline_name = selected_run["discipline"]
+            st.write(f"Дисциплина: **{discipline_name}**")
+            st.write(f"Номер лекции: **{lecture_number}**")
+
+            if lecture_column(lecture_number) is None:
+                st.error("Слишком большой номер лекции. В шаблоне нет такой колонки.")
+            else:
+                excel_data, df_preview, updated_count, missing_ids = fill_lecture_journal(
+                    journal_path, os.stat(journal_path).st_mtime_ns, selected_run_id, results_store.version(),
+                    lecture_number
+                )
+                if missing_ids:
+                    st.warning(f"⚠️ В журнале не найдены ID {len(missing_ids)} студентов.")
+                    st.write("Вот их список:")
+                    st.code("\n".join(missing_ids))
+                else:
+                    st.info("✅ Все студенты из результатов найдены в журнале.")
+
+                st.success(f"Обновлено {updated_count} записей.")
+
+                st.dataframe(df_preview)
+
+                st.download_button(
+                    label="Скачать обновленный журнал",
+                    data=excel_data,
+                    file_name=f"обновленный_журнал_{discipline_name}_lec{lecture_number}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+        else:
+            st.error("Не удалось определить номер лекции по Lecture_ID.")
+
+st.markdown("---")
+st.subheader("Заполнение всех журналов сразу")
+st.caption("Для каждой лекции берутся последние результаты проверки; "
+           "каждый журнал открывается и сохраняется один раз.")
+
+latest_results = pending_results(get_results_store())
+if not latest_results:
+    st.info("Результатов проверки пока нет.")
+else:
+    skip_option = "— не заполнять —"
+    assignments = {}
+    # Две дисциплины в одном журнале не должны претендовать на колонку одной и той же лекции
+    lecture_owners = {}
+    conflicts = []
+    for discipline, lecture_runs in latest_results.items():
+        guessed_journal = match_journal(discipline, journal_files)
+        chosen_journal = st.selectbox(
+            f"{discipline} (лекции {', '.join(map(str, lecture_runs))})",
+            [skip_option] + journal_files,
+            index=journal_files.index(guessed_journal) + 1 if guessed_journal else 0,
+            key=f"bulk_journal_{discipline}"
+        )
+        if chosen_journal != skip_option:
+            for lecture_number in lecture_runs:
+                owner = lecture_owners.setdefault((chosen_journal, lecture_number), discipline)
+                if owner != discipline:
+                    conflicts.append(f"{chosen_journal}, лекция {lecture_number}: {owner} и {discipline}")
+            assignments.setdefault(chosen_journal, {}).update(lecture_runs)
+
+    if conflicts:
+        st.error(
+            "Несколько дисциплин заполняют одни и те же колонки журнала — выберите для них разные журналы "
+            "или не заполняйте одну из них:\n\n" + "\n".join(f"- {conflict}" for conflict in conflicts)
+        )
+
+    if st.button("Заполнить журналы", disabled=not assignments or bool(conflicts)):
+        with st.spinner("Заполнение журналов..."):
+            st.session_state.bulk_journals = fill_journals(assignments, get_results_store())
+
+    if "bulk_journals" in st.session_state:
+        bulk_zip, bulk_report = st.session_state.bulk_journals
+        missing_total = int(bulk_report["Не найдено"].sum())
+        if missing_total:
+            st.warning(f"⚠️ В журналах не найдены ID {missing_total} студентов (см. отчёт).")
+        else:
+            st.info("✅ Все студенты из результатов найдены в журналах.")
+        st.dataframe(bulk_report)
+        st.download_button(
+            label="Скачать заполненные журналы (ZIP)",
+            data=bulk_zip,
+            file_name=f"журналы_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+            mime="application/zip",
+            on_click="ignore"
+        )
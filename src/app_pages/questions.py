@@ -0,0 +1,126 @@
+import os
+from io import BytesIO
+import pandas as pd
+import streamlit as st
+from question_store import get_question_store, changes_from_editor, QuestionConflict
+
+# Раздел 1: редактор базы вопросов для самопроверки.
+
+st.title("Редактор базы вопросов для самопроверки")
+
+question_store = get_question_store()
+
+try:
+    df = question_store.all()
+    if 'questions_loaded' not in st.session_state:
+        st.session_state.questions_loaded = True
+        if os.path.exists(question_store.xlsx_path) or not df.empty:
+            st.success("База эталонов загружена!")
+        else:
+            st.warning("Файл не найден. Создана новая база.")
+except Exception as e:
+    st.error(f"Ошибка загрузки: {str(e)}")
+    st.stop()
+
+st.subheader("Фильтрация вопросов")
+available_disciplines = question_store.disciplines()
+selected_discipline = st.selectbox("Выберите дисциплину", options=["Все"] + list(available_disciplines))
+
+available_sessions = question_store.lectures(None if selected_discipline == "Все" else selected_discipline)
+selected_sessions = st.multiselect(
+    "Выберите номер лекции",
+    options=available_sessions,
+    placeholder="Например: Lec01, Lec02"
+)
+
+# Редактор работает со снимком таблицы: номера строк в изменениях st.data_editor
+# относятся именно к нему, а версии дисциплин нужны для проверки при сохранении
+editor_filter = (selected_discipline, tuple(selected_sessions))
+snapshot = st.session_state.get("questions_snapshot")
+editor_key = f"questions_editor_{st.session_state.get('questions_editor_generation', 0)}"
+editor_state = st.session_state.get(editor_key, {})
+has_changes = any(editor_state.get(kind) for kind in ("edited_rows", "added_rows", "deleted_rows"))
+if (snapshot is None or snapshot["filter"] != editor_filter
+        or (snapshot["version"] != question_store.version() and not has_changes)):
+    discipline_versions = question_store.discipline_versions()
+    snapshot = {
+        "filter": editor_filter,
+        "version": question_store.version(),
+        "discipline_versions": discipline_versions,
+        "df": question_store.filter(
+            discipline=None if selected_discipline == "Все" else selected_discipline,
+            lecture_ids=selected_sessions
+        ),
+    }
+    st.session_state.questions_snapshot = snapshot
+    st.session_state.questions_editor_generation = st.session_state.get("questions_editor_generation", 0) + 1
+    editor_key = f"questions_editor_{st.session_state.questions_editor_generation}"
+filtered_df = snapshot["df"]
+
+st.subheader("Таблица вопросов")
+st.caption(f"Отображается {len(filtered_df)} вопрос(ов)")
+
+edited_df = st.data_editor(filtered_df, num_rows="dynamic", use_container_width=True, key=editor_key)
+
+def download_excel(df):
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False)
+    return output.getvalue()
+
+discipline_part = selected_discipline if selected_discipline != "Все" else "Все_дисциплины"
+session_part = "_".join(map(str, selected_sessions)) if selected_sessions else "все_занятия"
+filename = f"вопросы_{discipline_part}_{session_part}.xlsx".replace(" ", "_")
+
+st.download_button(
+    "Скачать отфильтрованную таблицу",
+    # Файл собирается только по нажатию, а не при каждом действии в редакторе
+    data=lambda: download_excel(edited_df),
+    on_click="ignore",
+    file_name=filename,
+    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+)
+
+if "questions_saved" in st.session_state:
+    st.success(st.session_state.pop("questions_saved"))
+
+if st.button("Сохранить отредактированные данные в файл"):
+    try:
+        # Сохраняются только строки, которые редактор добавил, изменил или удалил
+        deleted_keys, upserts = changes_from_editor(filtered_df, st.session_state.get(editor_key, {}))
+
+        # Валидация
+        invalid_lecture_ids = upserts[~upserts["Lecture_ID"].astype(str).str.fullmatch(r"Lec\d{2}")]
+        invalid_question_ids = upserts[~upserts["Question_ID"].astype(str).str.fullmatch(r"Q\d{3}")]
+
+        if not invalid_lecture_ids.empty or not invalid_question_ids.empty:
+            st.error("❌ Обнаружены некорректные значения:")
+            if not invalid_lecture_ids.empty:
+                st.write("Неверный Lecture_ID:", invalid_lecture_ids[["Lecture_ID"]])
+            if not invalid_question_ids.empty:
+                st.write("Неверный Question_ID:", invalid_question_ids[["Question_ID"]])
+            st.stop()
+
+        if deleted_keys.empty and upserts.empty:
+            st.info("Изменений нет.")
+            st.stop()
+
+        question_store.apply_changes(deleted_keys, upserts, snapshot["discipline_versions"])
+        st.session_state.questions_saved = (
+            f"✅ Изменения успешно сохранены: записано строк — {len(upserts)}, удалено — {len(deleted_keys)}."
+        )
+        st.session_state.pop("questions_snapshot")
+        st.session_state.pop("questions_conflict", None)
+        st.rerun()
+
+    except QuestionConflict as e:
+        st.session_state.questions_conflict = f"❌ {e}. Обновите таблицу и внесите правки заново."
+    except Exception as e:
+        st.error(f"Ошибка при сохранении: {e}")
+
+if "questions_conflict" in st.session_state:
+    st.error(st.session_state.questions_conflict)
+    if st.button("Обновить таблицу (несохранённые правки будут потеряны)"):
+        st.session_state.pop("questions_conflict")
+        st.session_state.pop("questions_snapshot")
+        st.rerun()
@@ -0,0 +1,510 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from adaptive_limiter import AdaptiveLimiter
+from answers_csv import ID_IDENTIFIER, read_answers
+from grading_pipeline import LLM_MODEL, MAX_WORKERS, BATCH_SIZE, CASCADE_SIGNALS
+from grading_service import grade_csv_async, save_results
+from grading_settings import DEFAULT_SETTINGS
+from journal_filling import (
+    FIRST_STUDENT_ROW, ID_COLUMN, LECTURE_COLUMNS, JournalSheet, fill_journals, lecture_column, run_scores
+)
+from mock_ollama_server import LATENCY_DISTRIBUTIONS, REPLY_FORMATS, start_mock_server
+from ollama_pool import HOSTS_ENV, OllamaPool
+from question_store import COLUMNS, STORE_PATH, XLSX_PATH, QuestionStore
+from results_store import get_results_store
+from run_journal import RunJournal
+
+# Замер производительности без настоящей модели. Поднимает заглушки Ollama
+# (mock_ollama_server.py), создаёт во временной папке синтетическую базу вопросов,
+# выгрузку wj.qq и журналы заданного размера и прогоняет на них те же функции,
+# что вызываются из main.py: загрузку базы вопросов, чтение CSV, проверку
+# (grade_csv_async) и заполнение журналов.
+#
+#   python benchmark.py --students 300 --questions 10 --latency 0.2 --servers 2 --output bench.json
+#   python benchmark.py --distribution lognormal --jitter 0.3 --error-rate 0.02 --garbage-rate 0.01
+#   python benchmark.py --compare bench_old.json bench_new.json
+#
+# Результат — JSON (по умолчанию в stdout). Имена метрик заканчиваются на _s (время, меньше —
+# лучше) или _per_s (пропускная способность, больше — лучше); --compare сравнивает два
+# таких файла и возвращает код 1, если какая-то метрика ухудшилась больше порога.
+
+WORDS = (
+    "нагрузка бетон фундамент арматура прочность сечение балка колонна перекрытие опора "
+    "давление температура расчёт модуль деформация грунт кран механизм привод двигатель "
+    "вероятность выборка дисперсия среднее событие распределение оценка гипотеза критерий"
+).split()
+DISCIPLINE = "Синтетическая дисциплина"
+LECTURE_ID = "Lec01"
+SERVICE_COLUMNS = ["序号", "提交答卷时间", "所用时间", "来源"]
+
+
+def random_text(rng, min_words=3, max_words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words)))
+
+
+def make_question_base(path, disciplines, lectures, questions, rng):
+    rows = [
+        {
+            "Discipline": DISCIPLINE if d == 0 else f"Дисциплина {d + 1}",
+            "Lecture_ID": f"Lec{lecture:02d}",
+            "Question_ID": f"{lecture}.{q}",
+            "Question": f"Вопрос {q}: {random_text(rng)}?",
+            "Answer": random_text(rng, 5, 20),
+        }
+        for d in range(disciplines)
+        for lecture in range(1, lectures + 1)
+        for q in range(1, questions + 1)
+    ]
+    pd.DataFrame(rows, columns=COLUMNS).to_excel(path, index=False)
+    return len(rows)
+
+
+def student_ids(students):
+    return [f"2025{i:05d}" for i in range(1, students + 1)]
+
+
+def make_answers_csv(ids, ethalons, rng, empty_rate=0.05, exact_rate=0.05):
+    """Выгрузка wj.qq в UTF-8 с BOM: служебные колонки, ID, затем по колонке на вопрос."""
+    questions = ethalons["Question"].tolist()
+    references = ethalons["Answer"].tolist()
+    columns = SERVICE_COLUMNS + [ID_IDENTIFIER] + [f"{i}. {q}" for i, q in enumerate(questions, 1)]
+    rows = []
+    for number, student_id in enumerate(ids, 1):
+        answers = []
+        for reference in references:
+            roll = rng.random()
+            if roll < empty_rate:
+                answers.append("")
+            elif roll < empty_rate + exact_rate:
+                answers.append(reference)
+            else:
+                answers.append(random_text(rng))
+        rows.append([str(number), "2025/05/26 14:00:00", "300秒", "微信"] + [student_id] + answers)
+    output = io.StringIO()
+    pd.DataFrame(rows, columns=columns).to_csv(output, index=False)
+    return output.getvalue().encode("utf-8-sig")
+
+
+def make_journal(path, ids):
+    """Журнал в разметке шаблонов data/journals: ID в колонке B с FIRST_STUDENT_ROW,
+    по две объединённые ячейки на лекцию."""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet["A1"] = "Журнал успеваемости"
+    sheet["A2"] = DISCIPLINE
+    sheet["A4"] = "Весенний семестр 2025\nКоличество часов: 32"
+    sheet["A6"], sheet["B6"], sheet["D6"] = "№", "ID студента", "Имя студента"
+    first_col = ord(LECTURE_COLUMNS[0]) - ord("A")  # колонка перед первой колонкой лекции
+    for number in range(len(LECTURE_COLUMNS)):
+        sheet.cell(row=4, column=first_col + 2 * number).value = f"Занятие {number + 1}"
+    for row, student_id in enumerate(ids, start=FIRST_STUDENT_ROW):
+        sheet.cell(row=row, column=1).value = row - FIRST_STUDENT_ROW + 1
+        sheet[f"{ID_COLUMN}{row}"] = int(student_id)
+        sheet.cell(row=row, column=4).value = f"Студент {student_id}"
+        for number in range(len(LECTURE_COLUMNS)):
+            col = first_col + 2 * number
+            sheet.merge_cells(start_row=row, start_column=col, end_row=row, end_column=col + 1)
+    workbook.save(path)
+
+
+def percentiles(values):
+    if not values:
+        return {"p50_s": None, "p90_s": None, "p99_s": None, "max_s": None}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"p50_s": float(p50), "p90_s": float(p90), "p99_s": float(p99), "max_s": float(max(values))}
+
+
+def median_time(fn, repeats):
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return float(np.median(durations))
+
+
+class TimedClient:
+    """Обёртка над OllamaPool, записывающая длительность каждого запроса."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.latencies = {"chat": [], "embed": []}
+        self.failures = {"chat": 0, "embed": 0}
+
+    async def _timed(self, method, **kwargs):
+        # Потоковые запросы быстрого режима учитываются вместе с обычными chat
+        kind = "chat" if method.startswith("chat") else method
+        started = time.perf_counter()
+        try:
+            return await getattr(self.pool, method)(**kwargs)
+        except Exception:
+            self.failures[kind] += 1
+            raise
+        finally:
+            self.latencies[kind].append(time.perf_counter() - started)
+
+    async def chat(self, **kwargs):
+        return await self._timed("chat", **kwargs)
+
+    async def chat_until(self, until, **kwargs):
+        return await self._timed("chat_until", until=until, **kwargs)
+
+    async def embed(self, **kwargs):
+        return await self._timed("embed", **kwargs)
+
+
+def bench_question_base(args):
+    # Хранилище читает данные при первом обращении, поэтому замер включает all()
+    started = time.perf_counter()
+    QuestionStore(STORE_PATH, XLSX_PATH).all()
+    cold_s = time.perf_counter() - started
+    warm_s = median_time(lambda: QuestionStore(STORE_PATH, XLSX_PATH).all(), args.repeats)
+
+    store = QuestionStore(STORE_PATH, XLSX_PATH)
+    keys = store.all()[["Discipline", "Lecture_ID"]].drop_duplicates().itertuples(index=False)
+    keys = list(keys)
+    lookup_s = median_time(lambda: [store.questions(d, lecture) for d, lecture in keys], args.repeats)
+    return {
+        "rows": len(store.all()),
+        "import_xlsx_s": cold_s,
+        "open_s": warm_s,
+        "lecture_lookup_s": lookup_s / max(len(keys), 1),
+    }
+
+
+def bench_answers_csv(csv_bytes, num_questions, args):
+    read_s = median_time(lambda: read_answers(csv_bytes, num_questions=num_questions), args.repeats)
+    return {
+        "bytes": len(csv_bytes),
+        "read_s": read_s,
+        "rows_per_s": len(read_answers(csv_bytes, num_questions=num_questions)) / read_s if read_s else None,
+    }
+
+
+async def run_grading(csv_bytes, args, settings):
+    pool = OllamaPool()
+    client = TimedClient(pool)
+    limiter = AdaptiveLimiter(max_limit=args.max_workers)
+    first_result = {}
+
+    def on_progress(done, total):
+        if done and "at" not in first_result:
+            first_result["at"] = time.perf_counter()
+
+    started = time.perf_counter()
+    try:
+        results_df, log_df, stats = await grade_csv_async(
+            csv_bytes, DISCIPLINE, LECTURE_ID, run_id=f"bench-{time.time_ns()}", model=args.model,
+            limiter=limiter, client=client, batch_size=args.batch_size, settings=settings, restart=True,
+            on_progress=on_progress
+        )
+    finally:
+        await pool.close()
+    elapsed = time.perf_counter() - started
+    return results_df, log_df, stats, client, pool.stats(), elapsed, first_result.get("at", started) - started
+
+
+def bench_grading(csv_bytes, args):
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update({"embedding_enabled": args.embeddings, "clustering_enabled": args.clustering,
+                     "fast_scoring": not args.full_scoring, "cascade_enabled": args.cascade,
+                     "cascade_model": args.cascade_model, "cascade_signal": args.cascade_signal,
+                     "cascade_threshold": args.cascade_threshold})
+    servers = [
+        start_mock_server(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          distribution=args.distribution, reply_format=args.reply_format,
+                          garbage_rate=args.garbage_rate, load_time=args.load_time, token_time=args.token_time,
+                          model_noise={args.cascade_model: args.cascade_noise},
+                          model_speedup={args.cascade_model: args.cascade_speedup})
+        for _ in range(args.servers)
+    ]
+    previous_hosts = os.environ.get(HOSTS_ENV)
+    os.environ[HOSTS_ENV] = ",".join(url for _, url in servers)
+    try:
+        results_df, log_df, stats, client, endpoints, elapsed, first_s = asyncio.run(
+            run_grading(csv_bytes, args, settings)
+        )
+    finally:
+        model_loads = sum(server.loads for server, _ in servers)
+        generated_tokens = sum(server.tokens for server, _ in servers)
+        cancelled_streams = sum(server.cancelled for server, _ in servers)
+        for server, _ in servers:
+            server.shutdown()
+        if previous_hosts is None:
+            os.environ.pop(HOSTS_ENV, None)
+        else:
+            os.environ[HOSTS_ENV] = previous_hosts
+
+    save_started = time.perf_counter()
+    save_results(results_df, log_df, DISCIPLINE, LECTURE_ID, stats["run_id"], stats=stats)
+    save_s = time.perf_counter() - save_started
+
+    chat = client.latencies["chat"]
+    # Ответ модели есть только в журнале прогона: "Ошибка: ..." — ответы, оставшиеся без оценки после повторов
+    replies = [str(record.get("reply")) for record in RunJournal(stats["run_id"]).records.values()]
+    failed_answers = sum(reply.startswith("Ошибка") for reply in replies)
+    return {
+        "answers": stats["total"],
+        "llm_calls": len(chat),
+        "llm_call_failures": client.failures["chat"],
+        "failed_answers": failed_answers,
+        "batch_fallbacks": stats["batch_fallbacks"],
+        "retries": stats["retries"]["retries"],
+        "tiers": stats["tiers"],
+        "final_limit": stats["concurrency"]["final_limit"],
+        "model_loads": model_loads,
+        "generated_tokens": generated_tokens,
+        "cancelled_streams": cancelled_streams,
+        "total_s": elapsed,
+        "first_result_s": first_s,
+        "answers_per_s": stats["total"] / elapsed if elapsed else None,
+        "llm_calls_per_s": len(chat) / elapsed if elapsed else None,
+        "llm_latency": percentiles(chat),
+        "embed_latency": percentiles(client.latencies["embed"]),
+        "save_results_s": save_s,
+        "telemetry": stats["telemetry"],
+        "cascade": stats.get("cascade"),
+        "endpoints": endpoints,
+    }
+
+
+def bench_journals(ids, args, rng):
+    os.makedirs("journals", exist_ok=True)
+    store = get_results_store()
+    lectures = {}
+    for lecture_number in range(1, min(args.journal_lectures, len(LECTURE_COLUMNS)) + 1):
+        results_df = pd.DataFrame({"ID студента": ids, "Оценка (из 10)": [rng.randint(0, 20) for _ in ids]})
+        run_id = f"bench-journal-{lecture_number}-{time.time_ns()}"
+        save_results(results_df, pd.DataFrame(), DISCIPLINE, f"Lec{lecture_number:02d}", run_id)
+        lectures[lecture_number] = run_id
+
+    journal_files = []
+    for number in range(args.journals):
+        journal_file = f"Журнал {number + 1}.xlsx"
+        make_journal(os.path.join("journals", journal_file), ids)
+        journal_files.append(journal_file)
+
+    # Этапы заполнения одного журнала по отдельности: те же шаги, что в journal_filling.fill_journal
+    path = os.path.join("journals", journal_files[0])
+    scores = {n: run_scores(store, run_id) for n, run_id in lectures.items()}
+    started = time.perf_counter()
+    workbook = load_workbook(path)
+    load_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    journal_sheet = JournalSheet(workbook.active)
+    index_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for lecture_number, id_to_score in scores.items():
+        journal_sheet.fill_scores(lecture_column(lecture_number), id_to_score)
+    fill_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    workbook.save(io.BytesIO())
+    save_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _, report_df = fill_journals({journal_file: lectures for journal_file in journal_files}, store,
+                                 journals_dir="journals")
+    bulk_s = time.perf_counter() - started
+    return {
+        "journals": len(journal_files),
+        "students": len(ids),
+        "lectures": len(lectures),
+        "load_s": load_s,
+        "index_s": index_s,
+        "fill_s": fill_s,
+        "save_s": save_s,
+        "bulk_fill_s": bulk_s,
+        "journals_per_s": len(journal_files) / bulk_s if bulk_s else None,
+        "updated_cells": int(report_df["Обновлено"].sum()),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "-C", os.path.dirname(os.path.abspath(__file__)), "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_benchmark(args):
+    rng = random.Random(args.seed)
+    revision = git_revision()
+    source_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="grading-bench-")
+    # Все модули работают с путями относительно текущей папки (data/..., temp/...),
+    # поэтому замер идёт в пустой временной папке и не трогает настоящие данные
+    os.chdir(workdir)
+    try:
+        os.makedirs(os.path.dirname(XLSX_PATH), exist_ok=True)
+        make_question_base(XLSX_PATH, args.disciplines, args.lectures, args.questions, rng)
+        results = {"question_base": bench_question_base(args)}
+        print(f"База вопросов: {results['question_base']['rows']} строк", file=sys.stderr)
+
+        ethalons = QuestionStore(STORE_PATH, XLSX_PATH).questions(DISCIPLINE, LECTURE_ID)
+        ids = student_ids(args.students)
+        csv_bytes = make_answers_csv(ids, ethalons, rng, args.empty_rate, args.exact_rate)
+        results["answers_csv"] = bench_answers_csv(csv_bytes, len(ethalons), args)
+
+        if not args.skip_grading:
+            print(f"Проверка: {args.students} студентов × {args.questions} вопросов", file=sys.stderr)
+            results["grading"] = bench_grading(csv_bytes, args)
+        if args.journals:
+            print(f"Журналы: {args.journals} × {args.students} студентов", file=sys.stderr)
+            results["journals"] = bench_journals(ids, args, rng)
+    finally:
+        os.chdir(source_dir)
+        if args.keep_workdir:
+            print(f"Временная папка: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "compare", "keep_workdir")}
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "revision": revision,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "params": params,
+        "results": results,
+    }
+
+
+def flatten_metrics(report, prefix=""):
+    metrics = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten_metrics(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and (
+                name.endswith("_s") or name.endswith("_per_s")):
+            metrics[name] = float(value)
+    return metrics
+
+
+def compare_reports(old_path, new_path, threshold):
+    """Печатает изменение метрик; возвращает список ухудшившихся больше чем на threshold."""
+    with open(old_path, encoding="utf-8") as f:
+        old_report = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new_report = json.load(f)
+    changed = sorted(
+        key for key in set(old_report["params"]) | set(new_report["params"])
+        if old_report["params"].get(key) != new_report["params"].get(key)
+    )
+    if changed:
+        print(f"⚠️ Замеры сделаны с разными параметрами ({', '.join(changed)}), сравнение неточное\n")
+    old, new = flatten_metrics(old_report["results"]), flatten_metrics(new_report["results"])
+
+    regressions = []
+    for name in sorted(set(old) & set(new)):
+        if not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name]
+        # Для пропускной способности ухудшение — падение, для времени — рост
+        worse = -change if name.endswith("_per_s") else change
+        mark = ""
+        if worse > threshold:
+            mark = "  ⚠️ хуже"
+            regressions.append(name)
+        elif worse < -threshold:
+            mark = "  ✅ лучше"
+        print(f"{name:45} {old[name]:12.4f} → {new[name]:12.4f}  {change:+7.1%}{mark}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Замер производительности проверки на заглушке Ollama")
+    parser.add_argument("--output", help="Файл для JSON с результатами (по умолчанию stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="Сравнить два JSON с результатами вместо замера")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Допустимое ухудшение метрики при --compare (доля)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3, help="Повторы быстрых замеров (берётся медиана)")
+    parser.add_argument("--keep-workdir", action="store_true", help="Не удалять временную папку")
+
+    data = parser.add_argument_group("синтетические данные")
+    data.add_argument("--students", type=int, default=200)
+    data.add_argument("--questions", type=int, default=10, help="Вопросов в лекции")
+    data.add_argument("--disciplines", type=int, default=20, help="Дисциплин в базе вопросов")
+    data.add_argument("--lectures", type=int, default=10, help="Лекций в каждой дисциплине")
+    data.add_argument("--empty-rate", type=float, default=0.05, help="Доля пустых ответов")
+    data.add_argument("--exact-rate", type=float, default=0.05, help="Доля ответов, совпадающих с эталоном")
+    data.add_argument("--journals", type=int, default=3, help="Журналов для заполнения (0 — не замерять)")
+    data.add_argument("--journal-lectures", type=int, default=len(LECTURE_COLUMNS))
+
+    grading = parser.add_argument_group("проверка")
+    grading.add_argument("--skip-grading", action="store_true")
+    grading.add_argument("--model", default=LLM_MODEL)
+    grading.add_argument("--max-workers", type=int, default=MAX_WORKERS)
+    grading.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    grading.add_argument("--embeddings", action="store_true", help="Включить предварительную оценку эмбеддингами")
+    grading.add_argument("--clustering", action="store_true", help="Включить кластеризацию дубликатов")
+    grading.add_argument("--full-scoring", action="store_true",
+                         help="Оценка свободным ответом модели вместо быстрого режима")
+    grading.add_argument("--cascade", action="store_true", help="Каскад: сначала малая модель")
+    grading.add_argument("--cascade-model", default=DEFAULT_SETTINGS["cascade_model"])
+    grading.add_argument("--cascade-signal", choices=CASCADE_SIGNALS, default=DEFAULT_SETTINGS["cascade_signal"])
+    grading.add_argument("--cascade-threshold", type=float, default=DEFAULT_SETTINGS["cascade_threshold"])
+
+    mock = parser.add_argument_group("заглушка Ollama")
+    mock.add_argument("--servers", type=int, default=1)
+    mock.add_argument("--latency", type=float, default=0.1, help="Средняя задержка ответа, с")
+    mock.add_argument("--jitter", type=float, default=0.03, help="Стандартное отклонение задержки, с")
+    mock.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="normal")
+    mock.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов с ошибкой 503")
+    mock.add_argument("--reply-format", choices=REPLY_FORMATS, default="digit")
+    mock.add_argument("--garbage-rate", type=float, default=0.0, help="Доля ответов без оценки")
+    mock.add_argument("--load-time", type=float, default=0.0, help="Время загрузки модели заглушкой, с")
+    mock.add_argument("--token-time", type=float, default=0.02, help="Время генерации одного токена, с")
+    mock.add_argument("--cascade-noise", type=float, default=0.3,
+                      help="Доля случайных оценок малой модели каскада")
+    mock.add_argument("--cascade-speedup", type=float, default=5.0,
+                      help="Во сколько раз малая модель каскада отвечает быстрее")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        regressions = compare_reports(*args.compare, args.threshold)
+        if regressions:
+            print(f"\nУхудшились: {', '.join(regressions)}")
+        return 1 if regressions else 0
+
+    report = run_benchmark(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Результаты: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
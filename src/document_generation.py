@@ -0,0 +1,216 @@
+import io
+import os
+import pickle
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.styles import Font
+
+# Генерация пустых ведомостей и журналов по базе дисциплин (раздел 4).
+# Каждый шаблон из data/ethalons_statements и data/ethalons_journals читается с диска
+# один раз; для каждой строки базы берётся копия уже разобранной книги в памяти
+# (pickle разобранной книги в десятки раз быстрее повторного load_workbook).
+# Строки обрабатываются в пуле процессов, готовые файлы сразу пишутся в ZIP.
+
+STATEMENTS_DIR = "data/ethalons_statements"
+JOURNAL_TEMPLATES_DIR = "data/ethalons_journals"
+LOG_NAME = "журнал_генерации.csv"
+
+TEMPLATE_PREFIXES = {
+    "Арх": "EXAMPLE_A",
+    "Гео": "EXAMPLE_G",
+    "Строй": "EXAMPLE_S",
+    "ТиТ": "EXAMPLE_T",
+    "ВиВ": "EXAMPLE_V"
+}
+
+DIRECTION_FOLDERS = {
+    "Арх": "Архитектура",
+    "Гео": "Геодезия",
+    "Строй": "Строительство",
+    "ТиТ": "ТиТ",
+    "ВиВ": "ВиВ"
+}
+
+STATUS_CREATED = "создано"
+STATUS_PARTIAL = "частично"
+STATUS_SKIPPED = "пропущено"
+STATUS_FAILED = "ошибка"
+
+# Шаблоны, переданные процессу-исполнителю: путь -> pickle разобранной книги (или None)
+_templates = {}
+
+
+def clean_filename(name):
+    return re.sub(r'[<>:"/\\|?*_]', '', str(name)).strip()
+
+
+def determine_semester_and_year():
+    now = datetime.now()
+    year = now.year
+    semester = "весенний" if now.month <= 6 else "осенний"
+    return semester, year
+
+
+def _cell_text(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def statement_template_path(direction, course_year):
+    return os.path.join(STATEMENTS_DIR, f"V_{TEMPLATE_PREFIXES[direction]}{course_year}.xlsx")
+
+
+def journal_template_path(direction, course_year):
+    return os.path.join(JOURNAL_TEMPLATES_DIR, f"J_{TEMPLATE_PREFIXES[direction]}{course_year}.xlsx")
+
+
+def load_templates(rows):
+    """Разбирает каждый нужный строкам шаблон один раз."""
+    templates = {}
+    for row in rows:
+        direction, course_year = row["direction"], row["course_year"]
+        if direction not in TEMPLATE_PREFIXES or not course_year:
+            continue
+        for path in (statement_template_path(direction, course_year), journal_template_path(direction, course_year)):
+            if path not in templates:
+                templates[path] = pickle.dumps(load_workbook(path)) if os.path.exists(path) else None
+    return templates
+
+
+def _init_worker(templates):
+    _templates.clear()
+    _templates.update(templates)
+
+
+def _clone_template(path):
+    blob = _templates.get(path)
+    return pickle.loads(blob) if blob is not None else None
+
+
+def _sign(sheet, column, teacher):
+    last_row = max([cell.row for cell in sheet[column] if cell.value is not None], default=1)
+    teacher_cell = sheet[f'{column}{last_row + 2}']
+    teacher_cell.value = teacher
+    teacher_cell.font = Font(name='Times New Roman', bold=True)
+
+
+def _workbook_bytes(workbook):
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def generate_row(index, row, semester, year):
+    """Ведомость и журнал для одной строки базы. Возвращает (файлы, запись журнала генерации)."""
+    log = {"Строка": index + 1, "Направление": row["direction"], "Дисциплина": row["discipline"],
+           "Статус": STATUS_SKIPPED, "Сообщение": ""}
+    files = []
+    try:
+        direction, discipline, teacher = row["direction"], row["discipline"], row["teacher"]
+        course_year, hours = row["course_year"], row["hours"]
+
+        if not all([direction, discipline, teacher, course_year, hours]):
+            log["Сообщение"] = "не все данные заполнены"
+            return files, log
+        if direction not in TEMPLATE_PREFIXES:
+            log["Сообщение"] = f"для направления '{direction}' не определен шаблон ведомости"
+            return files, log
+
+        direction_folder = DIRECTION_FOLDERS[direction]
+        discipline_clean = clean_filename(discipline)
+
+        statement_path = statement_template_path(direction, course_year)
+        workbook = _clone_template(statement_path)
+        if workbook is None:
+            log["Сообщение"] = f"файл шаблона ведомости не найден: {statement_path}"
+            return files, log
+        sheet = workbook.active
+        sheet['A2'] = discipline
+        _sign(sheet, 'C', teacher)
+        files.append((f"ведомости/{direction_folder}/Ведомость {discipline_clean} {course_year}.xlsx",
+                      _workbook_bytes(workbook)))
+
+        journal_path = journal_template_path(direction, course_year)
+        workbook = _clone_template(journal_path)
+        if workbook is None:
+            log["Статус"] = STATUS_PARTIAL
+            log["Сообщение"] = f"файл шаблона журнала не найден: {journal_path}"
+            return files, log
+        for sheet in workbook.worksheets:
+            sheet['A2'] = discipline
+            sheet['A4'] = f"{semester.capitalize()} семестр {year}\nКоличество часов: {hours}"
+            _sign(sheet, 'D', teacher)
+        files.append((f"Журналы/{direction_folder}/Журнал {discipline_clean} {course_year}.xlsx",
+                      _workbook_bytes(workbook)))
+
+        log["Статус"] = STATUS_CREATED
+    except Exception as e:
+        log["Статус"] = STATUS_FAILED
+        log["Сообщение"] = str(e)
+    return files, log
+
+
+def read_rows(data):
+    return [
+        {
+            "direction": _cell_text(record.get('Направление')),
+            "discipline": _cell_text(record.get('Название дисциплины')),
+            "teacher": _cell_text(record.get('Преподаватель')),
+            "course_year": _cell_text(record.get('Курс')),
+            "hours": _cell_text(record.get('Часы')),
+        }
+        for record in data.to_dict("records")
+    ]
+
+
+def generate_documents(data, output=None, max_workers=None, on_progress=None):
+    """Создаёт ведомости и журналы для всех строк базы дисциплин.
+
+    Файлы пишутся в ZIP (output — файл или буфер; по умолчанию BytesIO) по мере готовности.
+    Возвращает (output, log_df); on_progress(done, total) вызывается после каждой строки.
+    """
+    rows = read_rows(data)
+    templates = load_templates(rows)
+    semester, year = determine_semester_and_year()
+    output = output if output is not None else io.BytesIO()
+    args = (range(len(rows)), rows, [semester] * len(rows), [year] * len(rows))
+
+    logs = []
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as zipf:
+        if len(rows) > 1:
+            workers = max_workers or min(len(rows), os.cpu_count() or 1)
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(templates,))
+            results = executor.map(generate_row, *args, chunksize=max(1, len(rows) // (workers * 4)))
+        else:
+            executor = None
+            _init_worker(templates)
+            results = map(generate_row, *args)
+        try:
+            used_names = set()
+            for files, log in results:
+                for name, content in files:
+                    # Одна и та же дисциплина в базе дважды не должна перезаписать файл в архиве
+                    base_name, counter = name, 2
+                    while name in used_names:
+                        name = base_name.replace(".xlsx", f" ({counter}).xlsx")
+                        counter += 1
+                    used_names.add(name)
+                    # xlsx уже сжат, повторное сжатие только тратит время
+                    zipf.writestr(name, content, compress_type=zipfile.ZIP_STORED)
+                logs.append(log)
+                if on_progress:
+                    on_progress(len(logs), len(rows))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        log_df = pd.DataFrame(logs, columns=["Строка", "Направление", "Дисциплина", "Статус", "Сообщение"])
+        zipf.writestr(LOG_NAME, log_df.to_csv(index=False).encode("utf-8-sig"))
+    return output, log_df
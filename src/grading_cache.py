@@ -0,0 +1,128 @@
+import hashlib
+import numpy as np
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Кэш оценок LLM: одинаковые (после нормализации) ответы на один и тот же вопрос
+# не отправляются в Ollama повторно.
+
+CACHE_PATH = "data/grading_cache.sqlite"
+MAX_ENTRIES = 200_000
+MAX_AGE_DAYS = 180
+
+
+def normalize_answer(text):
+    text = str(text).lower().replace("ё", "е")
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def text_hash(text):
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+
+
+class GradingCache:
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, max_age_days=MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS grades (
+                key TEXT PRIMARY KEY,
+                score INTEGER NOT NULL,
+                reply TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_grades_last_used ON grades(last_used)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(discipline, lecture_id, question_id, student_answer, reference_answer, model, prompt_version):
+        parts = [
+            str(discipline),
+            str(lecture_id),
+            str(question_id),
+            normalize_answer(student_answer),
+            text_hash(reference_answer),
+            str(model),
+            str(prompt_version),
+        ]
+        return text_hash("\x1f".join(parts))
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT score, reply FROM grades WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE grades SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0], row[1]
+
+    def put(self, key, score, reply):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO grades (key, score, reply, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, int(score), reply, now, now)
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_embedding_key(model, text):
+        return text_hash(f"{model}\x1f{text}")
+
+    def get_embedding(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        return None if row is None else np.frombuffer(row[0], dtype=np.float32)
+
+    def put_embedding(self, key, vector):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                (key, np.asarray(vector, dtype=np.float32).tobytes(), time.time())
+            )
+            self._conn.commit()
+
+    def evict(self):
+        # Сначала удаляем устаревшие записи, затем самые давно использованные сверх лимита
+        cutoff = time.time() - self.max_age_days * 86400
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM grades WHERE last_used < ?", (cutoff,)).rowcount
+            self._conn.execute("DELETE FROM embeddings WHERE created_at < ?", (cutoff,))
+            count = self._conn.execute("SELECT COUNT(*) FROM grades").fetchone()[0]
+            if count > self.max_entries:
+                removed += self._conn.execute(
+                    "DELETE FROM grades WHERE key IN (SELECT key FROM grades ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                ).rowcount
+            self._conn.commit()
+        return removed
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM grades").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,279 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from grading_pipeline import LLM_MODEL
+from grading_service import GradingCancelled, grade_csv, save_results
+from grading_scheduler import LLMScheduler
+from model_manager import get_model_manager
+from run_journal import RunJournal
+
+# Фоновые задания проверки. Очередь живёт в процессе Streamlit (через st.cache_resource),
+# а состояние заданий хранится в temp/jobs.sqlite, поэтому сессии могут опрашивать статус,
+# отменять задания и скачивать результаты независимо от перезапусков скрипта.
+# Результаты готового задания лежат в хранилище результатов (results_store.py) под его run_id.
+# Пока задание в очереди или выполняется, его модель закреплена в памяти Ollama (model_manager.py).
+#
+# Одновременно выполняются до JOB_WORKERS заданий. Следующим запускается задание той сессии,
+# у которой сейчас меньше всего выполняющихся заданий (при равенстве — самое раннее), а запросы
+# выполняющихся заданий к LLM проходят через общий LLMScheduler (grading_scheduler.py).
+# Задания с одним run_id пишут в один журнал прогона, поэтому выполняются строго по очереди:
+# следующее начнётся, когда закончится предыдущее, и восстановит его оценки из журнала.
+
+JOBS_DB_PATH = "temp/jobs.sqlite"
+JOBS_DIR = "temp/jobs"
+
+STATUS_QUEUED = "в очереди"
+STATUS_RUNNING = "выполняется"
+STATUS_DONE = "готово"
+STATUS_FAILED = "ошибка"
+STATUS_CANCELLED = "отменено"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+JOB_WORKERS = 3
+
+JOB_COLUMNS = (
+    "job_id", "run_id", "discipline", "lecture", "status", "created_at", "started_at", "finished_at",
+    "done", "total", "error", "params", "stats", "owner",
+)
+
+
+class JobRunner:
+
+    def __init__(self, cache=None, db_path=JOBS_DB_PATH, jobs_dir=JOBS_DIR, workers=JOB_WORKERS, scheduler=None):
+        self.cache = cache
+        self.scheduler = scheduler or LLMScheduler()
+        self.db_path = db_path
+        self.jobs_dir = jobs_dir
+        os.makedirs(jobs_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._cancel_events = {}
+        # Выбор следующего задания и отмена задания из очереди не должны пересекаться
+        self._claim_lock = threading.Lock()
+        # Заявки на поток, которым нечего было запустить: все задания очереди ждали конца
+        # заданий с тем же run_id. Они подаются снова, когда какое-нибудь задание закончится
+        self._deferred_claims = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grading-job")
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                run_id TEXT,
+                discipline TEXT,
+                lecture TEXT,
+                status TEXT,
+                created_at REAL,
+                started_at REAL,
+                finished_at REAL,
+                done INTEGER DEFAULT 0,
+                total INTEGER DEFAULT 0,
+                error TEXT,
+                params TEXT,
+                stats TEXT,
+                owner TEXT
+            )
+        """)
+        # База заданий, созданная до появления колонки owner. Колонки results_path и log_path
+        # старых баз (до хранилища результатов) не используются и остаются пустыми
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._conn.commit()
+        self._resume_unfinished()
+
+    def _update(self, job_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def _resume_unfinished(self):
+        # Задания, прерванные перезапуском сервера, ставятся в очередь снова;
+        # журнал прогона позволит не проверять заново уже оценённые ответы
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", ACTIVE_STATUSES
+            ).fetchall()
+        for (job_id,) in rows:
+            self._update(job_id, status=STATUS_QUEUED)
+        for (job_id,) in rows:
+            self._schedule(job_id)
+
+    @staticmethod
+    def _model(job):
+        return json.loads(job["params"] or "{}").get("model", LLM_MODEL)
+
+    def _schedule(self, job_id):
+        # Каждое задание в очереди — одна заявка на рабочий поток; какое задание она
+        # запустит, решает _claim_next в момент, когда поток освободится
+        self._cancel_events[job_id] = threading.Event()
+        get_model_manager().pin(self._model(self.get(job_id)))
+        self._executor.submit(self._run_next)
+
+    def queue_order(self):
+        """job_id заданий в очереди в порядке запуска: сессии чередуются, внутри сессии — по времени."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, status, owner FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                ACTIVE_STATUSES
+            ).fetchall()
+        load = {}
+        queued = {}
+        for job_id, status, owner in rows:
+            load.setdefault(owner, 0)
+            if status == STATUS_RUNNING:
+                load[owner] += 1
+            else:
+                queued.setdefault(owner, []).append(job_id)
+        order = []
+        while queued:
+            # Сессия с наименьшим числом запущенных заданий; при равенстве — с самым ранним заданием
+            owner = min(queued, key=lambda o: load[o])
+            order.append(queued[owner].pop(0))
+            load[owner] += 1
+            if not queued[owner]:
+                del queued[owner]
+        return order
+
+    def queue_position(self, job_id):
+        """Место задания в очереди (с 1) и длина очереди или None, если задание не ждёт запуска."""
+        order = self.queue_order()
+        if job_id not in order:
+            return None
+        return order.index(job_id) + 1, len(order)
+
+    def _run_ids(self, statuses):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT run_id FROM jobs WHERE status IN ({', '.join('?' for _ in statuses)})",
+                statuses
+            ).fetchall()
+        return {run_id for (run_id,) in rows}
+
+    def _claim_next(self):
+        with self._claim_lock:
+            order = self.queue_order()
+            running_run_ids = self._run_ids((STATUS_RUNNING,))
+            job = next(
+                (job for job in map(self.get, order) if job["run_id"] not in running_run_ids), None
+            )
+            if job is None:
+                if order:
+                    self._deferred_claims += 1
+                return None
+            self._update(job["job_id"], status=STATUS_RUNNING, started_at=time.time())
+            return self.get(job["job_id"])
+
+    def _run_next(self):
+        job = self._claim_next()
+        if job is None:
+            return
+        try:
+            self._run(job)
+        finally:
+            get_model_manager().release(self._model(job))
+            with self._claim_lock:
+                deferred_claims, self._deferred_claims = self._deferred_claims, 0
+            for _ in range(deferred_claims):
+                self._executor.submit(self._run_next)
+
+    def submit(self, csv_bytes, discipline, lecture_id, run_id, restart=False, owner=None, exclusive=False,
+               **params):
+        """Ставит задание в очередь. С restart или exclusive отказывает (ValueError), если задание
+        того же прогона уже в очереди или выполняется."""
+        job_id = uuid.uuid4().hex[:12]
+        with open(os.path.join(self.jobs_dir, f"{job_id}.csv"), "wb") as f:
+            f.write(csv_bytes)
+        # Журнал прогона нельзя удалять, пока в него пишет или будет писать другое задание;
+        # проверка и постановка в очередь идут под тем же замком, что и запуск заданий
+        with self._claim_lock:
+            if (restart or exclusive) and run_id in self._run_ids(ACTIVE_STATUSES):
+                os.remove(os.path.join(self.jobs_dir, f"{job_id}.csv"))
+                raise ValueError(
+                    f"Прогон {run_id} уже в очереди или выполняется. Запустить его снова можно "
+                    f"после завершения или отмены этого задания."
+                )
+            if restart:
+                RunJournal(run_id).discard()
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, run_id, discipline, lecture, status, created_at, params, owner) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, run_id, discipline, lecture_id, STATUS_QUEUED, time.time(),
+                     json.dumps(params, ensure_ascii=False), owner)
+                )
+                self._conn.commit()
+        self._schedule(job_id)
+        return job_id
+
+    def resubmit(self, job_id):
+        """Новое задание по CSV и параметрам готового: журнал прогона сохраняется,
+        поэтому в LLM снова уходят только ответы, запрос по которым не удался. Повторное нажатие,
+        пока такое задание ещё не закончилось, отклоняется (ValueError)."""
+        job = self.get(job_id)
+        with open(os.path.join(self.jobs_dir, f"{job_id}.csv"), "rb") as f:
+            csv_bytes = f.read()
+        return self.submit(csv_bytes, job["discipline"], job["lecture"], job["run_id"], owner=job["owner"],
+                           exclusive=True, **json.loads(job["params"] or "{}"))
+
+    def cancel(self, job_id):
+        event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+        with self._claim_lock:
+            job = self.get(job_id)
+            if job and job["status"] == STATUS_QUEUED:
+                # Задание из очереди уже не будет запущено: его заявка на поток запустит следующее
+                self._update(job_id, status=STATUS_CANCELLED, finished_at=time.time())
+                self._cancel_events.pop(job_id, None)
+                get_model_manager().release(self._model(job))
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row else None
+
+    def list_jobs(self, limit=50):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(zip(JOB_COLUMNS, row)) for row in rows]
+
+    def _run(self, job):
+        job_id = job["job_id"]
+        cancel_event = self._cancel_events[job_id]
+        params = json.loads(job["params"] or "{}")
+        last_update = {"at": 0.0}
+
+        def on_progress(done, total):
+            now = time.monotonic()
+            if now - last_update["at"] >= 0.5 or done == total:
+                last_update["at"] = now
+                self._update(job_id, done=done, total=total)
+
+        try:
+            with open(os.path.join(self.jobs_dir, f"{job_id}.csv"), "rb") as f:
+                csv_bytes = f.read()
+            results_df, log_df, stats = grade_csv(
+                csv_bytes, job["discipline"], job["lecture"], run_id=job["run_id"], cache=self.cache,
+                on_progress=on_progress, cancel_event=cancel_event, scheduler=self.scheduler,
+                owner=job["owner"] or job_id, scheduler_label=job_id, **params
+            )
+            save_results(results_df, log_df, job["discipline"], job["lecture"], job["run_id"], stats=stats)
+            self._update(
+                job_id, status=STATUS_DONE, finished_at=time.time(),
+                stats=json.dumps(stats, ensure_ascii=False, default=str)
+            )
+        except GradingCancelled:
+            self._update(job_id, status=STATUS_CANCELLED, finished_at=time.time())
+        except Exception as e:
+            self._update(job_id, status=STATUS_FAILED, finished_at=time.time(), error=str(e))
+        finally:
+            self._cancel_events.pop(job_id, None)
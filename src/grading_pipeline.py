@@ -0,0 +1,671 @@
+import asyncio
+import json
+import math
+import re
+import time
+import numpy as np
+import pandas as pd
+from adaptive_limiter import AdaptiveLimiter
+from ollama_pool import OllamaPool
+from grading_cache import GradingCache
+from grading_settings import DEFAULT_SETTINGS, get_settings
+from prescoring import (
+    TIER_EMPTY, TIER_EXACT, TIER_CACHE, TIER_CLUSTER, TIER_EMBEDDING, TIER_LLM, TIER_UNPARSED, TIER_FAILED,
+    TIER_CASCADE, exact_match_score, embedding_prescore
+)
+from answer_clustering import cluster_tasks
+from model_manager import LLM_OPTIONS, get_model_manager
+from grading_telemetry import RunTelemetry, get_telemetry_registry, record_response, mark_parse_failure
+from grading_retry import TRANSIENT, RetryPolicy, classify_error
+
+# Общий конвейер проверки: все пары (студент, вопрос) из CSV ставятся в одну очередь
+# и обрабатываются асинхронно; число одновременных запросов к LLM подбирается
+# адаптивно (AdaptiveLimiter) в пределах от 1 до MAX_WORKERS.
+# В пакетном режиме (batch_size > 1) ответы разных студентов на один вопрос оцениваются
+# одним запросом со структурированным JSON-ответом.
+# Перед LLM работает предварительная оценка (prescoring.py): пустые ответы, совпадение
+# с эталоном, кэш и близость эмбеддингов решают очевидные случаи без генерации.
+# Запросы распределяются по серверам Ollama из OLLAMA_HOSTS (ollama_pool.py).
+# Почти одинаковые ответы на вопрос объединяются в кластеры (answer_clustering.py),
+# оценивается только представитель кластера.
+# Каждый запрос к LLM записывается в телеметрию (grading_telemetry.py): ожидание лимита,
+# задержка, токены и исход; сводка прогона возвращается в stats["telemetry"].
+# Быстрый режим (настройка fast_scoring) просит у модели JSON {"score": N} по схеме,
+# ограничивает генерацию несколькими токенами и обрывает поток, как только оценка получена.
+# Временные ошибки запросов не превращаются в 0 баллов: ответ откладывается и проверяется
+# повторно с экспоненциальной задержкой (grading_retry.py). Ответы, которые так и не удалось
+# оценить, получают способ оценки TIER_FAILED и пометку "Требует перепроверки" в логе.
+# Задания из очереди дополнительно проходят общий для процесса предел запросов
+# (grading_scheduler.py), который делит сервер между сессиями и прогонами.
+# Каскад моделей (настройка cascade_enabled): сначала ответ оценивает малая модель
+# (cascade_model) и сообщает уверенность — вероятность токена оценки по logprobs или
+# совпадение двух сэмплов. Основной модели передаются только неуверенные ответы.
+
+LLM_MODEL = "mistral"
+MAX_WORKERS = 10
+BATCH_SIZE = 1
+# Увеличивать при любом изменении текста промпта, чтобы не брать старые оценки из кэша
+PROMPT_VERSION = 2
+BATCH_PROMPT_VERSION = "batch-2"
+FAST_PROMPT_VERSION = "fast-1"
+# Ответ быстрого режима — {"score": N}: хватает десятка токенов, "}" завершает генерацию
+FAST_NUM_PREDICT = 10
+FAST_STOP = ["}"]
+# Каскад: способы оценки уверенности малой модели
+SIGNAL_LOGPROBS = "logprobs"
+SIGNAL_AGREEMENT = "agreement"
+CASCADE_SIGNALS = (SIGNAL_LOGPROBS, SIGNAL_AGREEMENT)
+# Два сэмпла для SIGNAL_AGREEMENT: с ненулевой температурой и разными seed
+CASCADE_SAMPLE_TEMPERATURE = 0.8
+CASCADE_SEEDS = (1, 2)
+SCORE_COLUMN = "Оценка (из 10)"
+RECHECK_COLUMN = "Требует перепроверки"
+
+# Всё общее для вопроса стоит в начале запроса: системное сообщение одинаково для всех
+# запросов, за ним вопрос и эталон, и только в конце — ответ студента. Так Ollama
+# переиспользует KV-кэш общего префикса для всех студентов, отвечающих на этот вопрос
+# (при неизменном num_ctx, см. model_manager.py).
+SYSTEM_PROMPT = """Ты — преподаватель. Проверь, насколько ответ студента совпадает с эталонным по смыслу. Оценивай нестрого. Полное соответствие необязательно.
+
+Оцени по шкале:
+- 0 — не по теме
+- 1 — частично верно
+- 2 — полностью верно, но могут быть недочеты
+
+Ответь только числом: 0, 1 или 2."""
+
+PROMPT_TEMPLATE = """Вопрос: {question}
+Эталонный ответ: {reference_answer}
+Ответ студента: {student_answer}"""
+
+BATCH_SYSTEM_PROMPT = """Ты — преподаватель. Проверь, насколько каждый из ответов студентов совпадает с эталонным по смыслу. Оценивай нестрого. Полное соответствие необязательно. Оценивай каждый ответ независимо от остальных.
+
+Оцени каждый ответ по шкале:
+- 0 — не по теме
+- 1 — частично верно
+- 2 — полностью верно, но могут быть недочеты
+
+Верни JSON вида {"scores": [...]}, где scores — по одному числу (0, 1 или 2) на каждый ответ в порядке ответов."""
+
+FAST_SYSTEM_PROMPT = """Ты — преподаватель. Проверь, насколько ответ студента совпадает с эталонным по смыслу. Оценивай нестрого. Полное соответствие необязательно.
+
+Оцени по шкале:
+- 0 — не по теме
+- 1 — частично верно
+- 2 — полностью верно, но могут быть недочеты
+
+Верни только JSON вида {"score": N}, где N — 0, 1 или 2."""
+
+FAST_FORMAT = {
+    "type": "object",
+    "properties": {"score": {"type": "integer", "enum": [0, 1, 2]}},
+    "required": ["score"],
+}
+
+BATCH_PROMPT_TEMPLATE = """Вопрос: {question}
+Эталонный ответ: {reference_answer}
+
+Ответы студентов ({count}):
+{student_answers}"""
+
+
+def prompt_messages(system_prompt, prompt):
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+
+
+def batch_format(count):
+    return {
+        "type": "object",
+        "properties": {
+            "scores": {
+                "type": "array",
+                "items": {"type": "integer", "enum": [0, 1, 2]},
+                "minItems": count,
+                "maxItems": count,
+            }
+        },
+        "required": ["scores"],
+    }
+
+
+class UnparsedReply(ValueError):
+    """Модель ответила, но оценки в ответе нет. Сервер при этом исправен."""
+
+    def __init__(self, reply):
+        super().__init__(f"в ответе модели нет оценки: {reply[:200]}")
+        self.reply = reply
+
+
+def parse_score(reply):
+    score = int([s for s in reply.split() if s.isdigit()][0])
+    return min(max(score, 0), 2)
+
+
+def parse_fast_score(reply):
+    """Оценка из (возможно, оборванного) ответа {"score": N} или None."""
+    match = re.search(r'"score"\s*:\s*([012])\b', reply)
+    return int(match.group(1)) if match else None
+
+
+async def grade_with_llm(client, question, reference_answer, student_answer, model=LLM_MODEL, call=None):
+    # Ошибки не перехватываются: по ним AdaptiveLimiter снижает нагрузку на сервер.
+    # call — запись телеметрии о запросе (RunTelemetry.start_call)
+    prompt = PROMPT_TEMPLATE.format(
+        question=question, reference_answer=reference_answer, student_answer=student_answer
+    )
+    response = await client.chat(
+        model=model, messages=prompt_messages(SYSTEM_PROMPT, prompt), options=LLM_OPTIONS,
+        keep_alive=get_model_manager().keep_alive(model)
+    )
+    record_response(call, response)
+    reply = response["message"]["content"].strip()
+    try:
+        return parse_score(reply), reply
+    except (IndexError, ValueError):
+        mark_parse_failure(call)
+        raise UnparsedReply(reply)
+
+
+async def fast_grade_with_llm(client, question, reference_answer, student_answer, model=LLM_MODEL, call=None):
+    """Быстрая оценка: JSON по схеме, не больше FAST_NUM_PREDICT токенов, поток обрывается на оценке."""
+    prompt = PROMPT_TEMPLATE.format(
+        question=question, reference_answer=reference_answer, student_answer=student_answer
+    )
+    reply, parts, last = await client.chat_until(
+        parse_fast_score,
+        model=model, messages=prompt_messages(FAST_SYSTEM_PROMPT, prompt), format=FAST_FORMAT,
+        options=dict(LLM_OPTIONS, num_predict=FAST_NUM_PREDICT, stop=FAST_STOP),
+        keep_alive=get_model_manager().keep_alive(model)
+    )
+    if last is not None and last.get("done"):
+        record_response(call, last)
+    elif call is not None:
+        # Поток оборван до итоговой части со статистикой: одна часть — один токен
+        call["eval_count"] = parts
+        call["early_stop"] = True
+    score = parse_fast_score(reply)
+    if score is None:
+        mark_parse_failure(call)
+        raise UnparsedReply(reply)
+    return score, reply.strip()
+
+
+def score_confidence(response):
+    """Вероятность токена оценки по logprobs ответа или None, если сервер их не вернул."""
+    text = ""
+    for entry in response.get("logprobs") or []:
+        text += entry["token"]
+        # Токен, на котором в тексте появилась оценка, и есть токен оценки
+        if parse_fast_score(text) is not None:
+            return math.exp(entry["logprob"])
+    return None
+
+
+async def cascade_sample_with_llm(client, question, reference_answer, student_answer, model, call=None,
+                                  logprobs=False, options=None):
+    """Один ответ малой модели каскада в формате быстрого режима. Возвращает (score, reply, response)."""
+    prompt = PROMPT_TEMPLATE.format(
+        question=question, reference_answer=reference_answer, student_answer=student_answer
+    )
+    response = await client.chat(
+        model=model, messages=prompt_messages(FAST_SYSTEM_PROMPT, prompt), format=FAST_FORMAT,
+        options=dict(LLM_OPTIONS, num_predict=FAST_NUM_PREDICT, stop=FAST_STOP, **(options or {})),
+        keep_alive=get_model_manager().keep_alive(model), logprobs=logprobs or None
+    )
+    record_response(call, response)
+    reply = response["message"]["content"]
+    score = parse_fast_score(reply)
+    if score is None:
+        mark_parse_failure(call)
+        raise UnparsedReply(reply)
+    return score, reply.strip(), response
+
+
+def parse_batch_scores(reply, count):
+    try:
+        scores = json.loads(reply)["scores"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    if not isinstance(scores, list) or len(scores) != count:
+        return None
+    if not all(isinstance(score, int) and not isinstance(score, bool) and 0 <= score <= 2 for score in scores):
+        return None
+    return scores
+
+
+async def grade_batch_with_llm(client, question, reference_answer, student_answers, model=LLM_MODEL, call=None):
+    """Оценивает несколько ответов на один вопрос одним запросом.
+
+    Возвращает (scores, reply); scores = None, если ответ модели не прошёл проверку.
+    """
+    numbered = "\n".join(f"{i}. {' '.join(answer.split())}" for i, answer in enumerate(student_answers, 1))
+    prompt = BATCH_PROMPT_TEMPLATE.format(
+        question=question, reference_answer=reference_answer,
+        student_answers=numbered, count=len(student_answers)
+    )
+    response = await client.chat(
+        model=model,
+        messages=prompt_messages(BATCH_SYSTEM_PROMPT, prompt),
+        format=batch_format(len(student_answers)),
+        options=LLM_OPTIONS,
+        keep_alive=get_model_manager().keep_alive(model),
+    )
+    record_response(call, response)
+    reply = response["message"]["content"].strip()
+    scores = parse_batch_scores(reply, len(student_answers))
+    if scores is None:
+        mark_parse_failure(call)
+    return scores, reply
+
+
+def build_tasks(answers_df, ethalons):
+    """Задания на оценку из длинной таблицы ответов (см. answers_csv.read_answers)."""
+    question_ids = np.array(ethalons["Question_ID"].astype(str).tolist(), dtype=object)
+    questions = np.array(ethalons["Question"].astype(str).tolist(), dtype=object)
+    answers = np.array(ethalons["Answer"].astype(str).tolist(), dtype=object)
+    num_questions = len(questions)
+
+    answers_df = answers_df[answers_df["question_num"] <= num_questions]
+    question_index = answers_df["question_num"].to_numpy() - 1
+
+    return [
+        {
+            "student_pos": int(student_pos),
+            "student_id": student_id,
+            "question_num": int(question_num),
+            "question_id": question_id,
+            "question": question,
+            "reference": correct_ans,
+            "answer": student_ans,
+            "score": None,
+            "reply": None,
+        }
+        for student_pos, student_id, question_num, question_id, question, correct_ans, student_ans in zip(
+            answers_df["student_pos"], answers_df["student_id"], answers_df["question_num"],
+            question_ids[question_index], questions[question_index], answers[question_index],
+            answers_df["answer"]
+        )
+    ]
+
+
+def make_batches(pending, batch_size):
+    by_question = {}
+    for task in pending:
+        by_question.setdefault(task["question_id"], []).append(task)
+    return [
+        question_tasks[i:i + batch_size]
+        for question_tasks in by_question.values()
+        for i in range(0, len(question_tasks), batch_size)
+    ]
+
+
+async def _grade_pending(client, pending, model, cache, limiter, stats, on_result, batch_size, settings,
+                         telemetry, scheduler_run):
+    def finish(task):
+        key_name = "single_cache_key" if task.pop("graded_single", False) else "cache_key"
+        graded = [task]
+        for member in task.pop("cluster_members", []):
+            if task.get("failed"):
+                member["score"], member["tier"], member["failed"] = None, TIER_FAILED, True
+            else:
+                member["score"], member["tier"] = task["score"], TIER_CLUSTER
+            member["reply"] = f"Оценка представителя кластера {member['cluster']}: {task['reply']}"
+            graded.append(member)
+        for graded_task in graded:
+            stats["tiers"][graded_task["tier"]] += 1
+            if (cache is not None and task["tier"] == TIER_LLM
+                    and not task["reply"].startswith("Ошибка")):
+                cache.put(graded_task.get(key_name, graded_task["cache_key"]), graded_task["score"],
+                          graded_task["reply"])
+            if on_result:
+                on_result(graded_task)
+
+    if settings["embedding_enabled"]:
+        try:
+            undecided = await embedding_prescore(client, pending, settings, cache)
+        except Exception as e:
+            # Модель эмбеддингов недоступна — все ответы уходят в LLM
+            stats["embedding_error"] = str(e)
+            undecided = pending
+        undecided_ids = {id(task) for task in undecided}
+        for task in pending:
+            if id(task) not in undecided_ids:
+                finish(task)
+        pending = undecided
+
+    async def limited(kind, make_request, request_model=model, request_limiter=limiter):
+        call = telemetry.start_call(kind, request_model)
+        started_at, load = await request_limiter.acquire()
+        admitted = False
+        ok = False
+        try:
+            if scheduler_run is not None:
+                await scheduler_run.acquire()
+                admitted = True
+                # Ожидание общей очереди — не задержка сервера, AdaptiveLimiter её не учитывает
+                started_at = time.monotonic()
+            telemetry.acquired(call)
+            result = await make_request(call)
+            ok = True
+            return result
+        except UnparsedReply as e:
+            # Неразобранный ответ — не перегрузка сервера, лимит из-за него не снижается
+            ok = True
+            telemetry.failed(call, e)
+            raise
+        except Exception as e:
+            telemetry.failed(call, e)
+            raise
+        finally:
+            stats["llm_calls"] += 1
+            if admitted:
+                scheduler_run.release()
+            # Пакеты и одиночные запросы сравниваются каждый со своей базовой задержкой
+            await request_limiter.release(started_at, ok, kind, load)
+            telemetry.finish(call)
+
+    grade_one = fast_grade_with_llm if settings["fast_scoring"] else grade_with_llm
+
+    cascade_model = settings["cascade_model"]
+    # У малой модели своя задержка: с общим лимитом её быстрые ответы заставили бы
+    # AdaptiveLimiter считать основную модель перегруженной
+    cascade_limiter = AdaptiveLimiter(max_limit=limiter.max_limit)
+
+    async def cascade_single(task):
+        """Оценка малой моделью: (score, confidence) или None, если её ответа нет."""
+        ask = lambda call, **kwargs: cascade_sample_with_llm(
+            client, task["question"], task["reference"], task["answer"], cascade_model, call, **kwargs
+        )
+        try:
+            if settings["cascade_signal"] == SIGNAL_AGREEMENT:
+                samples = await asyncio.gather(*(
+                    limited("cascade", lambda call, seed=seed: ask(
+                        call, options={"temperature": CASCADE_SAMPLE_TEMPERATURE, "seed": seed}
+                    ), cascade_model, cascade_limiter)
+                    for seed in CASCADE_SEEDS
+                ))
+                scores = {score for score, _, _ in samples}
+                return samples[0][0], 1.0 if len(scores) == 1 else 0.0
+            score, _, response = await limited(
+                "cascade", lambda call: ask(call, logprobs=True), cascade_model, cascade_limiter
+            )
+            return score, score_confidence(response)
+        except Exception as e:
+            # Малая модель недоступна или ответила не по формату — ответ уходит основной модели
+            stats["cascade"]["errors"] += 1
+            stats["cascade"].setdefault("error", str(e))
+            return None
+
+    async def cascade_stage(tasks):
+        """Возвращает задачи, которые нужно передать основной модели."""
+        async def cascade_one(task):
+            return task, await cascade_single(task)
+
+        escalated = []
+        cascade_jobs = [asyncio.ensure_future(cascade_one(task)) for task in tasks]
+        try:
+            for future in asyncio.as_completed(cascade_jobs):
+                task, result = await future
+                stats["cascade"]["checked"] += 1
+                if result is None:
+                    escalated.append(task)
+                    continue
+                score, confidence = result
+                if confidence is not None and confidence >= settings["cascade_threshold"]:
+                    stats["cascade"]["accepted"] += 1
+                    task["score"], task["tier"] = score, TIER_CASCADE
+                    task["reply"] = f"{score} (модель {cascade_model}, уверенность {confidence:.2f})"
+                    finish(task)
+                else:
+                    if confidence is None:
+                        stats["cascade"]["no_confidence"] += 1
+                    # Оценка малой модели сохраняется для сравнения с основной
+                    task["cascade_score"] = score
+                    escalated.append(task)
+        finally:
+            for job in cascade_jobs:
+                job.cancel()
+        stats["cascade"]["escalated"] = len(escalated)
+        return escalated
+
+    if settings["cascade_enabled"] and pending:
+        pending = await cascade_stage(pending)
+
+    retry_policy = RetryPolicy(len(pending))
+
+    async def grade_single(task, kind="single"):
+        task["graded_single"] = True
+        try:
+            task["score"], task["reply"] = await limited(kind, lambda call: grade_one(
+                client, task["question"], task["reference"], task["answer"], model, call
+            ))
+        except UnparsedReply as e:
+            task["score"], task["reply"], task["unparsed"] = 0, f"Ответ не разобран: {e.reply[:500]}", True
+        except Exception as e:
+            # Решение о повторе принимается в цикле ниже; до него оценки у ответа нет
+            task["attempts"] = task.get("attempts", 0) + 1
+            task["score"], task["reply"], task["error"] = None, f"Ошибка: {e}", e
+        return [task]
+
+    async def retry_later(task):
+        # Задержка выдерживается вне лимита: ожидающий повтор не занимает слот запроса
+        await asyncio.sleep(retry_policy.delay(task["attempts"]))
+        return await grade_single(task, kind="retry")
+
+    async def retry_batch_later(batch):
+        await asyncio.sleep(retry_policy.delay(batch[0]["attempts"]))
+        return await grade_batch(batch)
+
+    async def grade_batch(batch):
+        if len(batch) == 1:
+            return await grade_single(batch[0])
+        try:
+            scores, reply = await limited("batch", lambda call: grade_batch_with_llm(
+                client, batch[0]["question"], batch[0]["reference"], [task["answer"] for task in batch], model,
+                call
+            ))
+        except Exception as e:
+            if classify_error(e) == TRANSIENT:
+                # Сервер перегружен или недоступен: пакет целиком повторяется с задержкой из бюджета
+                # повторов, а не рассыпается сразу на одиночные запросы к тому же серверу
+                for task in batch:
+                    task["attempts"] = task.get("attempts", 0) + 1
+                    task["score"], task["reply"], task["batch_error"] = None, f"Ошибка: {e}", e
+                return batch
+            scores = None
+        if scores is None:
+            # JSON не прошёл проверку или постоянная ошибка — оцениваем ответы пакета по одному
+            stats["batch_fallbacks"] += 1
+            graded = await asyncio.gather(*(grade_single(task) for task in batch))
+            return [task for tasks in graded for task in tasks]
+        for task, score in zip(batch, scores):
+            task["score"], task["reply"] = score, f"{score} (пакетная оценка)"
+        return batch
+
+    def complete(task, error):
+        if error is not None:
+            task["tier"], task["failed"] = TIER_FAILED, True
+        else:
+            task["tier"] = TIER_UNPARSED if task.pop("unparsed", False) else TIER_LLM
+            task.pop("failed", None)
+        task.pop("attempts", None)
+        cascade_score = task.pop("cascade_score", None)
+        if cascade_score is not None and task["tier"] == TIER_LLM:
+            stats["cascade"]["compared"] += 1
+            stats["cascade"]["agreed"] += cascade_score == task["score"]
+        finish(task)
+
+    jobs = {asyncio.ensure_future(grade_batch(batch)) for batch in make_batches(pending, max(batch_size, 1))}
+    try:
+        while jobs:
+            done, jobs = await asyncio.wait(jobs, return_when=asyncio.FIRST_COMPLETED)
+            for job in done:
+                graded = job.result()
+                batch_error = graded[0].get("batch_error")
+                if batch_error is not None:
+                    for task in graded:
+                        task.pop("batch_error", None)
+                    # Повтор пакета расходует бюджет повторов один раз, как один запрос
+                    if retry_policy.should_retry(batch_error, graded[0]["attempts"]):
+                        jobs.add(asyncio.ensure_future(retry_batch_later(graded)))
+                    else:
+                        for task in graded:
+                            complete(task, batch_error)
+                    continue
+                for task in graded:
+                    error = task.pop("error", None)
+                    if error is not None and retry_policy.should_retry(error, task["attempts"]):
+                        jobs.add(asyncio.ensure_future(retry_later(task)))
+                        continue
+                    complete(task, error)
+    finally:
+        # Прерванная проверка (отмена задания) не оставляет запросов и отложенных повторов
+        for job in jobs:
+            job.cancel()
+        stats["retries"] = retry_policy.stats()
+
+
+def grade_tasks(tasks, discipline, lecture_id, model=LLM_MODEL, cache=None,
+                max_workers=MAX_WORKERS, on_result=None, batch_size=BATCH_SIZE, settings=None):
+    """Оценивает все задачи через одну общую очередь и возвращает статистику прогона.
+
+    on_result(task) вызывается в вызывающем потоке по мере готовности каждой оценки.
+    settings — настройки дисциплины (grading_settings.get_settings).
+    """
+    return asyncio.run(grade_tasks_async(
+        tasks, discipline, lecture_id, model=model, cache=cache,
+        limiter=AdaptiveLimiter(max_limit=max_workers), on_result=on_result,
+        batch_size=batch_size, settings=settings
+    ))
+
+
+async def grade_tasks_async(tasks, discipline, lecture_id, model=LLM_MODEL, cache=None, limiter=None,
+                            client=None, on_result=None, batch_size=BATCH_SIZE, settings=None, scheduler_run=None):
+    """Асинхронный вариант grade_tasks.
+
+    Несколько прогонов в одном цикле событий могут делить общие limiter и client,
+    тогда они вместе загружают LLM в пределах одного адаптивного лимита.
+    scheduler_run — прогон в общем планировщике процесса (LLMScheduler.open_run).
+    """
+    if limiter is None:
+        limiter = AdaptiveLimiter(max_limit=MAX_WORKERS)
+    if settings is None:
+        settings = get_settings(discipline)
+    else:
+        # Настройки заданий из очереди могли быть сохранены до появления новых ключей
+        settings = dict(DEFAULT_SETTINGS, **settings)
+    stats = {
+        "total": len(tasks),
+        "llm_calls": 0,
+        "batch_fallbacks": 0,
+        "tiers": {
+            tier: 0 for tier in (
+                TIER_EMPTY, TIER_EXACT, TIER_CACHE, TIER_CLUSTER, TIER_EMBEDDING, TIER_CASCADE, TIER_LLM,
+                TIER_UNPARSED, TIER_FAILED
+            )
+        },
+    }
+    if settings["cascade_enabled"]:
+        stats["cascade"] = {
+            "model": settings["cascade_model"],
+            "signal": settings["cascade_signal"],
+            "threshold": settings["cascade_threshold"],
+            "checked": 0,
+            "accepted": 0,
+            "escalated": 0,
+            "no_confidence": 0,
+            "errors": 0,
+            # Ответы, переданные основной модели: сколько сравнено и в скольких оценки совпали
+            "compared": 0,
+            "agreed": 0,
+        }
+    single_prompt_version = FAST_PROMPT_VERSION if settings["fast_scoring"] else PROMPT_VERSION
+    prompt_version = BATCH_PROMPT_VERSION if batch_size > 1 else single_prompt_version
+    telemetry = RunTelemetry(registry=get_telemetry_registry())
+    pending = []
+    owns_client = client is None
+    if owns_client:
+        client = OllamaPool()
+    # on_result может прервать проверку (отмена задания) уже на предварительных оценках:
+    # клиент закрывается, а телеметрия записывается и в этом случае
+    try:
+        for task in tasks:
+            if not task["answer"].strip():
+                task["score"], task["reply"], task["tier"] = 0, "Пустой ответ", TIER_EMPTY
+            elif settings["exact_match"] and exact_match_score(task["reference"], task["answer"]) is not None:
+                task["score"], task["reply"], task["tier"] = 2, "Совпадает с эталоном", TIER_EXACT
+            elif cache is not None:
+                task["cache_key"] = GradingCache.make_key(
+                    discipline, lecture_id, task["question_id"],
+                    task["answer"], task["reference"], model, prompt_version
+                )
+                if prompt_version != single_prompt_version:
+                    # Ответ из пакета может быть оценён и одиночным запросом (запасной путь, повтор);
+                    # такая оценка кэшируется под версией того промпта, который её дал
+                    task["single_cache_key"] = GradingCache.make_key(
+                        discipline, lecture_id, task["question_id"],
+                        task["answer"], task["reference"], model, single_prompt_version
+                    )
+                cached = cache.get(task["cache_key"])
+                if cached is None:
+                    pending.append(task)
+                    continue
+                task["score"], task["reply"] = cached
+                task["tier"] = TIER_CACHE
+            else:
+                pending.append(task)
+                continue
+            stats["tiers"][task["tier"]] += 1
+            if on_result:
+                on_result(task)
+
+        if settings["clustering_enabled"]:
+            pending = cluster_tasks(pending, settings["cluster_similarity"])
+
+        if pending:
+            # Модель загружается до первого запроса, а не в счёт его задержки
+            await asyncio.to_thread(get_model_manager().warm_up, model)
+            if settings["cascade_enabled"]:
+                await asyncio.to_thread(get_model_manager().warm_up, settings["cascade_model"])
+            await _grade_pending(
+                client, pending, model, cache, limiter, stats, on_result, batch_size, settings, telemetry,
+                scheduler_run
+            )
+    finally:
+        if owns_client:
+            await client.close()
+        telemetry.registry.write()
+    stats["concurrency"] = limiter.stats()
+    stats["telemetry"] = telemetry.summary()
+    if isinstance(client, OllamaPool):
+        stats["endpoints"] = client.stats()
+
+    if cache is not None:
+        cache.evict()
+    return stats
+
+
+def assemble_results(tasks):
+    results = {}
+    for task in sorted(tasks, key=lambda t: t["student_pos"]):
+        results.setdefault(task["student_pos"], {"ID студента": task["student_id"], SCORE_COLUMN: 0})
+        results[task["student_pos"]][SCORE_COLUMN] += task["score"] or 0
+
+    detailed_results = [
+        {
+            "ID студента": task["student_id"],
+            "Вопрос №": task["question_num"],
+            "Вопрос": task["question"],
+            "Эталонный ответ": task["reference"],
+            "Ответ студента": task["answer"],
+            "Балл": task["score"],
+            "Способ оценки": task.get("tier", ""),
+            "Кластер": task.get("cluster", ""),
+            RECHECK_COLUMN: "да" if task.get("failed") else "",
+        }
+        for task in sorted(tasks, key=lambda t: (t["student_pos"], t["question_num"]))
+    ]
+
+    results_df = pd.DataFrame(list(results.values()), columns=["ID студента", SCORE_COLUMN])
+    log_df = pd.DataFrame(detailed_results)
+    return results_df, log_df
@@ -0,0 +1,64 @@
+import asyncio
+import random
+import httpx
+import ollama
+
+# Повторы запросов к LLM. Временные ошибки (таймаут, разрыв соединения, сервер перегружен
+# или загружает модель) откладываются и повторяются с экспоненциальной задержкой и
+# случайным разбросом, пока не исчерпан бюджет повторов прогона. Постоянные ошибки
+# (модель не найдена, некорректный запрос) не повторяются. Ответ, который так и не удалось
+# оценить, помечается в журнале прогона как failed: повторный запуск того же прогона
+# (без "начать заново") отправит в LLM только такие ответы.
+
+MAX_ATTEMPTS = 4
+BASE_DELAY = 1.0
+MAX_DELAY = 30.0
+# Бюджет повторов на прогон: доля от числа ответов, уходящих в LLM, но не меньше MIN_RETRY_BUDGET
+RETRY_BUDGET_SHARE = 0.2
+MIN_RETRY_BUDGET = 10
+
+TRANSIENT = "временная"
+PERMANENT = "постоянная"
+# 408 — таймаут, 429 — слишком много запросов, 5xx — сервер перегружен или перезапускается
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def classify_error(error):
+    if isinstance(error, ollama.ResponseError):
+        return TRANSIENT if error.status_code in TRANSIENT_STATUS_CODES else PERMANENT
+    if isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return TRANSIENT
+    # ConnectionError клиента Ollama ("Failed to connect"), таймауты asyncio и ошибки сокета
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError, OSError)):
+        return TRANSIENT
+    return PERMANENT
+
+
+class RetryPolicy:
+    """Бюджет и задержки повторов одного прогона."""
+
+    def __init__(self, llm_tasks, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY,
+                 budget_share=RETRY_BUDGET_SHARE, min_budget=MIN_RETRY_BUDGET):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = max(min_budget, int(llm_tasks * budget_share))
+        self.retries = 0
+        self.exhausted = 0
+
+    def should_retry(self, error, attempt):
+        """attempt — номер неудачной попытки, начиная с 1. Тратит бюджет, если повтор разрешён."""
+        if classify_error(error) != TRANSIENT or attempt >= self.max_attempts:
+            return False
+        if self.retries >= self.budget:
+            self.exhausted += 1
+            return False
+        self.retries += 1
+        return True
+
+    def delay(self, attempt):
+        # Экспоненциальная задержка с полным разбросом: повторы после общего сбоя не приходят разом
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def stats(self):
+        return {"budget": self.budget, "retries": self.retries, "budget_exhausted": self.exhausted}
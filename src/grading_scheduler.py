@@ -0,0 +1,172 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from ollama_pool import get_hosts
+
+# Общий для процесса планировщик запросов к LLM. Каждое задание проверки работает в своём
+# потоке со своим циклом событий и своим AdaptiveLimiter, а сервер Ollama у всех один:
+# без общего предела два-три одновременных задания перегружают его, и задержка растёт
+# у всех. Планировщик ограничивает общее число запросов в работе и раздаёт освободившиеся
+# слоты по кругу: сначала между сессиями (владельцами заданий), внутри сессии — между
+# её прогонами. Поэтому большое задание одной сессии не задерживает маленькое задание другой.
+#
+# Предел задаётся переменной окружения GRADING_MAX_IN_FLIGHT, по умолчанию —
+# SLOTS_PER_HOST на каждый сервер из OLLAMA_HOSTS (как OLLAMA_NUM_PARALLEL у Ollama).
+
+MAX_IN_FLIGHT_ENV = "GRADING_MAX_IN_FLIGHT"
+SLOTS_PER_HOST = 4
+
+
+def default_max_in_flight():
+    value = os.environ.get(MAX_IN_FLIGHT_ENV, "").strip()
+    if value:
+        return max(int(value), 1)
+    return SLOTS_PER_HOST * len(get_hosts())
+
+
+class SchedulerRun:
+    """Запросы одного прогона в планировщике."""
+
+    def __init__(self, scheduler, key, owner, label):
+        self.scheduler = scheduler
+        self.key = key
+        self.owner = owner
+        self.label = label
+        self.waiters = deque()
+        self.in_flight = 0
+        self.granted = 0
+        self.wait_time = 0.0
+        self.opened_at = time.time()
+
+    async def acquire(self):
+        await self.scheduler.acquire(self)
+
+    def release(self):
+        self.scheduler.release(self)
+
+
+class LLMScheduler:
+
+    def __init__(self, max_in_flight=None):
+        self.max_in_flight = max_in_flight or default_max_in_flight()
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._runs = {}
+        # Владелец -> очередь его прогонов; порядок владельцев — круг раздачи слотов
+        self._owners = {}
+        self._owner_order = deque()
+        self._keys = itertools.count(1)
+
+    def open_run(self, owner=None, label=None):
+        """Регистрирует прогон; owner — сессия, между сессиями слоты делятся поровну."""
+        key = next(self._keys)
+        run = SchedulerRun(self, key, owner or key, label or key)
+        with self._lock:
+            self._runs[key] = run
+            if run.owner not in self._owners:
+                self._owners[run.owner] = deque()
+                self._owner_order.append(run.owner)
+            self._owners[run.owner].append(key)
+        return run
+
+    def close_run(self, run):
+        with self._lock:
+            self._runs.pop(run.key, None)
+            runs = self._owners.get(run.owner)
+            if runs is not None and run.key in runs:
+                runs.remove(run.key)
+                if not runs:
+                    del self._owners[run.owner]
+                    self._owner_order.remove(run.owner)
+
+    def _next_run(self):
+        for _ in range(len(self._owner_order)):
+            owner = self._owner_order[0]
+            self._owner_order.rotate(-1)
+            runs = self._owners[owner]
+            for _ in range(len(runs)):
+                run = self._runs[runs[0]]
+                runs.rotate(-1)
+                if run.waiters:
+                    return run
+        return None
+
+    def _grant(self):
+        # Вызывается под self._lock
+        while self.in_flight < self.max_in_flight:
+            run = self._next_run()
+            if run is None:
+                return
+            loop, future, queued_at = run.waiters.popleft()
+            self.in_flight += 1
+            run.in_flight += 1
+            run.granted += 1
+            run.wait_time += time.monotonic() - queued_at
+            try:
+                loop.call_soon_threadsafe(self._deliver, run, future)
+            except RuntimeError:
+                # Цикл событий прогона уже закрыт — слот никому не выдан
+                self.in_flight -= 1
+                run.in_flight -= 1
+
+    def _deliver(self, run, future):
+        # Выполняется в цикле событий ожидающего прогона
+        if future.cancelled():
+            self.release(run)
+        else:
+            future.set_result(None)
+
+    async def acquire(self, run):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            waiting = any(other.waiters for other in self._runs.values())
+            if self.in_flight < self.max_in_flight and not waiting:
+                self.in_flight += 1
+                run.in_flight += 1
+                run.granted += 1
+                return
+            run.waiters.append((loop, future, time.monotonic()))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = [waiter for waiter in run.waiters if waiter[1] is future]
+                for waiter in queued:
+                    run.waiters.remove(waiter)
+            # Слот успели выдать, но задача отменена уже после этого — вернуть его
+            if not queued and future.done() and not future.cancelled():
+                self.release(run)
+            raise
+
+    def release(self, run):
+        with self._lock:
+            self.in_flight -= 1
+            run.in_flight -= 1
+            self._grant()
+
+    def snapshot(self):
+        """Состояние планировщика для интерфейса: общие счётчики и строки по активным прогонам."""
+        with self._lock:
+            runs = [
+                {
+                    "key": run.key,
+                    "owner": run.owner,
+                    "label": run.label,
+                    "in_flight": run.in_flight,
+                    "waiting": len(run.waiters),
+                    "granted": run.granted,
+                    "avg_wait": run.wait_time / run.granted if run.granted else 0.0,
+                }
+                for run in self._runs.values()
+            ]
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "waiting": sum(row["waiting"] for row in runs),
+                "owners": len(self._owners),
+                "runs": runs,
+            }
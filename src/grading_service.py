@@ -0,0 +1,108 @@
+import asyncio
+import pandas as pd
+from adaptive_limiter import AdaptiveLimiter
+from answers_csv import read_answers
+from grading_pipeline import (
+    LLM_MODEL, MAX_WORKERS, BATCH_SIZE, SCORE_COLUMN, build_tasks, grade_tasks_async, assemble_results
+)
+from question_store import get_question_store
+from results_store import get_results_store
+from run_journal import RunJournal, make_run_id
+
+# Проверка одного CSV-файла целиком, без Streamlit: используется фоновыми заданиями
+# и консольным запуском.
+
+
+class GradingCancelled(Exception):
+    pass
+
+
+def load_ethalons(discipline, lecture_id):
+    return get_question_store().questions(discipline, lecture_id)
+
+
+def grade_csv(csv_bytes, discipline, lecture_id, run_id=None, cache=None, model=LLM_MODEL,
+              max_workers=MAX_WORKERS, batch_size=BATCH_SIZE, settings=None, restart=False,
+              on_progress=None, cancel_event=None, scheduler=None, owner=None, scheduler_label=None):
+    """Проверяет ответы из CSV с записью в журнал прогона. Возвращает (results_df, log_df, stats).
+
+    on_progress(done, total) вызывается после каждой готовой оценки; установленный
+    cancel_event прерывает проверку исключением GradingCancelled (журнал при этом сохраняется).
+    scheduler — общий планировщик запросов процесса (grading_scheduler.py), owner — сессия,
+    scheduler_label — подпись прогона в планировщике (по умолчанию run_id).
+    """
+    return asyncio.run(grade_csv_async(
+        csv_bytes, discipline, lecture_id, run_id=run_id, cache=cache, model=model,
+        limiter=AdaptiveLimiter(max_limit=max_workers), batch_size=batch_size, settings=settings,
+        restart=restart, on_progress=on_progress, cancel_event=cancel_event, scheduler=scheduler, owner=owner,
+        scheduler_label=scheduler_label
+    ))
+
+
+async def grade_csv_async(csv_bytes, discipline, lecture_id, run_id=None, cache=None, model=LLM_MODEL,
+                          limiter=None, client=None, batch_size=BATCH_SIZE, settings=None, restart=False,
+                          on_progress=None, cancel_event=None, scheduler=None, owner=None,
+                          scheduler_label=None):
+    ethalons = load_ethalons(discipline, lecture_id)
+    tasks = build_tasks(read_answers(csv_bytes, num_questions=len(ethalons)), ethalons)
+
+    journal = RunJournal(run_id or make_run_id(discipline, lecture_id, csv_bytes))
+    if restart:
+        journal.discard()
+    journal.start(discipline=discipline, lecture=lecture_id, total=len(tasks))
+    remaining_tasks = journal.restore(tasks)
+    progress = {"done": len(tasks) - len(remaining_tasks)}
+
+    def on_result(task):
+        journal.append(task)
+        progress["done"] += 1
+        if on_progress:
+            on_progress(progress["done"], len(tasks))
+        if cancel_event is not None and cancel_event.is_set():
+            raise GradingCancelled()
+
+    if on_progress:
+        on_progress(progress["done"], len(tasks))
+    # По подписи прогона в планировщике интерфейс находит очередь своего задания
+    scheduler_run = (
+        scheduler.open_run(owner, scheduler_label or journal.run_id) if scheduler is not None else None
+    )
+    try:
+        stats = await grade_tasks_async(
+            remaining_tasks, discipline, lecture_id, model=model, cache=cache, limiter=limiter,
+            client=client, on_result=on_result, batch_size=batch_size, settings=settings,
+            scheduler_run=scheduler_run
+        )
+        journal.mark_finished()
+    finally:
+        journal.close()
+        if scheduler_run is not None:
+            scheduler.close_run(scheduler_run)
+
+    if scheduler_run is not None:
+        stats["scheduler"] = {
+            "max_in_flight": scheduler.max_in_flight,
+            "granted": scheduler_run.granted,
+            "avg_wait": scheduler_run.wait_time / scheduler_run.granted if scheduler_run.granted else 0.0,
+        }
+
+    stats["restored"] = len(tasks) - len(remaining_tasks)
+    stats["run_id"] = journal.run_id
+    results_df, log_df = assemble_results(tasks)
+    return results_df, log_df, stats
+
+
+def journal_totals(run_id):
+    """Промежуточные суммы баллов по студентам из журнала незавершённого прогона."""
+    records = RunJournal(run_id).records.values()
+    if not records:
+        return pd.DataFrame(columns=["ID студента", SCORE_COLUMN, "Проверено ответов"])
+    records_df = pd.DataFrame(list(records))
+    totals = records_df.groupby("student_id", sort=False).agg(score=("score", "sum"), graded=("score", "size"))
+    totals = totals.reset_index()
+    totals.columns = ["ID студента", SCORE_COLUMN, "Проверено ответов"]
+    return totals
+
+
+def save_results(results_df, log_df, discipline, lecture_id, run_id, stats=None):
+    return get_results_store().save_run(run_id, discipline, lecture_id, results_df, log_df, stats=stats)
@@ -0,0 +1,54 @@
+import json
+import os
+
+# Настройки проверки: значения по умолчанию и переопределения для отдельных дисциплин
+# в data/grading_settings.json вида {"Дисциплина": {"accept_similarity": 0.95, ...}}.
+
+SETTINGS_PATH = "data/grading_settings.json"
+
+DEFAULT_SETTINGS = {
+    # Предварительная оценка без генерации. Эмбеддинги ставят 0 или 2 балла без LLM, а пороги
+    # близости не откалиброваны (nomic-embed-text обучена в основном на английских текстах),
+    # поэтому по умолчанию выключены: пороги подбираются для каждой дисциплины отдельно
+    "exact_match": True,
+    "embedding_enabled": False,
+    "embedding_model": "nomic-embed-text",
+    "accept_similarity": 0.92,
+    "reject_similarity": 0.35,
+    # Кластеризация почти одинаковых ответов (коэффициент Жаккара по шинглам). Оценка представителя
+    # переносится на весь кластер без LLM, поэтому по умолчанию выключена: порог стоит проверить
+    # на реальных ответах дисциплины
+    "clustering_enabled": False,
+    "cluster_similarity": 0.9,
+    # Быстрая оценка LLM: JSON по схеме, несколько токенов и обрыв потока на оценке
+    "fast_scoring": True,
+    # Каскад: малая модель оценивает первой, основной модели уходят только неуверенные ответы.
+    # cascade_signal — "logprobs" (вероятность токена оценки не ниже cascade_threshold)
+    # или "agreement" (два сэмпла малой модели дали одну оценку)
+    "cascade_enabled": False,
+    "cascade_model": "qwen2.5:0.5b",
+    "cascade_signal": "logprobs",
+    "cascade_threshold": 0.9,
+}
+
+
+def load_all_settings(path=SETTINGS_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_settings(discipline, path=SETTINGS_PATH):
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(load_all_settings(path).get(str(discipline), {}))
+    return settings
+
+
+def save_discipline_settings(discipline, overrides, path=SETTINGS_PATH):
+    all_settings = load_all_settings(path)
+    all_settings[str(discipline)] = {k: v for k, v in overrides.items() if DEFAULT_SETTINGS.get(k) != v}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(all_settings, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
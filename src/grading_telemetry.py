@@ -0,0 +1,302 @@
+import math
+import os
+import threading
+import time
+import numpy as np
+
+# Телеметрия запросов к LLM. Для каждого запроса записываются ожидание в очереди
+# адаптивного лимита, задержка ответа, число токенов и длительности из ответа Ollama
+# (prompt_eval_count, eval_count, *_duration) и исход: ответ разобран, ответ без оценки
+# или исключение. Сводка прогона попадает в его статистику (stats["telemetry"]),
+# счётчики по моделям копятся в процессе и пишутся в temp/metrics.prom в текстовом
+# формате Prometheus (например, для textfile collector у node_exporter).
+
+METRICS_PATH = "temp/metrics.prom"
+WRITE_INTERVAL = 5.0
+# Границы гистограмм задержки, с: от быстрых пакетов до долгой генерации на CPU
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+OUTCOME_OK = "ok"
+OUTCOME_PARSE_ERROR = "parse_error"
+OUTCOME_ERROR = "error"
+OUTCOMES = (OUTCOME_OK, OUTCOME_PARSE_ERROR, OUTCOME_ERROR)
+
+# Поля ответа Ollama: длительности в наносекундах
+RESPONSE_COUNTS = ("prompt_eval_count", "eval_count")
+RESPONSE_DURATIONS = ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_telemetry_registry(path=METRICS_PATH):
+    """Один набор счётчиков на процесс."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TelemetryRegistry(path)
+        return _registry
+
+
+def record_response(call, response):
+    """Переносит в запись о запросе токены и длительности из ответа Ollama."""
+    if call is None:
+        return
+    for field in RESPONSE_COUNTS:
+        value = response.get(field) if hasattr(response, "get") else None
+        call[field] = int(value) if value is not None else None
+    for field in RESPONSE_DURATIONS:
+        value = response.get(field) if hasattr(response, "get") else None
+        call[field] = value / 1e9 if value is not None else None
+
+
+def mark_parse_failure(call):
+    if call is not None:
+        call["outcome"] = OUTCOME_PARSE_ERROR
+
+
+def _quantiles(values):
+    if not values:
+        return {"mean": None, "p50": None, "p95": None, "max": None}
+    p50, p95 = np.percentile(values, [50, 95])
+    return {"mean": float(np.mean(values)), "p50": float(p50), "p95": float(p95), "max": float(max(values))}
+
+
+def _busy_time(intervals):
+    """Время, когда был в работе хотя бы один запрос (объединение интервалов)."""
+    busy, current_start, current_end = 0.0, None, None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                busy += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        busy += current_end - current_start
+    return busy
+
+
+def bottleneck(summary):
+    """Что ограничивает прогон: модель, очередь лимита или наш код между запросами."""
+    if not summary["calls"]:
+        return "запросов к LLM не было"
+    queue_wait = summary["queue_wait"]["mean"] or 0.0
+    latency = summary["latency"]["mean"] or 0.0
+    if summary["idle_share"] > 0.5:
+        return "код приложения: большую часть прогона запросы к LLM не выполнялись"
+    if queue_wait > latency:
+        return "очередь: запросы дольше ждут лимита, чем выполняются — можно поднять лимит или добавить серверов"
+    if summary["server_share"] is not None and summary["server_share"] < 0.5:
+        return "сеть или клиент: сервер тратит на запрос меньше половины его задержки"
+    return "модель: время уходит на генерацию на сервере Ollama"
+
+
+class RunTelemetry:
+    """Записи о запросах одного прогона."""
+
+    def __init__(self, registry=None):
+        self.registry = registry
+        self.calls = []
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def start_call(self, kind, model):
+        return {"kind": kind, "model": model, "queued_at": time.monotonic(), "outcome": None}
+
+    def acquired(self, call):
+        call["sent_at"] = time.monotonic()
+        call["queue_wait"] = call["sent_at"] - call["queued_at"]
+
+    def failed(self, call, error):
+        if call.get("outcome") is None:
+            call["outcome"] = OUTCOME_ERROR
+        call["error"] = type(error).__name__
+
+    def finish(self, call):
+        call["finished_at"] = time.monotonic()
+        call["latency"] = call["finished_at"] - call.get("sent_at", call["queued_at"])
+        call.setdefault("queue_wait", 0.0)
+        if call["outcome"] is None:
+            call["outcome"] = OUTCOME_OK
+        with self._lock:
+            self.calls.append(call)
+        if self.registry is not None:
+            self.registry.observe(call)
+
+    def summary(self):
+        """Сводка прогона (сериализуется в JSON вместе со статистикой)."""
+        with self._lock:
+            calls = list(self.calls)
+        wall_time = time.monotonic() - self.started_at
+        outcomes = {outcome: sum(call["outcome"] == outcome for call in calls) for outcome in OUTCOMES}
+        errors = {}
+        for call in calls:
+            if call.get("error"):
+                errors[call["error"]] = errors.get(call["error"], 0) + 1
+
+        def total(field):
+            values = [call[field] for call in calls if call.get(field) is not None]
+            return sum(values) if values else None
+
+        latencies = [call["latency"] for call in calls]
+        server_time = total("total_duration")
+        eval_tokens, eval_time = total("eval_count"), total("eval_duration")
+        prompt_tokens, prompt_time = total("prompt_eval_count"), total("prompt_eval_duration")
+        busy = _busy_time([(call.get("sent_at", call["queued_at"]), call["finished_at"]) for call in calls])
+        summary = {
+            "calls": len(calls),
+            "outcomes": outcomes,
+            "errors": errors,
+            "wall_time": wall_time,
+            "queue_wait": _quantiles([call["queue_wait"] for call in calls]),
+            "latency": _quantiles(latencies),
+            "prompt_tokens": prompt_tokens,
+            "eval_tokens": eval_tokens,
+            "prompt_tokens_per_s": prompt_tokens / prompt_time if prompt_tokens and prompt_time else None,
+            "eval_tokens_per_s": eval_tokens / eval_time if eval_tokens and eval_time else None,
+            "load_time": total("load_duration"),
+            # Доля задержки, проведённая на сервере (остальное — сеть, клиент, очередь в самом Ollama)
+            "server_share": server_time / sum(latencies) if server_time and latencies else None,
+            "idle_share": max(0.0, 1 - busy / wall_time) if wall_time > 0 else 0.0,
+        }
+        summary["bottleneck"] = bottleneck(summary)
+        return summary
+
+
+class TelemetryRegistry:
+    """Счётчики и гистограммы по моделям за время жизни процесса."""
+
+    def __init__(self, path=METRICS_PATH, write_interval=WRITE_INTERVAL):
+        self.path = path
+        self.write_interval = write_interval
+        self._lock = threading.Lock()
+        self._models = {}
+        self._last_write = 0.0
+
+    def _model(self, model):
+        if model not in self._models:
+            self._models[model] = {
+                "calls": {},
+                "errors": {},
+                "queue_wait": [0] * (len(LATENCY_BUCKETS) + 1) + [0.0],
+                "latency": [0] * (len(LATENCY_BUCKETS) + 1) + [0.0],
+                "prompt_tokens": 0,
+                "eval_tokens": 0,
+                "prompt_eval_seconds": 0.0,
+                "eval_seconds": 0.0,
+                "load_seconds": 0.0,
+            }
+        return self._models[model]
+
+    @staticmethod
+    def _observe_histogram(histogram, value):
+        # histogram: счётчики по корзинам LATENCY_BUCKETS, корзина +Inf, затем сумма значений
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(LATENCY_BUCKETS)] += 1
+        histogram[-1] += value
+
+    def observe(self, call):
+        with self._lock:
+            model = self._model(call["model"])
+            key = (call["kind"], call["outcome"])
+            model["calls"][key] = model["calls"].get(key, 0) + 1
+            if call.get("error"):
+                model["errors"][call["error"]] = model["errors"].get(call["error"], 0) + 1
+            self._observe_histogram(model["queue_wait"], call["queue_wait"])
+            self._observe_histogram(model["latency"], call["latency"])
+            model["prompt_tokens"] += call.get("prompt_eval_count") or 0
+            model["eval_tokens"] += call.get("eval_count") or 0
+            model["prompt_eval_seconds"] += call.get("prompt_eval_duration") or 0.0
+            model["eval_seconds"] += call.get("eval_duration") or 0.0
+            model["load_seconds"] += call.get("load_duration") or 0.0
+            due = time.monotonic() - self._last_write >= self.write_interval
+        if due:
+            self.write()
+
+    def model_summary(self):
+        """Строки для таблицы в разделе 2: одна строка на модель."""
+        with self._lock:
+            rows = []
+            for name, model in sorted(self._models.items()):
+                calls = sum(model["calls"].values())
+                by_outcome = {outcome: 0 for outcome in OUTCOMES}
+                for (_, outcome), count in model["calls"].items():
+                    by_outcome[outcome] += count
+                rows.append({
+                    "model": name,
+                    "calls": calls,
+                    "parse_errors": by_outcome[OUTCOME_PARSE_ERROR],
+                    "errors": by_outcome[OUTCOME_ERROR],
+                    "avg_queue_wait": model["queue_wait"][-1] / calls if calls else None,
+                    "avg_latency": model["latency"][-1] / calls if calls else None,
+                    "prompt_tokens": model["prompt_tokens"],
+                    "eval_tokens": model["eval_tokens"],
+                    "eval_tokens_per_s": model["eval_tokens"] / model["eval_seconds"]
+                    if model["eval_seconds"] else None,
+                    "load_seconds": model["load_seconds"],
+                })
+        return rows
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def label(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+        with self._lock:
+            models = {name: model for name, model in sorted(self._models.items())}
+            header("grading_llm_calls_total", "counter", "LLM requests by kind and outcome")
+            for name, model in models.items():
+                for (kind, outcome), count in sorted(model["calls"].items()):
+                    lines.append(f'grading_llm_calls_total{{model="{label(name)}",kind="{kind}",'
+                                 f'outcome="{outcome}"}} {count}')
+            header("grading_llm_exceptions_total", "counter", "LLM request exceptions by type")
+            for name, model in models.items():
+                for error, count in sorted(model["errors"].items()):
+                    lines.append(f'grading_llm_exceptions_total{{model="{label(name)}",error="{label(error)}"}} {count}')
+            for metric, field, help_text in (
+                    ("grading_llm_queue_wait_seconds", "queue_wait", "Time waiting for the concurrency limit"),
+                    ("grading_llm_request_seconds", "latency", "LLM request latency")):
+                header(metric, "histogram", help_text)
+                for name, model in models.items():
+                    histogram = model[field]
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS + (math.inf,), histogram[:-1]):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else f"{bound:g}"
+                        lines.append(f'{metric}_bucket{{model="{label(name)}",le="{le}"}} {cumulative}')
+                    lines.append(f'{metric}_sum{{model="{label(name)}"}} {histogram[-1]:.6f}')
+                    lines.append(f'{metric}_count{{model="{label(name)}"}} {cumulative}')
+            for metric, field, help_text in (
+                    ("grading_llm_prompt_tokens_total", "prompt_tokens", "Prompt tokens evaluated"),
+                    ("grading_llm_eval_tokens_total", "eval_tokens", "Tokens generated"),
+                    ("grading_llm_prompt_eval_seconds_total", "prompt_eval_seconds", "Server time on prompts"),
+                    ("grading_llm_eval_seconds_total", "eval_seconds", "Server time on generation"),
+                    ("grading_llm_load_seconds_total", "load_seconds", "Server time loading the model")):
+                header(metric, "counter", help_text)
+                for name, model in models.items():
+                    lines.append(f'{metric}{{model="{label(name)}"}} {model[field]:g}')
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """Атомарно перезаписывает файл с метриками."""
+        text = self.render()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._last_write = time.monotonic()
@@ -0,0 +1,182 @@
+import io
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils import column_index_from_string
+
+# Запись баллов в итоговый журнал (шаблоны из data/journals). Объединённые ячейки
+# и строки студентов индексируются один раз на лист, поэтому заполнение журнала
+# занимает линейное время от числа студентов.
+#
+# Массовый режим: последние прогоны из хранилища результатов группируются по дисциплинам,
+# каждый журнал открывается один раз, в него записываются все лекции сразу,
+# и он сохраняется один раз.
+# Журналы разных дисциплин заполняются параллельно в отдельных процессах.
+
+JOURNALS_DIR = "data/journals"
+REPORT_NAME = "отчет_о_заполнении.csv"
+FIRST_STUDENT_ROW = 8
+ID_COLUMN = "B"
+LECTURE_COLUMNS = ['F', 'H', 'J', 'L', 'N', 'P', 'R', 'T', 'V', 'X']
+
+
+def lecture_column(lecture_number):
+    """Колонка журнала для лекции с номером 1..10 или None, если в шаблоне её нет."""
+    if 1 <= lecture_number <= len(LECTURE_COLUMNS):
+        return LECTURE_COLUMNS[lecture_number - 1]
+    return None
+
+
+class JournalSheet:
+
+    def __init__(self, sheet, first_row=FIRST_STUDENT_ROW, id_column=ID_COLUMN):
+        self.sheet = sheet
+
+        # Ячейка внутри объединённого диапазона -> его левая верхняя ячейка
+        self._anchors = {}
+        for merged_range in sheet.merged_cells.ranges:
+            anchor = (merged_range.min_row, merged_range.min_col)
+            for row in range(merged_range.min_row, merged_range.max_row + 1):
+                for col in range(merged_range.min_col, merged_range.max_col + 1):
+                    self._anchors[(row, col)] = anchor
+
+        # ID студента -> строки журнала (ID может встретиться в нескольких строках)
+        self.student_rows = {}
+        id_col = column_index_from_string(id_column)
+        values = sheet.iter_rows(min_row=first_row, min_col=id_col, max_col=id_col, values_only=True)
+        for row, (value,) in enumerate(values, start=first_row):
+            self.student_rows.setdefault(str(value), []).append(row)
+
+    def cell(self, row, col):
+        """Ячейка для записи: для объединённого диапазона — его левая верхняя ячейка."""
+        row, col = self._anchors.get((row, col), (row, col))
+        return self.sheet.cell(row=row, column=col)
+
+    def write(self, row, col, value):
+        self.cell(row, col).value = value
+
+    def fill_scores(self, column, id_to_score):
+        """Записывает баллы в колонку (буква) по ID студентов. Возвращает (updated_count, found_ids)."""
+        col = column_index_from_string(column)
+        updated_count = 0
+        found_ids = set()
+        for student_id, score in id_to_score.items():
+            rows = self.student_rows.get(student_id)
+            if not rows:
+                continue
+            for row in rows:
+                self.write(row, col, score)
+                updated_count += 1
+            found_ids.add(student_id)
+        return updated_count, found_ids
+
+
+def lecture_number_from_id(lecture_id):
+    """Номер лекции из Lecture_ID вида Lec01 или None."""
+    match = re.search(r"(\d+)", str(lecture_id))
+    return int(match.group(1)) if match else None
+
+
+def pending_results(results_store):
+    """Последний прогон для каждой лекции: {дисциплина: {номер лекции: run_id}}.
+
+    Дисциплины сравниваются без учёта регистра: в старых результатах встречаются оба варианта написания.
+    """
+    grouped = {}
+    names = {}
+    for run in results_store.latest_runs().sort_values("created_at").itertuples(index=False):
+        lecture_number = lecture_number_from_id(run.lecture_id)
+        if lecture_number is None:
+            continue
+        discipline = names.setdefault(run.discipline.lower(), run.discipline)
+        # Более поздний прогон того же варианта написания перекрывает ранний
+        grouped.setdefault(discipline, {})[lecture_number] = run.run_id
+    return dict(sorted(grouped.items()))
+
+
+def _name_words(name):
+    words = re.findall(r"[а-яёa-z]+", name.lower())
+    return {word for word in words if word != "журнал"}
+
+
+def match_journal(discipline, journal_files):
+    """Журнал, в названии которого больше всего слов из названия дисциплины, или None."""
+    discipline_words = _name_words(discipline)
+    best, best_score = None, 0.0
+    for journal_file in journal_files:
+        journal_words = _name_words(os.path.splitext(journal_file)[0])
+        if not journal_words:
+            continue
+        common = len(journal_words & discipline_words)
+        score = common / max(len(journal_words), len(discipline_words))
+        if common and score > best_score:
+            best, best_score = journal_file, score
+    return best if best_score >= 0.5 else None
+
+
+def run_scores(results_store, run_id):
+    results_df = results_store.run_results(run_id)
+    return dict(zip(results_df.iloc[:, 0].astype(str), results_df.iloc[:, 1]))
+
+
+def fill_journal(journal_path, lecture_scores):
+    """Заполняет один журнал баллами всех лекций и сохраняет его один раз.
+
+    lecture_scores — {номер лекции: (run_id, {ID студента: балл})}. Возвращает имя файла,
+    содержимое заполненного журнала и строки отчёта по лекциям.
+    """
+    workbook = load_workbook(journal_path)
+    journal_sheet = JournalSheet(workbook.active)
+    report = []
+    for lecture_number, (run_id, id_to_score) in sorted(lecture_scores.items()):
+        row = {
+            "Журнал": os.path.basename(journal_path),
+            "Лекция": lecture_number,
+            "Прогон": run_id,
+            "Обновлено": 0,
+            "Не найдено": 0,
+            "Ненайденные ID": "",
+        }
+        column = lecture_column(lecture_number)
+        if column is None:
+            row["Ненайденные ID"] = "В шаблоне нет колонки для этой лекции"
+            report.append(row)
+            continue
+        updated_count, found_ids = journal_sheet.fill_scores(column, id_to_score)
+        missing_ids = sorted(set(id_to_score) - found_ids)
+        row.update({"Обновлено": updated_count, "Не найдено": len(missing_ids),
+                    "Ненайденные ID": " ".join(missing_ids)})
+        report.append(row)
+
+    output = io.BytesIO()
+    workbook.save(output)
+    return os.path.basename(journal_path), output.getvalue(), report
+
+
+def fill_journals(assignments, results_store, journals_dir=JOURNALS_DIR, max_workers=None):
+    """Заполняет несколько журналов. Возвращает (zip_bytes, report_df).
+
+    assignments — {имя файла журнала: {номер лекции: run_id}}. Баллы читаются из хранилища
+    здесь, а в процессы передаются уже готовыми словарями.
+    """
+    jobs = [
+        (os.path.join(journals_dir, journal_file),
+         {lecture_number: (run_id, run_scores(results_store, run_id)) for lecture_number, run_id in lectures.items()})
+        for journal_file, lectures in assignments.items()
+    ]
+    if len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers or min(len(jobs), os.cpu_count() or 1)) as executor:
+            filled = list(executor.map(fill_journal, *zip(*jobs)))
+    else:
+        filled = [fill_journal(*job) for job in jobs]
+
+    report_df = pd.DataFrame([row for _, _, report in filled for row in report])
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for journal_file, data, _ in filled:
+            zipf.writestr(journal_file, data)
+        zipf.writestr(REPORT_NAME, report_df.to_csv(index=False).encode("utf-8-sig"))
+    return zip_buffer.getvalue(), report_df
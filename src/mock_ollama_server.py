@@ -0,0 +1,344 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import select
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Локальная заглушка HTTP API Ollama для проверки конвейера без настоящей модели:
+# несколько таких серверов на разных портах позволяют проверить пул серверов (OLLAMA_HOSTS).
+# Задержка ответа выбирается из распределения (LATENCY_DISTRIBUTIONS), формат ответа —
+# из REPLY_FORMATS; на этой же заглушке работает benchmark.py. Как и Ollama, заглушка
+# «загружает» модель (--load-time) при первом запросе или при смене num_ctx, генерирует
+# ответ по токенам (--token-time), соблюдает num_predict и stop и умеет отдавать поток,
+# который прекращается, когда клиент закрывает соединение.
+# Оценка одиночного ответа детерминирована (хэш текста запроса), модели из --model-noise
+# с заданной вероятностью отвечают случайной оценкой с низкой вероятностью токена в logprobs —
+# так проверяется каскад малой и основной модели. Модели из --model-speedup отвечают
+# во столько же раз быстрее (задержка и время токена).
+#
+#   python mock_ollama_server.py --ports 11501 11502 --latency 0.3 --error-rate 0.05
+#   python mock_ollama_server.py --distribution lognormal --reply-format text --garbage-rate 0.02
+#   python mock_ollama_server.py --model-noise qwen2.5:0.5b=0.3 --model-speedup qwen2.5:0.5b=5
+
+EMBEDDING_SIZE = 32
+# Размер контекста, с которым Ollama загружает модель, если в запросе нет options.num_ctx
+DEFAULT_NUM_CTX = 2048
+LATENCY_DISTRIBUTIONS = ("fixed", "normal", "lognormal", "exponential")
+# digit — одно число, как отвечает mistral на PROMPT_TEMPLATE; text — число внутри пояснения.
+# Пакетные запросы (с format) всегда получают JSON по схеме.
+REPLY_FORMATS = ("digit", "text")
+
+
+def fake_embedding(text):
+    digest = hashlib.sha256(str(text).encode("utf-8")).digest()
+    rng = random.Random(digest)
+    return [rng.uniform(-1.0, 1.0) for _ in range(EMBEDDING_SIZE)]
+
+
+def sample_latency(config):
+    """Задержка ответа, с: latency — среднее, jitter — стандартное отклонение (exponential его не использует)."""
+    latency, jitter = config["latency"], config["jitter"]
+    distribution = config.get("distribution", "normal")
+    if distribution == "fixed" or latency <= 0:
+        return max(0.0, latency)
+    if distribution == "lognormal":
+        # Длинный хвост, как у генерации на загруженном сервере; среднее и отклонение те же, что заданы
+        sigma = math.sqrt(math.log(1 + (jitter / latency) ** 2)) if jitter else 0.5
+        return random.lognormvariate(math.log(latency) - sigma ** 2 / 2, sigma)
+    if distribution == "exponential":
+        return random.expovariate(1.0 / latency)
+    return max(0.0, random.gauss(latency, jitter))
+
+
+def token_pieces(text):
+    # Грубое деление на токены: примерно по 4 символа, как в подсчёте токенов выше
+    return [text[i:i + 4] for i in range(0, len(text), 4)] or [""]
+
+
+def true_score(request):
+    """«Правильная» оценка ответа: одна и та же для всех моделей и повторов запроса."""
+    messages = request.get("messages") or [{}]
+    digest = hashlib.sha256(str(messages[-1].get("content", "")).encode("utf-8")).digest()
+    return digest[0] % 3
+
+
+def format_reply(score, reply_format):
+    if reply_format == "text":
+        return f"Ответ студента раскрывает вопрос частично. Оценка: {score}"
+    return str(score)
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят отдельными записями: без TCP_NODELAY каждый ответ ждал бы
+    # отложенного ACK клиента (~40 мс) и задержка заглушки не соответствовала бы заданной
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент отменил запрос (например, проверка здоровья по таймауту)
+            pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.server.config["error_rate"] >= 1.0:
+            # Сервер, отвечающий только ошибками, не проходит и проверку здоровья
+            self._send_json({"error": "mock server is down"}, status=503)
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-mock"})
+        elif self.path == "/api/tags":
+            self._send_json({"models": []})
+        elif self.path == "/api/ps":
+            with self.server.lock:
+                loaded = dict(self.server.loaded)
+            self._send_json({"models": [
+                {"name": model, "model": model, "context_length": num_ctx} for model, num_ctx in loaded.items()
+            ]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _ensure_loaded(self, request):
+        """Время «загрузки» модели для этого запроса, с (0, если она уже в памяти)."""
+        model = request.get("model", "")
+        num_ctx = (request.get("options") or {}).get("num_ctx", DEFAULT_NUM_CTX)
+        with self.server.lock:
+            if self.server.loaded.get(model) == num_ctx:
+                load_time = 0.0
+            else:
+                load_time = self.server.config["load_time"]
+                self.server.loaded[model] = num_ctx
+                self.server.loads += 1
+        time.sleep(load_time)
+        if request.get("keep_alive") == 0:
+            with self.server.lock:
+                self.server.loaded.pop(model, None)
+        return load_time
+
+    def do_POST(self):
+        config = self.server.config
+        request = self._read_json()
+        self.server.requests += 1
+
+        if self.path == "/api/generate":
+            # Пустой generate — так Ollama загружает модель и меняет её keep_alive
+            load_time = self._ensure_loaded(request)
+            self._send_json({
+                "model": request.get("model", ""),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "response": "",
+                "done": True,
+                "done_reason": "load",
+                "load_duration": int(load_time * 1e9),
+                "total_duration": int(load_time * 1e9),
+            })
+            return
+
+        load_time = self._ensure_loaded(request) if self.path == "/api/chat" else 0.0
+        latency = sample_latency(config) / self._speedup(request)
+        time.sleep(latency)
+        if random.random() < config["error_rate"]:
+            self._send_json({"error": "mock server overloaded"}, status=503)
+            return
+
+        if self.path == "/api/chat":
+            self._chat(request, latency, load_time)
+        elif self.path == "/api/embed":
+            inputs = request.get("input", "")
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self._send_json({"model": request.get("model", ""), "embeddings": [fake_embedding(t) for t in inputs]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _speedup(self, request):
+        return self.server.config.get("model_speedup", {}).get(request.get("model", ""), 1.0)
+
+    def _score(self, request):
+        """Оценка модели и вероятность её токена."""
+        noise = self.server.config.get("model_noise", {}).get(request.get("model", ""), 0.0)
+        if random.random() < noise:
+            return random.randint(0, 2), random.uniform(0.34, 0.8)
+        return true_score(request), random.uniform(0.85, 1.0)
+
+    def _chat_content(self, request):
+        """Токены ответа и вероятность токена оценки."""
+        config = self.server.config
+        score, confidence = self._score(request)
+        response_format = request.get("format")
+        properties = response_format.get("properties", {}) if isinstance(response_format, dict) else {}
+        if "scores" in properties:
+            count = properties["scores"].get("minItems", 1)
+            content = json.dumps({"scores": [random.randint(0, 2) for _ in range(count)]})
+        elif "score" in properties:
+            # По схеме модель не может ответить ничем, кроме {"score": N}
+            content = json.dumps({"score": score})
+        elif random.random() < config.get("garbage_rate", 0.0):
+            # Ответ без числа: так модель иногда отвечает на плохо сформулированный вопрос
+            content = "Не могу оценить ответ."
+        else:
+            content = format_reply(score, config.get("reply_format", "digit"))
+
+        options = request.get("options") or {}
+        for stop in options.get("stop") or []:
+            if stop in content:
+                content = content[:content.index(stop)]
+        tokens = token_pieces(content)
+        if options.get("num_predict"):
+            tokens = tokens[:options["num_predict"]]
+        return tokens, confidence
+
+    @staticmethod
+    def _logprobs(token, confidence):
+        # Вероятность оценки — у токена с цифрой, остальные токены формата почти детерминированы
+        probability = confidence if any(ch in "012" for ch in token) else 0.99
+        return [{"token": token, "logprob": math.log(probability)}]
+
+    def _client_gone(self):
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        if not readable:
+            return False
+        try:
+            return self.connection.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _chat(self, request, latency, load_time):
+        """latency — обработка промпта до первого токена; каждый токен генерируется token_time секунд."""
+        token_time = self.server.config.get("token_time", 0.0) / self._speedup(request)
+        tokens, confidence = self._chat_content(request)
+        logprobs = request.get("logprobs")
+        prompt = "".join(str(message.get("content", "")) for message in request.get("messages", []))
+        final = {
+            "model": request.get("model", ""),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((load_time + latency + len(tokens) * token_time) * 1e9),
+            "load_duration": int(load_time * 1e9),
+            "prompt_eval_count": max(1, len(prompt) // 4),
+            "prompt_eval_duration": int(latency * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(len(tokens) * token_time * 1e9),
+        }
+        if not request.get("stream", True):
+            time.sleep(len(tokens) * token_time)
+            with self.server.lock:
+                self.server.tokens += len(tokens)
+            reply = dict(final, message={"role": "assistant", "content": "".join(tokens)})
+            if logprobs:
+                reply["logprobs"] = [entry for token in tokens for entry in self._logprobs(token, confidence)]
+            self._send_json(reply)
+            return
+
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                if self._client_gone():
+                    # Клиент закрыл поток — Ollama в этом случае прекращает генерацию
+                    with self.server.lock:
+                        self.server.cancelled += 1
+                    return
+                time.sleep(token_time)
+                with self.server.lock:
+                    self.server.tokens += 1
+                chunk = {"model": final["model"], "created_at": final["created_at"],
+                         "message": {"role": "assistant", "content": token}, "done": False}
+                if logprobs:
+                    chunk["logprobs"] = self._logprobs(token, confidence)
+                self._write_chunk(chunk)
+            self._write_chunk(dict(final, message={"role": "assistant", "content": ""}))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            with self.server.lock:
+                self.server.cancelled += 1
+
+
+def start_mock_server(port=0, latency=0.05, jitter=0.0, error_rate=0.0, distribution="normal",
+                      reply_format="digit", garbage_rate=0.0, load_time=0.0, token_time=0.0, model_noise=None,
+                      model_speedup=None):
+    """Запускает заглушку в фоновом потоке; возвращает (server, url). Остановка — server.shutdown()."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockOllamaHandler)
+    server.daemon_threads = True
+    server.config = {
+        "latency": latency, "jitter": jitter, "error_rate": error_rate, "distribution": distribution,
+        "reply_format": reply_format, "garbage_rate": garbage_rate, "load_time": load_time,
+        "token_time": token_time, "model_noise": dict(model_noise or {}),
+        "model_speedup": dict(model_speedup or {}),
+    }
+    server.lock = threading.Lock()
+    server.loaded = {}
+    server.loads = 0
+    server.tokens = 0
+    server.cancelled = 0
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка HTTP API Ollama")
+    parser.add_argument("--ports", type=int, nargs="+", default=[11501])
+    parser.add_argument("--latency", type=float, default=0.2, help="Средняя задержка ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Разброс задержки, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов с ошибкой 503")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="normal")
+    parser.add_argument("--reply-format", choices=REPLY_FORMATS, default="digit")
+    parser.add_argument("--garbage-rate", type=float, default=0.0, help="Доля ответов без оценки")
+    parser.add_argument("--load-time", type=float, default=0.0, help="Время загрузки модели, с")
+    parser.add_argument("--token-time", type=float, default=0.02, help="Время генерации одного токена, с")
+    parser.add_argument("--model-noise", nargs="*", default=[], metavar="MODEL=ДОЛЯ",
+                        help="Доля случайных (неуверенных) оценок у модели, например qwen2.5:0.5b=0.3")
+    parser.add_argument("--model-speedup", nargs="*", default=[], metavar="MODEL=РАЗ",
+                        help="Во сколько раз модель отвечает быстрее, например qwen2.5:0.5b=5")
+    args = parser.parse_args()
+    model_noise = {model: float(noise) for model, noise in (item.rsplit("=", 1) for item in args.model_noise)}
+    model_speedup = {model: float(factor) for model, factor in (item.rsplit("=", 1) for item in args.model_speedup)}
+
+    servers = [
+        start_mock_server(port, args.latency, args.jitter, args.error_rate, args.distribution,
+                          args.reply_format, args.garbage_rate, args.load_time, args.token_time, model_noise,
+                          model_speedup)
+        for port in args.ports
+    ]
+    print("OLLAMA_HOSTS=" + ",".join(url for _, url in servers))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for server, _ in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import threading
+import time
+import ollama
+from ollama_pool import get_hosts
+
+# Жизненный цикл модели на серверах Ollama. Без него первый запрос каждого прогона
+# ждёт загрузки модели, а за паузу между действиями в интерфейсе Ollama успевает её
+# выгрузить (keep_alive по умолчанию — 5 минут).
+#
+# - warm_up загружает модель на всех серверах из OLLAMA_HOSTS пустым запросом generate
+#   с тем же num_ctx, что и у запросов проверки (другой num_ctx заставил бы Ollama
+#   перезагрузить модель);
+# - pin/release считают задания в очереди: пока есть хотя бы одно, модель закреплена
+#   (keep_alive=-1), после последнего возвращается обычный IDLE_KEEP_ALIVE;
+# - keep_alive(model) — значение для каждого запроса проверки, чтобы запрос не сбрасывал
+#   закрепление.
+
+NUM_CTX = 4096
+IDLE_KEEP_ALIVE = "30m"
+PINNED_KEEP_ALIVE = -1
+LLM_OPTIONS = {"num_ctx": NUM_CTX}
+# Повторно спрашивать сервер о загруженных моделях не чаще, чем раз в столько секунд
+CHECK_INTERVAL = 60.0
+WARM_UP_TIMEOUT = 600.0
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_model_manager():
+    """Один менеджер моделей на процесс."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ModelManager()
+        return _manager
+
+
+def _model_names(name):
+    # Ollama показывает модель с тегом: mistral -> mistral:latest
+    return {name, name if ":" in name else f"{name}:latest"}
+
+
+class ModelManager:
+
+    def __init__(self, hosts=None, num_ctx=NUM_CTX, idle_keep_alive=IDLE_KEEP_ALIVE,
+                 check_interval=CHECK_INTERVAL):
+        self.hosts = hosts
+        self.num_ctx = num_ctx
+        self.idle_keep_alive = idle_keep_alive
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._pins = {}
+        self._checked_at = {}
+        self._host_locks = {}
+        self._keep_alive_lock = threading.Lock()
+        self.errors = {}
+
+    def _hosts(self):
+        return self.hosts or get_hosts()
+
+    def _host_lock(self, host, model):
+        with self._lock:
+            return self._host_locks.setdefault((host, model), threading.Lock())
+
+    def keep_alive(self, model):
+        with self._lock:
+            return PINNED_KEEP_ALIVE if self._pins.get(model) else self.idle_keep_alive
+
+    def is_loaded(self, host, model):
+        """Загружена ли модель на сервере с нужным размером контекста."""
+        for loaded in ollama.Client(host=host, timeout=10).ps().models:
+            if loaded.model in _model_names(model) or loaded.name in _model_names(model):
+                return loaded.context_length in (None, self.num_ctx)
+        return False
+
+    def _load(self, host, model, keep_alive):
+        ollama.Client(host=host, timeout=WARM_UP_TIMEOUT).generate(
+            model=model, prompt="", keep_alive=keep_alive, options={"num_ctx": self.num_ctx}
+        )
+
+    def warm_up(self, model, force=False):
+        """Загружает модель на всех серверах, где её ещё нет. Возвращает {сервер: ошибка} для неудачных."""
+        errors = {}
+        for host in self._hosts():
+            with self._host_lock(host, model):
+                key = (host, model)
+                checked_at = self._checked_at.get(key)
+                if not force and checked_at is not None and time.monotonic() - checked_at < self.check_interval:
+                    continue
+                try:
+                    if force or not self.is_loaded(host, model):
+                        self._load(host, model, self.keep_alive(model))
+                    self._checked_at[key] = time.monotonic()
+                    self.errors.pop(key, None)
+                except Exception as e:
+                    # Недоступный сервер не мешает проверке: запросы к нему обработает пул серверов
+                    errors[host or "по умолчанию"] = str(e)
+                    self.errors[key] = str(e)
+        return errors
+
+    def warm_up_in_background(self, model):
+        thread = threading.Thread(target=self.warm_up, args=(model,), name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def _apply_keep_alive(self, model):
+        # Пустой generate с новым keep_alive меняет время жизни уже загруженной модели.
+        # Значение берётся в момент отправки, поэтому при быстрой смене pin/release
+        # последним на сервер уходит актуальное состояние
+        with self._keep_alive_lock:
+            for host in self._hosts():
+                try:
+                    self._load(host, model, self.keep_alive(model))
+                    self._checked_at[(host, model)] = time.monotonic()
+                except Exception as e:
+                    self.errors[(host, model)] = str(e)
+
+    def _apply_in_background(self, model):
+        threading.Thread(target=self._apply_keep_alive, args=(model,), name="model-keep-alive",
+                         daemon=True).start()
+
+    def pin(self, model):
+        """Закрепляет модель, пока задание в очереди или выполняется."""
+        with self._lock:
+            self._pins[model] = self._pins.get(model, 0) + 1
+            first = self._pins[model] == 1
+        if first:
+            self._apply_in_background(model)
+
+    def release(self, model):
+        with self._lock:
+            self._pins[model] = max(self._pins.get(model, 0) - 1, 0)
+            last = self._pins[model] == 0
+        if last:
+            self._apply_in_background(model)
+
+    def pinned(self):
+        with self._lock:
+            return {model: count for model, count in self._pins.items() if count}
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import time
+import ollama
+from grading_retry import TRANSIENT, classify_error
+
+# Пул серверов Ollama: одна и та же модель обслуживается несколькими демонами
+# (разные порты или машины лаборатории). Запрос уходит на сервер с наименьшим числом
+# незавершённых запросов; сервер, несколько раз подряд ответивший временной ошибкой, временно
+# исключается и возвращается после успешной проверки здоровья. Постоянные ошибки (модель
+# не скачана, некорректный запрос) говорят о запросе, а не о сервере: они не повторяются
+# на другом сервере и не приближают исключение (см. grading_retry.classify_error).
+#
+# Список серверов задаётся переменной окружения OLLAMA_HOSTS через запятую:
+#   OLLAMA_HOSTS=http://localhost:11434,http://lab-02:11434
+
+HOSTS_ENV = "OLLAMA_HOSTS"
+HEALTH_CHECK_INTERVAL = 15.0
+EJECT_AFTER_FAILURES = 3
+EJECT_SECONDS = 30.0
+
+
+async def stream_until(client, until, **kwargs):
+    """Потоковый chat, прерываемый, как только until(текст) вернёт не None.
+
+    Закрытие потока разрывает соединение, и Ollama прекращает генерацию. Возвращает
+    (текст, число полученных частей, последняя часть ответа).
+    """
+    stream = await client.chat(stream=True, **kwargs)
+    content, parts, last = "", 0, None
+    try:
+        async for part in stream:
+            content += part["message"]["content"]
+            parts += 1
+            last = part
+            if until(content) is not None:
+                break
+    finally:
+        await stream.aclose()
+    return content, parts, last
+
+
+def get_hosts():
+    hosts = [host.strip() for host in os.environ.get(HOSTS_ENV, "").split(",") if host.strip()]
+    # Без OLLAMA_HOSTS клиент сам возьмёт OLLAMA_HOST или адрес по умолчанию
+    return hosts or [None]
+
+
+class Endpoint:
+
+    def __init__(self, host):
+        self.host = host
+        self.client = ollama.AsyncClient(host=host)
+        self.outstanding = 0
+        self.completed = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.total_latency = 0.0
+        self.ejected_until = 0.0
+
+    @property
+    def name(self):
+        return self.host or "по умолчанию"
+
+    def is_available(self, now):
+        return now >= self.ejected_until
+
+
+class OllamaPool:
+    """Заменяет ollama.AsyncClient в конвейере проверки: те же методы chat и embed."""
+
+    def __init__(self, hosts=None, health_check_interval=HEALTH_CHECK_INTERVAL,
+                 eject_after=EJECT_AFTER_FAILURES, eject_seconds=EJECT_SECONDS):
+        self.endpoints = [Endpoint(host) for host in (hosts or get_hosts())]
+        self.health_check_interval = health_check_interval
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.started_at = time.monotonic()
+        self._health_task = None
+
+    def _pick(self, exclude=()):
+        now = time.monotonic()
+        endpoints = [endpoint for endpoint in self.endpoints if endpoint not in exclude] or self.endpoints
+        available = [endpoint for endpoint in endpoints if endpoint.is_available(now)]
+        # Если исключены все серверы, пробуем тот, что вернётся раньше остальных
+        candidates = available or [min(endpoints, key=lambda endpoint: endpoint.ejected_until)]
+        return min(candidates, key=lambda endpoint: (endpoint.outstanding, endpoint.completed))
+
+    def _ensure_health_checks(self):
+        if self._health_task is None and len(self.endpoints) > 1:
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def _call(self, request):
+        # request(client) — корутина запроса к клиенту выбранного сервера
+        self._ensure_health_checks()
+        tried = []
+        while True:
+            endpoint = self._pick(exclude=tried)
+            tried.append(endpoint)
+            try:
+                return await self._call_endpoint(endpoint, request)
+            except Exception as e:
+                # Один повтор на другом сервере: отказ одного демона не должен стоить оценки
+                if classify_error(e) != TRANSIENT or len(tried) >= min(2, len(self.endpoints)):
+                    raise
+
+    async def _call_endpoint(self, endpoint, request):
+        endpoint.outstanding += 1
+        started_at = time.monotonic()
+        try:
+            response = await request(endpoint.client)
+        except Exception as e:
+            endpoint.errors += 1
+            if classify_error(e) == TRANSIENT:
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.eject_after:
+                    endpoint.ejected_until = time.monotonic() + self.eject_seconds
+            raise
+        finally:
+            endpoint.outstanding -= 1
+        endpoint.completed += 1
+        endpoint.consecutive_failures = 0
+        endpoint.total_latency += time.monotonic() - started_at
+        return response
+
+    async def chat(self, **kwargs):
+        return await self._call(lambda client: client.chat(**kwargs))
+
+    async def chat_until(self, until, **kwargs):
+        """Потоковый chat с ранней остановкой (см. stream_until); сервер занят до закрытия потока."""
+        return await self._call(lambda client: stream_until(client, until, **kwargs))
+
+    async def embed(self, **kwargs):
+        return await self._call(lambda client: client.embed(**kwargs))
+
+    async def check_health(self, endpoint):
+        try:
+            await asyncio.wait_for(endpoint.client.ps(), timeout=5.0)
+        except Exception:
+            endpoint.ejected_until = time.monotonic() + self.eject_seconds
+            return False
+        endpoint.ejected_until = 0.0
+        endpoint.consecutive_failures = 0
+        return True
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await asyncio.gather(*(self.check_health(endpoint) for endpoint in self.endpoints))
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        now = time.monotonic()
+        return [
+            {
+                "host": endpoint.name,
+                "available": endpoint.is_available(now),
+                "outstanding": endpoint.outstanding,
+                "completed": endpoint.completed,
+                "errors": endpoint.errors,
+                "avg_latency": endpoint.total_latency / endpoint.completed if endpoint.completed else 0.0,
+                "throughput": endpoint.completed / elapsed,
+            }
+            for endpoint in self.endpoints
+        ]
@@ -0,0 +1,96 @@
+import re
+import numpy as np
+from grading_cache import GradingCache, normalize_answer
+
+# Предварительная оценка без генерации: точное совпадение с эталоном и косинусная близость
+# эмбеддингов. В LLM уходят только ответы из "неуверенной" полосы близости.
+# Границы полосы (accept_similarity, reject_similarity) зависят от модели эмбеддингов, языка
+# и формулировок эталонов: их нужно подбирать для каждой дисциплины по ответам, уже
+# оценённым LLM или преподавателем, и только после этого включать embedding_enabled.
+
+TIER_EMPTY = "пустой ответ"
+TIER_EXACT = "совпадение с эталоном"
+TIER_CACHE = "кэш"
+TIER_CLUSTER = "кластер дубликатов"
+TIER_EMBEDDING = "эмбеддинги"
+# Малая модель каскада уверена в оценке, основная модель не понадобилась
+TIER_CASCADE = "LLM: малая модель"
+TIER_LLM = "LLM"
+# Модель ответила, но оценку из ответа извлечь не удалось: 0 баллов, ответ стоит проверить вручную
+TIER_UNPARSED = "LLM: ответ не разобран"
+# Запрос к LLM так и не удался (после повторов или из-за постоянной ошибки): оценки нет,
+# ответ проверяется повторно отдельным запуском того же прогона
+TIER_FAILED = "LLM: ошибка запроса"
+
+
+def reference_variants(reference_answer):
+    # Эталоны часто имеют вид "В. подземную": засчитываем и букву варианта, и текст без неё
+    variants = {normalize_answer(reference_answer)}
+    match = re.match(r"^\s*([A-Za-zА-Яа-яЁё])[.)]\s*(.+)$", str(reference_answer), re.S)
+    if match:
+        variants.add(normalize_answer(match.group(1)))
+        variants.add(normalize_answer(match.group(2)))
+    variants.discard("")
+    return variants
+
+
+def exact_match_score(reference_answer, student_answer):
+    if normalize_answer(student_answer) in reference_variants(reference_answer):
+        return 2
+    return None
+
+
+def cosine_similarities(reference_vector, answer_vectors):
+    reference_vector = np.asarray(reference_vector, dtype=np.float32)
+    answer_vectors = np.asarray(answer_vectors, dtype=np.float32)
+    norms = np.linalg.norm(answer_vectors, axis=1) * np.linalg.norm(reference_vector)
+    norms[norms == 0] = 1.0
+    return answer_vectors @ reference_vector / norms
+
+
+async def reference_embedding(client, model, reference_answer, cache=None):
+    # Эталон нормализуется так же, как ответы студентов, иначе близость зависит от регистра и пунктуации
+    reference_text = normalize_answer(reference_answer)
+    key = GradingCache.make_embedding_key(model, reference_text)
+    if cache is not None:
+        vector = cache.get_embedding(key)
+        if vector is not None:
+            return vector
+    response = await client.embed(model=model, input=reference_text)
+    vector = np.asarray(response["embeddings"][0], dtype=np.float32)
+    if cache is not None:
+        cache.put_embedding(key, vector)
+    return vector
+
+
+async def embedding_prescore(client, tasks, settings, cache=None):
+    """Проставляет оценки задачам, уверенно решённым по близости эмбеддингов.
+
+    Возвращает список задач, которые по-прежнему нужно отправить в LLM.
+    """
+    model = settings["embedding_model"]
+    by_question = {}
+    for task in tasks:
+        by_question.setdefault(task["question_id"], []).append(task)
+
+    undecided = []
+    for question_tasks in by_question.values():
+        reference_vector = await reference_embedding(client, model, question_tasks[0]["reference"], cache)
+        unique_answers = sorted({normalize_answer(task["answer"]) for task in question_tasks})
+        response = await client.embed(model=model, input=unique_answers)
+        similarities = dict(zip(
+            unique_answers, cosine_similarities(reference_vector, response["embeddings"])
+        ))
+
+        for task in question_tasks:
+            similarity = float(similarities[normalize_answer(task["answer"])])
+            task["similarity"] = similarity
+            if similarity >= settings["accept_similarity"]:
+                score = 2
+            elif similarity <= settings["reject_similarity"]:
+                score = 0
+            else:
+                undecided.append(task)
+                continue
+            task["score"], task["reply"], task["tier"] = score, f"Близость к эталону {similarity:.2f}", TIER_EMBEDDING
+    return undecided
@@ -0,0 +1,342 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+
+# База вопросов и эталонных ответов. Рабочая копия хранится в SQLite с ключом
+# (Discipline, Lecture_ID, Question_ID); data/base_questions.xlsx остаётся форматом
+# обмена: если xlsx новее последнего импорта, он загружается в SQLite заново,
+# а после сохранения из редактора таблица выгружается обратно в xlsx (в фоновом потоке).
+#
+# Редактор сохраняет только изменённые строки. У каждой дисциплины свой номер версии:
+# сохранение, начатое со старой версии дисциплины, отклоняется (QuestionConflict), поэтому
+# преподаватели разных дисциплин не мешают друг другу, а правки одной дисциплины не теряются.
+#
+# Таблица и индекс по лекциям держатся в памяти процесса и перечитываются из SQLite
+# только при смене версии базы, поэтому перезапуск скрипта Streamlit не читает файлы.
+
+STORE_PATH = "data/base_questions.sqlite"
+XLSX_PATH = "data/base_questions.xlsx"
+KEY_COLUMNS = ["Discipline", "Lecture_ID", "Question_ID"]
+COLUMNS = KEY_COLUMNS + ["Question", "Answer"]
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_question_store(path=STORE_PATH, xlsx_path=XLSX_PATH):
+    """Одно хранилище на процесс для каждого файла базы."""
+    with _stores_lock:
+        key = (os.path.abspath(path), os.path.abspath(xlsx_path))
+        if key not in _stores:
+            _stores[key] = QuestionStore(path, xlsx_path)
+        return _stores[key]
+
+
+class QuestionConflict(Exception):
+
+    def __init__(self, disciplines):
+        super().__init__(f"Дисциплины изменены другим пользователем: {', '.join(map(str, disciplines))}")
+        self.disciplines = disciplines
+
+
+def _to_sql_value(value):
+    return None if pd.isna(value) else value
+
+
+def _sql_rows(df, columns):
+    rows = df.reindex(columns=columns).astype(object).itertuples(index=False, name=None)
+    return ([_to_sql_value(value) for value in row] for row in rows)
+
+
+def changes_from_editor(base_df, editor_state):
+    """Изменения st.data_editor в виде (deleted_keys, upserts).
+
+    base_df — таблица, переданная в редактор; editor_state — st.session_state[key] редактора
+    с edited_rows / added_rows / deleted_rows (номера строк — позиции в base_df).
+    Строка со сменённым ключом удаляется под старым ключом и записывается под новым.
+    """
+    base_df = base_df.reset_index(drop=True).reindex(columns=COLUMNS)
+    edited_rows = {int(pos): values for pos, values in editor_state.get("edited_rows", {}).items()}
+    deleted_positions = [int(pos) for pos in editor_state.get("deleted_rows", [])]
+    edited_positions = [pos for pos in sorted(edited_rows) if pos not in set(deleted_positions)]
+
+    original = base_df.iloc[edited_positions]
+    updated = original.copy()
+    for pos, values in edited_rows.items():
+        for column, value in values.items():
+            if pos in updated.index and column in COLUMNS:
+                updated.at[pos, column] = value
+
+    # Сравнение ключей целиком по столбцам, без построчных кортежей
+    key_changed = (updated[KEY_COLUMNS].fillna("") != original[KEY_COLUMNS].fillna("")).any(axis=1)
+    deleted_keys = pd.concat([
+        base_df.iloc[deleted_positions][KEY_COLUMNS],
+        original.loc[key_changed, KEY_COLUMNS],
+    ], ignore_index=True)
+
+    added = pd.DataFrame(editor_state.get("added_rows", []), columns=COLUMNS)
+    added = added.dropna(how="all")
+    upserts = pd.concat([updated, added], ignore_index=True)
+    return deleted_keys, upserts
+
+
+class QuestionStore:
+
+    def __init__(self, path=STORE_PATH, xlsx_path=XLSX_PATH):
+        self.path = path
+        self.xlsx_path = xlsx_path
+        self._lock = threading.Lock()
+        self._version = None
+        self._df = pd.DataFrame(columns=COLUMNS)
+        self._by_lecture = {}
+        self._lectures = {}
+        self._export_pending = False
+        self._export_thread = None
+        # Ошибка последней выгрузки в xlsx (None — выгрузка удалась или ещё не выполнялась)
+        self.export_error = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Answer без объявленного типа: числовые эталоны из xlsx остаются числами
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS questions (
+                Discipline TEXT,
+                Lecture_ID TEXT,
+                Question_ID TEXT,
+                Question TEXT,
+                Answer,
+                PRIMARY KEY (Discipline, Lecture_ID, Question_ID)
+            )
+        """)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS discipline_versions (
+                Discipline TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0')")
+
+    def _meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _bump_version(self):
+        self._conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+
+    def _bump_disciplines(self, disciplines):
+        self._conn.executemany(
+            "INSERT INTO discipline_versions (Discipline, version) VALUES (?, 1) "
+            "ON CONFLICT (Discipline) DO UPDATE SET version = version + 1",
+            [(discipline,) for discipline in disciplines]
+        )
+
+    def _upsert_rows(self, df):
+        # Повтор ключа обновляет строку, а не добавляет дубликат; rowid (порядок в xlsx) сохраняется
+        self._conn.executemany(
+            f"INSERT INTO questions ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (Discipline, Lecture_ID, Question_ID) DO UPDATE SET "
+            "Question = excluded.Question, Answer = excluded.Answer",
+            _sql_rows(df, COLUMNS)
+        )
+
+    def _write_rows(self, df):
+        old_disciplines = [row[0] for row in self._conn.execute(
+            "SELECT DISTINCT Discipline FROM questions WHERE Discipline IS NOT NULL"
+        )]
+        self._conn.execute("DELETE FROM questions")
+        self._upsert_rows(df)
+        self._bump_disciplines(set(old_disciplines) | set(df["Discipline"].dropna()))
+
+    def _import_xlsx_if_newer(self):
+        if not os.path.exists(self.xlsx_path):
+            return
+        mtime = os.path.getmtime(self.xlsx_path)
+        if mtime <= float(self._meta("xlsx_mtime", 0)):
+            return
+        df = pd.read_excel(self.xlsx_path)
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Другой процесс мог импортировать тот же файл, пока мы читали xlsx
+            if mtime > float(self._meta("xlsx_mtime", 0)):
+                self._write_rows(df)
+                self._set_meta("xlsx_mtime", mtime)
+                self._bump_version()
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _refresh(self):
+        self._import_xlsx_if_newer()
+        version = self._meta("version")
+        if version == self._version:
+            return
+        df = self._read_all()
+        by_lecture = {
+            key: group.sort_values("Question_ID")
+            for key, group in df.groupby(["Discipline", "Lecture_ID"], sort=False)
+        }
+        lectures = {}
+        for discipline, lecture_id in by_lecture:
+            lectures.setdefault(discipline, []).append(lecture_id)
+        self._df, self._by_lecture, self._lectures = df, by_lecture, lectures
+        self._version = version
+
+    def version(self):
+        with self._lock:
+            self._refresh()
+            return self._version
+
+    def all(self):
+        """Вся база. Возвращается общая для процесса таблица — её нельзя изменять на месте."""
+        with self._lock:
+            self._refresh()
+            return self._df
+
+    def disciplines(self):
+        with self._lock:
+            self._refresh()
+            return list(self._lectures)
+
+    def lectures(self, discipline=None):
+        with self._lock:
+            self._refresh()
+            if discipline is None:
+                return list(self._df["Lecture_ID"].dropna().unique())
+            return list(self._lectures.get(discipline, []))
+
+    def questions(self, discipline, lecture_id):
+        """Вопросы одной лекции, отсортированные по Question_ID."""
+        with self._lock:
+            self._refresh()
+            group = self._by_lecture.get((discipline, lecture_id))
+            return group if group is not None else self._df.iloc[0:0]
+
+    def discipline_versions(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT Discipline, version FROM discipline_versions").fetchall())
+
+    def filter(self, discipline=None, lecture_ids=None):
+        """Копия строк для редактора: дисциплина и/или список лекций (None — без фильтра)."""
+        with self._lock:
+            self._refresh()
+            if discipline is not None and lecture_ids:
+                keys = [(discipline, lecture_id) for lecture_id in lecture_ids]
+                parts = [self._by_lecture[key] for key in keys if key in self._by_lecture]
+                return pd.concat(parts).sort_index() if parts else self._df.iloc[0:0].copy()
+            mask = pd.Series(True, index=self._df.index)
+            if discipline is not None:
+                mask &= self._df["Discipline"] == discipline
+            if lecture_ids:
+                mask &= self._df["Lecture_ID"].isin(lecture_ids)
+            return self._df[mask].copy()
+
+    def apply_changes(self, deleted_keys, upserts, expected_versions):
+        """Удаляет и записывает только изменённые строки одной транзакцией.
+
+        expected_versions — discipline_versions(), прочитанные при открытии редактора;
+        если затронутая дисциплина с тех пор изменилась, ничего не пишется и
+        выбрасывается QuestionConflict.
+        """
+        touched = set(deleted_keys["Discipline"].dropna()) | set(upserts["Discipline"].dropna())
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = dict(self._conn.execute("SELECT Discipline, version FROM discipline_versions").fetchall())
+                stale = sorted(
+                    (discipline for discipline in touched
+                     if current.get(discipline, 0) != expected_versions.get(discipline, 0))
+                )
+                if stale:
+                    raise QuestionConflict(stale)
+                self._conn.executemany(
+                    "DELETE FROM questions WHERE Discipline IS ? AND Lecture_ID IS ? AND Question_ID IS ?",
+                    _sql_rows(deleted_keys, KEY_COLUMNS)
+                )
+                self._upsert_rows(upserts)
+                self._bump_disciplines(touched)
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._schedule_export()
+
+    def replace_all(self, df):
+        """Заменяет всю базу и выгружает её в xlsx."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._write_rows(df)
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._schedule_export()
+
+    def _schedule_export(self):
+        # Вызывается под self._lock. Несколько сохранений подряд дают одну-две выгрузки
+        self._export_pending = True
+        if self._export_thread is None:
+            self._export_thread = threading.Thread(target=self._export_worker, daemon=True)
+            self._export_thread.start()
+
+    def _export_worker(self):
+        try:
+            while True:
+                with self._lock:
+                    if not self._export_pending:
+                        self._export_thread = None
+                        return
+                    self._export_pending = False
+                    df = self._read_all()
+                tmp_path = f"{self.xlsx_path}.tmp.xlsx"
+                try:
+                    df.to_excel(tmp_path, index=False)
+                    with self._lock:
+                        # Замена файла и отметка о нём под одной блокировкой: иначе _refresh
+                        # принял бы собственную выгрузку за новый xlsx и импортировал её
+                        os.replace(tmp_path, self.xlsx_path)
+                        self._set_meta("xlsx_mtime", os.path.getmtime(self.xlsx_path))
+                    self.export_error = None
+                except Exception as e:
+                    # xlsx открыт в Excel, закончилось место на диске и т.п.: база в SQLite уже
+                    # сохранена, выгрузка повторится при следующем сохранении
+                    self.export_error = f"{type(e).__name__}: {e}"
+                    if os.path.exists(tmp_path):
+                        try:
+                            os.remove(tmp_path)
+                        except OSError:
+                            pass
+        finally:
+            # Поток, упавший вне выгрузки, не должен навсегда заблокировать запуск следующего
+            with self._lock:
+                if self._export_thread is threading.current_thread():
+                    self._export_thread = None
+
+    def wait_for_export(self, timeout=None):
+        thread = self._export_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _read_all(self):
+        return pd.read_sql_query(f"SELECT {', '.join(COLUMNS)} FROM questions ORDER BY rowid", self._conn)
+
+    def export_xlsx(self, path):
+        """Выгрузка всей базы в произвольный xlsx."""
+        with self._lock:
+            df = self._read_all()
+        df.to_excel(path, index=False)
+
+    def import_xlsx(self, source):
+        """Заменяет базу содержимым другого xlsx (путь или загруженный файл) и выгружает её в основной xlsx."""
+        self.replace_all(pd.read_excel(source))
@@ -0,0 +1,234 @@
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zipfile
+from datetime import datetime
+import pandas as pd
+
+# Хранилище результатов проверки. Каждый прогон — строка в runs (дисциплина, лекция,
+# время, статистика) с подробным логом в виде Parquet-блока; итоговые баллы студентов
+# лежат в отдельной таблице с индексами по прогону и по ID студента. Разделы 2 и 3
+# получают прогоны запросами, без обхода папки temp, а ZIP для скачивания собирается
+# из буферов в памяти.
+
+RESULTS_PATH = "data/results.sqlite"
+LEGACY_DIR = "temp"
+SCORE_COLUMN = "Оценка (из 10)"
+RUN_COLUMNS = ["run_id", "discipline", "lecture_id", "created_at", "students", "answers"]
+LEGACY_PATTERN = re.compile(r"results_(.*?)_(Lec\d+)_(\d{8}_\d{6})\.csv$")
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_results_store(path=RESULTS_PATH):
+    """Одно хранилище на процесс для каждого файла."""
+    with _stores_lock:
+        key = os.path.abspath(path)
+        if key not in _stores:
+            _stores[key] = ResultsStore(path)
+        return _stores[key]
+
+
+def safe_name(value):
+    return re.sub(r'\W+', '_', str(value))
+
+
+class ResultsStore:
+
+    def __init__(self, path=RESULTS_PATH, legacy_dir=LEGACY_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._saved = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                discipline TEXT NOT NULL,
+                lecture_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                students INTEGER NOT NULL,
+                answers INTEGER NOT NULL,
+                stats TEXT,
+                log BLOB
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_lecture ON runs(discipline, lecture_id, created_at)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS scores (
+                run_id TEXT NOT NULL,
+                student_pos INTEGER NOT NULL,
+                student_id TEXT NOT NULL,
+                score REAL,
+                PRIMARY KEY (run_id, student_pos)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scores_student ON scores(student_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        self._import_legacy_files(legacy_dir)
+
+    def save_run(self, run_id, discipline, lecture_id, results_df, log_df, stats=None, created_at=None):
+        """Сохраняет прогон целиком; повторное сохранение того же run_id заменяет его."""
+        log_buffer = io.BytesIO()
+        log_df.to_parquet(log_buffer, index=False)
+        scores = [
+            (run_id, student_pos, str(student_id), None if pd.isna(score) else float(score))
+            for student_pos, (student_id, score) in enumerate(
+                zip(results_df.iloc[:, 0], results_df.iloc[:, 1]))
+        ]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM scores WHERE run_id = ?", (run_id,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO runs (run_id, discipline, lecture_id, created_at, students, answers, "
+                    "stats, log) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, discipline, lecture_id, created_at or time.time(), len(results_df), len(log_df),
+                     json.dumps(stats, ensure_ascii=False, default=str) if stats is not None else None,
+                     log_buffer.getvalue())
+                )
+                self._conn.executemany(
+                    "INSERT INTO scores (run_id, student_pos, student_id, score) VALUES (?, ?, ?, ?)", scores
+                )
+            self._saved += 1
+        return run_id
+
+    def version(self):
+        """Меняется при каждом сохранении прогона, в том числе из другого процесса (консольная проверка)."""
+        with self._lock:
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            return self._saved, data_version
+
+    def list_runs(self, discipline=None, lecture_id=None):
+        """Прогоны (новые первыми) без логов."""
+        conditions, params = [], []
+        if discipline is not None:
+            conditions.append("discipline = ?")
+            params.append(discipline)
+        if lecture_id is not None:
+            conditions.append("lecture_id = ?")
+            params.append(lecture_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(RUN_COLUMNS)} FROM runs {where} ORDER BY created_at DESC", params
+            ).fetchall()
+        return pd.DataFrame(rows, columns=RUN_COLUMNS)
+
+    def latest_runs(self):
+        """Последний прогон для каждой пары (дисциплина, лекция)."""
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT {', '.join(RUN_COLUMNS)} FROM runs AS r
+                WHERE created_at = (
+                    SELECT MAX(created_at) FROM runs
+                    WHERE discipline = r.discipline AND lecture_id = r.lecture_id
+                )
+                ORDER BY discipline, lecture_id
+            """).fetchall()
+        return pd.DataFrame(rows, columns=RUN_COLUMNS)
+
+    def get_run(self, run_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(RUN_COLUMNS)}, stats FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        run = dict(zip(RUN_COLUMNS + ["stats"], row))
+        run["stats"] = json.loads(run["stats"]) if run["stats"] else {}
+        return run
+
+    def run_results(self, run_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT student_id, score FROM scores WHERE run_id = ? ORDER BY student_pos", (run_id,)
+            ).fetchall()
+        results_df = pd.DataFrame(rows, columns=["ID студента", SCORE_COLUMN])
+        # Баллы — целые; REAL в базе нужен только для пустых значений
+        if results_df[SCORE_COLUMN].notna().all():
+            results_df[SCORE_COLUMN] = results_df[SCORE_COLUMN].astype(int)
+        return results_df
+
+    def run_log(self, run_id):
+        with self._lock:
+            row = self._conn.execute("SELECT log FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None or row[0] is None:
+            return pd.DataFrame()
+        return pd.read_parquet(io.BytesIO(row[0]))
+
+    def student_scores(self, student_id):
+        """Все баллы студента по прогонам."""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT r.discipline, r.lecture_id, r.run_id, r.created_at, s.score
+                FROM scores AS s JOIN runs AS r ON r.run_id = s.run_id
+                WHERE s.student_id = ?
+                ORDER BY r.created_at
+            """, (str(student_id),)).fetchall()
+        return pd.DataFrame(rows, columns=["discipline", "lecture_id", "run_id", "created_at", SCORE_COLUMN])
+
+    def run_basename(self, run):
+        timestamp = datetime.fromtimestamp(run["created_at"]).strftime("%Y%m%d_%H%M%S")
+        return f"{safe_name(run['discipline'])}_{safe_name(run['lecture_id'])}_{timestamp}"
+
+    def run_files(self, run_id):
+        """CSV-файлы прогона в памяти: {имя файла: bytes}, имена как у прежних файлов в temp."""
+        run = self.get_run(run_id)
+        if run is None:
+            return {}
+        basename = self.run_basename(run)
+        return {
+            f"results_{basename}.csv": self.run_results(run_id).to_csv(index=False).encode("utf-8"),
+            f"log_{basename}.csv": self.run_log(run_id).to_csv(index=False).encode("utf-8"),
+        }
+
+    def run_zip(self, run_id):
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for name, data in self.run_files(run_id).items():
+                zipf.writestr(name, data)
+        return zip_buffer.getvalue()
+
+    def export_csv(self, run_id, directory):
+        """Записывает CSV прогона в папку (для консольного запуска). Возвращает пути."""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name, data in self.run_files(run_id).items():
+            path = os.path.join(directory, name)
+            with open(path, "wb") as f:
+                f.write(data)
+            paths.append(path)
+        return paths
+
+    def _import_legacy_files(self, legacy_dir):
+        # Результаты, сохранённые до появления хранилища как temp/results_*.csv и temp/log_*.csv,
+        # переносятся один раз
+        with self._lock:
+            imported = self._conn.execute("SELECT value FROM meta WHERE key = 'legacy_imported'").fetchone()
+        if imported or not os.path.isdir(legacy_dir):
+            return
+        for filename in sorted(os.listdir(legacy_dir)):
+            match = LEGACY_PATTERN.match(filename)
+            if not match:
+                continue
+            discipline = match.group(1).replace("_", " ").strip()
+            lecture_id, timestamp = match.group(2), match.group(3)
+            results_df = pd.read_csv(os.path.join(legacy_dir, filename), dtype={0: str})
+            log_path = os.path.join(legacy_dir, filename.replace("results_", "log_", 1))
+            log_df = pd.read_csv(log_path) if os.path.exists(log_path) else pd.DataFrame()
+            created_at = datetime.strptime(timestamp, "%Y%m%d_%H%M%S").timestamp()
+            self.save_run(f"file-{filename[len('results_'):-len('.csv')]}", discipline, lecture_id,
+                          results_df, log_df, created_at=created_at)
+        with self._lock:
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_imported', '1')")
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import time
+
+# Журнал прогона проверки: каждая готовая оценка (студент, вопрос) сразу дописывается
+# в temp/runs/<run_id>.jsonl. Прерванный прогон с тем же run_id продолжается
+# с места остановки, уже проверенные ответы повторно в LLM не отправляются.
+# Ответы с пометкой failed (запрос к LLM не удался) при повторном запуске проверяются снова.
+
+RUNS_DIR = "temp/runs"
+RECORD_FIELDS = ("score", "reply", "tier", "cluster", "failed")
+
+
+def make_run_id(discipline, lecture_id, csv_bytes):
+    digest = hashlib.sha256()
+    for part in (str(discipline), str(lecture_id)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x1f")
+    digest.update(csv_bytes)
+    return digest.hexdigest()[:16]
+
+
+class RunJournal:
+
+    def __init__(self, run_id, runs_dir=RUNS_DIR):
+        self.run_id = run_id
+        self.path = os.path.join(runs_dir, f"{run_id}.jsonl")
+        os.makedirs(runs_dir, exist_ok=True)
+        self.meta = {}
+        self.records = {}
+        self.finished = False
+        self._load()
+        self._file = None
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Последняя строка могла оборваться при аварийном завершении
+                    continue
+                kind = entry.pop("type", "result")
+                if kind == "meta":
+                    self.meta = entry
+                elif kind == "finished":
+                    self.finished = True
+                else:
+                    self.records[(entry["student_pos"], entry["question_num"])] = entry
+
+    def _append(self, entry):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def start(self, **meta):
+        if not self.meta:
+            self.meta = dict(meta, created_at=time.time())
+            self._append(dict(self.meta, type="meta"))
+
+    def restore(self, tasks):
+        """Проставляет задачам оценки из журнала и возвращает список ещё не проверенных задач.
+
+        Ответы, запрос по которым не удался (failed), считаются непроверенными.
+        """
+        remaining = []
+        for task in tasks:
+            record = self.records.get((task["student_pos"], task["question_num"]))
+            if record is None or record.get("student_id") != task["student_id"] or record.get("failed"):
+                remaining.append(task)
+                continue
+            for field in RECORD_FIELDS:
+                if record.get(field) is not None:
+                    task[field] = record[field]
+        return remaining
+
+    def failed_count(self):
+        return sum(1 for record in self.records.values() if record.get("failed"))
+
+    def append(self, task):
+        entry = {
+            "student_pos": task["student_pos"],
+            "question_num": task["question_num"],
+            "student_id": task["student_id"],
+        }
+        entry.update({field: task.get(field) for field in RECORD_FIELDS})
+        self.records[(task["student_pos"], task["question_num"])] = entry
+        self._append(entry)
+
+    def mark_finished(self):
+        self.finished = True
+        self._append({"type": "finished", "finished_at": time.time()})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.meta = {}
+        self.records = {}
+        self.finished = False
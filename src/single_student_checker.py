@@ -1,117 +1,182 @@
-import pandas as pd
-import ollama
+import argparse
+import asyncio
+import os
+import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-# === НАСТРОЙКИ ===
-ETHALON_PATH = "data/ethalons.xlsx"
-CSV_PATH = "14411311_202505092007363998.csv"
-DISCIPLINE = "Строительное оборудование"
-LECTURE_ID = "Lec01"
-ID_COLUMN_NAME = "13.**Укажите Ваш ID:**"
-LLM_MODEL = "mistral"  # Запусти ollama run mistral
-
-# === 1. Загрузка эталонов ===
-ethalons_df = pd.read_excel(ETHALON_PATH)
-ethalons = ethalons_df[
-    (ethalons_df["Discipline"] == DISCIPLINE) &
-    (ethalons_df["Lecture_ID"] == LECTURE_ID)
-].sort_values("Question_ID")
-
-ethalon_questions = ethalons["Question"].astype(str).tolist()
-ethalon_answers = ethalons["Answer"].astype(str).tolist()
-num_questions = len(ethalon_answers)
-
-# === 2. Загрузка CSV ===
-csv_df = pd.read_csv(CSV_PATH, encoding="utf-8", engine="python")
-
-# === 3. Определяем начало вопросов ===
-question_start_index = None
-for i, col in enumerate(csv_df.columns):
-    if "Как называется" in col or col.strip().startswith("1."):
-        question_start_index = i
-        break
-if question_start_index is None:
-    raise ValueError("❌ Не удалось найти начало вопросов в CSV!")
-
-# === 4. Функция оценки через LLM ===
-# === Функция оценки через LLM ===
-def grade_with_llm(question, reference_answer, student_answer):
-    if not student_answer.strip():
-        return 0, "Пустой ответ"
-
-    prompt = f"""
-Ты — преподаватель. Проверь, насколько ответ студента совпадает с эталонным по смыслу.
-
-Вопрос: {question}
-Эталонный ответ: {reference_answer}
-Ответ студента: {student_answer}
-
-Оцени по шкале:
-- 0 — не по теме
-- 1 — частично верно
-- 2 — полностью верно
-
-Ответь только числом: 0, 1 или 2.
-"""
+import pandas as pd
+from adaptive_limiter import AdaptiveLimiter
+from ollama_pool import OllamaPool
+from grading_cache import GradingCache
+from grading_pipeline import LLM_MODEL, MAX_WORKERS, BATCH_SIZE
+from grading_service import grade_csv_async, save_results
+from results_store import get_results_store
+from run_journal import make_run_id
+from prescoring import TIER_FAILED
+
+# Консольная проверка без Streamlit: много CSV-выгрузок wj.qq за один запуск.
+#
+#   python single_student_checker.py answers.csv --discipline "Строительное оборудование" --lecture Lec01
+#   python single_student_checker.py exports/                 # берёт exports/manifest.csv
+#   python single_student_checker.py --manifest semester.csv
+#
+# Манифест — CSV с колонками file, Discipline, Lecture_ID (пути к файлам относительно манифеста).
+# Результаты попадают в хранилище результатов (data/results.sqlite), как и при проверке из раздела 2,
+# и видны в разделе 3; --export-dir дополнительно сохраняет их в CSV.
+# Несколько серверов Ollama задаются через OLLAMA_HOSTS (см. ollama_pool.py).
+
+MANIFEST_NAME = "manifest.csv"
+
+
+def read_manifest(manifest_path):
+    manifest_df = pd.read_csv(manifest_path, dtype=str)
+    missing = {"file", "Discipline", "Lecture_ID"} - set(manifest_df.columns)
+    if missing:
+        raise ValueError(f"В манифесте {manifest_path} нет колонок: {', '.join(sorted(missing))}")
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    return [
+        (os.path.join(base_dir, row["file"]), row["Discipline"].strip(), row["Lecture_ID"].strip())
+        for _, row in manifest_df.iterrows()
+    ]
+
+
+def collect_jobs(args):
+    jobs = []
+    if args.manifest:
+        jobs.extend(read_manifest(args.manifest))
+    for path in args.paths:
+        if os.path.isdir(path):
+            manifest_path = os.path.join(path, MANIFEST_NAME)
+            if os.path.exists(manifest_path):
+                jobs.extend(read_manifest(manifest_path))
+            elif args.discipline and args.lecture:
+                jobs.extend(
+                    (os.path.join(path, name), args.discipline, args.lecture)
+                    for name in sorted(os.listdir(path)) if name.lower().endswith(".csv")
+                )
+            else:
+                raise ValueError(f"В папке {path} нет {MANIFEST_NAME}, а --discipline/--lecture не заданы")
+        elif args.discipline and args.lecture:
+            jobs.append((path, args.discipline, args.lecture))
+        else:
+            raise ValueError(f"Для файла {path} нужно указать --discipline и --lecture или манифест")
+    return jobs
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная проверка ответов студентов через LLM")
+    parser.add_argument("paths", nargs="*", help="CSV-файлы или папки с выгрузками wj.qq")
+    parser.add_argument("--manifest", help="CSV с колонками file, Discipline, Lecture_ID")
+    parser.add_argument("--discipline", help="Дисциплина для файлов без манифеста")
+    parser.add_argument("--lecture", help="Lecture_ID для файлов без манифеста")
+    parser.add_argument("--model", default=LLM_MODEL)
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS,
+                        help="Максимум одновременных запросов к LLM")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Ответов в одном запросе к LLM (1 — без пакетов)")
+    parser.add_argument("--restart", action="store_true",
+                        help="Не продолжать прерванные прогоны, а проверять заново")
+    parser.add_argument("--export-dir",
+                        help="Дополнительно сохранить results_*.csv и log_*.csv в эту папку")
+    args = parser.parse_args(argv)
+    if not args.paths and not args.manifest:
+        parser.error("укажите CSV-файлы, папку или --manifest")
+    return args
+
+
+async def grade_all(jobs, args, cache):
+    # Все файлы проверяются одновременно через общий адаптивный лимит и общий клиент Ollama,
+    # поэтому хвост одного файла не оставляет модель без работы. Записи манифеста с одним
+    # прогоном (та же дисциплина, лекция и содержимое файла) пишут в один журнал прогона,
+    # поэтому выполняются друг за другом
+    limiter = AdaptiveLimiter(max_limit=args.max_workers)
+    client = OllamaPool()
+    progress = {}
+    last_print = {"at": 0.0}
+
+    def print_progress():
+        now = time.monotonic()
+        if now - last_print["at"] < 1.0:
+            return
+        last_print["at"] = now
+        done = sum(d for d, _ in progress.values())
+        total = sum(t for _, t in progress.values())
+        print(f"\r   Проверено {done} из {total} ответов", end="", flush=True)
+
+    def run_key(csv_path, discipline, lecture_id):
+        try:
+            with open(csv_path, "rb") as f:
+                return make_run_id(discipline, lecture_id, f.read())
+        except OSError:
+            # Ошибку чтения сообщит grade_one
+            return csv_path
+
+    async def grade_one(number, csv_path, discipline, lecture_id, restart):
+        name = f"[{number}/{len(jobs)}] {os.path.basename(csv_path)} ({discipline}, {lecture_id})"
+
+        def on_progress(done, total):
+            progress[number] = (done, total)
+            print_progress()
+
+        try:
+            with open(csv_path, "rb") as f:
+                csv_bytes = f.read()
+            results_df, log_df, stats = await grade_csv_async(
+                csv_bytes, discipline, lecture_id, cache=cache, model=args.model, limiter=limiter,
+                client=client, batch_size=args.batch_size, restart=restart, on_progress=on_progress
+            )
+        except Exception as e:
+            print(f"\n❌ {name}: {e}", file=sys.stderr)
+            return False
+
+        run_id = save_results(results_df, log_df, discipline, lecture_id, stats["run_id"], stats=stats)
+        tiers_summary = ", ".join(f"{tier} — {count}" for tier, count in stats["tiers"].items())
+        print(f"\n✅ {name}: {tiers_summary}\n   прогон {run_id}")
+        if stats["tiers"].get(TIER_FAILED):
+            print(f"   ⚠️ без оценки из-за ошибок LLM: {stats['tiers'][TIER_FAILED]}; "
+                  f"повторный запуск без --restart проверит только их")
+        if args.export_dir:
+            for path in get_results_store().export_csv(run_id, args.export_dir):
+                print(f"   {path}")
+        return True
+
+    async def grade_group(group):
+        # --restart сбрасывает журнал только перед первой записью группы: следующие продолжают его
+        return [
+            (number, await grade_one(number, *job, restart=args.restart and position == 0))
+            for position, (number, job) in enumerate(group)
+        ]
+
+    groups = {}
+    for number, job in enumerate(jobs, 1):
+        groups.setdefault(run_key(*job), []).append((number, job))
+    try:
+        graded = await asyncio.gather(*(grade_group(group) for group in groups.values()))
+        results = [result for _, result in sorted(pair for group in graded for pair in group)]
+    finally:
+        await client.close()
+    return results, limiter.stats(), client.stats()
+
 
+def main(argv=None):
+    args = parse_args(argv)
     try:
-        response = ollama.chat(model=LLM_MODEL, messages=[
-            {"role": "user", "content": prompt}
-        ])
-        reply = response["message"]["content"].strip()
-        score = int([s for s in reply.split() if s.isdigit()][0])
-        return min(max(score, 0), 2), reply
-    except Exception as e:
-        return 0, f"Ошибка: {e}"
-
-# === Параллельная проверка вопросов студента ===
-def grade_student(student_id, questions, reference_answers, student_answers):
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-
-    results = []
-    total_score = 0
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_question = {
-            executor.submit(grade_with_llm, q, r, a): (i, q, r, a)
-            for i, (q, r, a) in enumerate(zip(questions, reference_answers, student_answers), 1)
-        }
-
-        for future in as_completed(future_to_question):
-            i, question, correct_ans, student_ans = future_to_question[future]
-            score, feedback = future.result()
-            total_score += score
-
-            print(f"\nВопрос {i}: {question}")
-            print(f"🔹 Эталон:  {correct_ans}")
-            print(f"🔸 Ответ:   {student_ans}")
-            print(f"📣 Ответ LLM: {feedback}")
-            print(f"✅ Балл: {score}/2")
-            print("-" * 60)
-
-            results.append((i, score))
-
-    return student_id, total_score, results
-
-# === 5. Проверка студентов с логом ===
-results = []
-for idx, row in csv_df.iterrows():
-    student_id = str(row[ID_COLUMN_NAME]).strip()
-    student_answers_raw = row.values[question_start_index:question_start_index + num_questions]
-    student_answers = [str(ans).strip() if pd.notna(ans) else "" for ans in student_answers_raw]
-
-    print(f"\n🔹 Проверка для студента {student_id}:")
-    student_id, total_score, student_results = grade_student(
-        student_id, ethalon_questions, ethalon_answers, student_answers
-    )
-
-    results.append({
-        "ID студента": student_id,
-        f"Оценка (из 10)": total_score
-    })
-
-# === 6. Вывод итогов
-results_df = pd.DataFrame(results)
-print("\n📊 Итоговая таблица:")
-print(results_df)
\ No newline at end of file
+        jobs = collect_jobs(args)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    started = time.monotonic()
+    results, concurrency, endpoints = asyncio.run(grade_all(jobs, args, GradingCache()))
+    failed = results.count(False)
+
+    print(f"\n📊 Готово: {len(jobs) - failed} из {len(jobs)} файлов за {time.monotonic() - started:.1f} с")
+    print(f"   Запросов к LLM: {concurrency['completed'] + concurrency['errors']}, "
+          f"подобранный лимит одновременных запросов: {concurrency['final_limit']}")
+    for endpoint in endpoints:
+        print(f"   {endpoint['host']}: {endpoint['completed']} ответов, ошибок {endpoint['errors']}, "
+              f"{endpoint['throughput']:.2f} запр./с, средняя задержка {endpoint['avg_latency']:.2f} с")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())